@@ -0,0 +1,138 @@
+"""
+bench_llm_clients.py
+
+Latency of LLM chat completions with a new SDK client per call (what
+extract_relationships_llm used to do for every document) versus the shared,
+pooled client from LLMClientFactory. By default it starts an in-process
+OpenAI-compatible stub server (HTTP/1.1 keep-alive, fixed --server-ms
+delay); point --base-url at a real endpoint (LM Studio, an HTTPS gateway)
+to include TLS handshakes.
+
+Usage:
+    python benchmarks/bench_llm_clients.py --calls 200 --server-ms 5
+"""
+
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from openai import OpenAI
+
+from KG_pipeline.llm_clients import LLMClientConfig, LLMClientFactory
+
+COMPLETION = {
+    "id": "chatcmpl-stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "stub",
+    "choices": [{"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": "[]"}}],
+    "usage": {"prompt_tokens": 50, "completion_tokens": 1, "total_tokens": 51},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like a real API front end
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    delay = 0.0
+    connections = set()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StubHandler.connections.add(self.client_address)
+        time.sleep(self.delay)
+        body = json.dumps(COMPLETION).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(delay):
+    StubHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def call(client, model):
+    client.chat.completions.create(model=model, messages=[{"role": "user", "content": "ping"}], max_tokens=8)
+
+
+def run_cold(base_url, api_key, model, calls, config):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        http = httpx.Client(timeout=config.timeout())
+        client = OpenAI(base_url=base_url, api_key=api_key, http_client=http, max_retries=0)
+        call(client, model)
+        http.close()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_warm(base_url, api_key, model, calls, config):
+    factory = LLMClientFactory(config)
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call(factory.openai(base_url=base_url, api_key=api_key), model)
+        latencies.append(time.perf_counter() - start)
+    factory.close()
+    return latencies
+
+
+def summarize(label, latencies):
+    ms = sorted(x * 1000 for x in latencies)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    print(f"{label:<6} first {latencies[0] * 1000:7.2f} ms   mean {statistics.mean(ms):7.2f} ms   "
+          f"p50 {statistics.median(ms):7.2f} ms   p95 {p95:7.2f} ms")
+    return statistics.mean(ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold vs warm (pooled) LLM client latency")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint; omit to use the local stub")
+    parser.add_argument("--api-key", default="stub")
+    parser.add_argument("--model", default="stub")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--server-ms", type=float, default=5.0, help="Stub server processing time per call")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = start_stub_server(args.server_ms / 1000)
+    config = LLMClientConfig()
+
+    try:
+        StubHandler.connections.clear()
+        cold = run_cold(base_url, args.api_key, args.model, args.calls, config)
+        cold_connections = len(StubHandler.connections)
+        StubHandler.connections.clear()
+        warm = run_warm(base_url, args.api_key, args.model, args.calls, config)
+        warm_connections = len(StubHandler.connections)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    print(f"Target: {args.base_url or 'local stub at ' + base_url}; {args.calls} calls each")
+    cold_mean = summarize("cold", cold)
+    warm_mean = summarize("warm", warm)
+    if server is not None:
+        print(f"TCP connections opened: cold {cold_connections}, warm {warm_connections}")
+    print(f"Warm speedup (mean): {cold_mean / warm_mean:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+bench_mitre_index.py
+
+Compares the original linear-scan MITRE lookup with MitreIndex over a realistic
+entity list. Uses the STIX bundle given by --bundle, or a synthetic bundle the
+size of Enterprise ATT&CK when none is given.
+
+Usage:
+    python benchmarks/bench_mitre_index.py --bundle enterprise-attack.json --entities 2000
+"""
+
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import argparse
+import json
+import random
+import time
+
+from KG_pipeline.mitre_stix_integrator import MitreIndex
+from KG_pipeline.schemas import ThreatEntity, EntityType
+
+
+def legacy_find_mitre_info(name, mitre_data):
+    """The linear scan previously used by find_mitre_info."""
+    name_upper = name.upper()
+    for obj in mitre_data["objects"]:
+        ext_refs = obj.get("external_references", [])
+        mitre_id = None
+        for ref in ext_refs:
+            if ref.get("source_name") == "mitre-attack":
+                mitre_id = ref.get("external_id")
+                break
+        if (mitre_id and mitre_id.upper() == name_upper) or obj.get("name", "").upper() == name_upper:
+            return {"mitre_id": mitre_id or "", "name": obj.get("name", "")}
+    return None
+
+
+def synthetic_bundle(n_objects):
+    objects = []
+    for i in range(n_objects):
+        tid = f"T{1000 + i // 5}" + (f".{i % 5:03d}" if i % 5 else "")
+        objects.append({
+            "type": "attack-pattern",
+            "name": f"Technique {i} Example",
+            "description": "x" * 400,
+            "external_references": [
+                {"source_name": "mitre-attack", "external_id": tid, "url": f"https://attack.mitre.org/techniques/{tid}"},
+                {"source_name": "capec", "external_id": f"CAPEC-{i}"},
+            ],
+        })
+    return {"type": "bundle", "objects": objects}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linear MITRE lookup vs MitreIndex")
+    parser.add_argument("--bundle", default=None, help="Path to a STIX bundle JSON file")
+    parser.add_argument("--objects", type=int, default=15000, help="Synthetic bundle size when --bundle is not given")
+    parser.add_argument("--entities", type=int, default=2000)
+    parser.add_argument("--hit-rate", type=float, default=0.3, help="Fraction of entities that exist in the bundle")
+    args = parser.parse_args()
+
+    if args.bundle:
+        with open(args.bundle, "r", encoding="utf-8") as f:
+            mitre_data = json.load(f)
+    else:
+        mitre_data = synthetic_bundle(args.objects)
+
+    rng = random.Random(42)
+    known = [o["name"] for o in mitre_data["objects"] if o.get("name")]
+    names = [rng.choice(known) if rng.random() < args.hit_rate else f"unknown entity {i}" for i in range(args.entities)]
+
+    start = time.perf_counter()
+    legacy_hits = sum(1 for n in names if legacy_find_mitre_info(n, mitre_data))
+    legacy_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = MitreIndex(mitre_data)
+    build_elapsed = time.perf_counter() - start
+
+    entities = [ThreatEntity(name=n, type=EntityType.TTP) for n in names]
+    start = time.perf_counter()
+    index.enrich(entities)
+    index_elapsed = time.perf_counter() - start
+    index_hits = sum(1 for e in entities if e.mitre_id)
+
+    print(f"STIX objects: {len(mitre_data['objects'])}, entities: {len(names)}")
+    print(f"Linear scan:  {legacy_elapsed:.3f}s ({len(names) / legacy_elapsed:,.0f} lookups/sec), {legacy_hits} hits")
+    print(f"Index build:  {build_elapsed:.3f}s (once per bundle)")
+    print(f"Index enrich: {index_elapsed:.4f}s ({len(names) / index_elapsed:,.0f} lookups/sec), {index_hits} hits")
+    print(f"Speedup (lookups only): {legacy_elapsed / index_elapsed:,.0f}x")
+
+
+if __name__ == "__main__":
+    main()
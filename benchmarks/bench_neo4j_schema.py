@@ -0,0 +1,91 @@
+"""
+bench_neo4j_schema.py
+
+PROFILE db hits of the entity and relationship upserts under the old schema
+(ThreatEntity(name) index plus a node index on the RELATION label) versus the
+schema managed by SchemaManager (ThreatEntity(name, entity_type) uniqueness
+constraint and a RELATION(type) relationship index). Needs a real Neo4j, e.g.
+docker run -p 7687:7687 -e NEO4J_AUTH=neo4j/testpassword neo4j:5
+The graph is seeded with synthetic data and cleared again at the end; the
+profiled upserts themselves are rolled back.
+
+Usage:
+    python benchmarks/bench_neo4j_schema.py --uri bolt://localhost:7687 --entities 20000 --relationships 20000
+"""
+
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import argparse
+import logging
+
+from KG_pipeline.neo4j_persistor import Neo4jPersistor
+from KG_pipeline.schemas import ThreatEntity, ThreatRelationship, EntityType, RelationshipType
+
+logging.basicConfig(level=logging.WARNING)
+
+LEGACY_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS FOR (e:ThreatEntity) ON (e.name)",
+    "CREATE INDEX IF NOT EXISTS FOR (r:RELATION) ON (r.type)",
+]
+
+
+def make_data(n_entities, n_relationships):
+    types = [EntityType.MALWARE, EntityType.TOOL, EntityType.THREAT_ACTOR, EntityType.TTP]
+    entities = [ThreatEntity(name=f"entity {i}", type=types[i % len(types)], confidence=0.9) for i in range(n_entities)]
+    relationships = []
+    for i in range(n_relationships):
+        source, target = entities[i % n_entities], entities[(i * 7 + 1) % n_entities]
+        relationships.append(ThreatRelationship(source_name=source.name, source_type=source.type,
+                                                target_name=target.name, target_type=target.type,
+                                                relationship_type=RelationshipType.USES, confidence=0.8))
+    return entities, relationships
+
+
+def report(label, profile):
+    for query, result in profile.items():
+        print(f"{label:<8} {query:<20} {result['db_hits']:>10,} db hits   {' <- '.join(result['operators'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PROFILE db hits of the upserts before/after the schema manager")
+    parser.add_argument("--uri", required=True)
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="testpassword")
+    parser.add_argument("--entities", type=int, default=20000)
+    parser.add_argument("--relationships", type=int, default=20000)
+    args = parser.parse_args()
+
+    db = Neo4jPersistor(uri=args.uri, user=args.user, password=args.password, run_id="bench")
+    entities, relationships = make_data(max(args.entities, 2), args.relationships)
+    # Upsert an existing entity and relationship: the common case during re-ingestion
+    probe_entity, probe_relation = entities[len(entities) // 2], relationships[len(relationships) // 2]
+
+    try:
+        db.clear_graph()
+        db.save_entities_bulk(entities)
+        db.save_relationships_bulk(relationships)
+
+        db.schema.drop()
+        with db.driver.session() as session:
+            for statement in LEGACY_SCHEMA:
+                session.run(statement).consume()
+            session.run("CALL db.awaitIndexes(300)").consume()
+        before = db.profile_upserts(probe_entity, probe_relation)
+
+        status = db.schema.ensure()
+        after = db.profile_upserts(probe_entity, probe_relation)
+        db.clear_graph()
+    finally:
+        db.close()
+
+    print(f"Graph: {len(entities)} entities, {len(relationships)} relationships")
+    print(f"Schema verified: {status}")
+    report("before", before)
+    report("after", after)
+    for query in before:
+        b, a = before[query]["db_hits"], after[query]["db_hits"]
+        print(f"{query}: {b:,} -> {a:,} db hits ({b / max(a, 1):.1f}x fewer)")
+
+
+if __name__ == "__main__":
+    main()
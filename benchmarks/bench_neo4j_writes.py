@@ -0,0 +1,160 @@
+"""
+bench_neo4j_writes.py
+
+Writes/sec of per-object Neo4jPersistor writes versus batched UNWIND writes.
+Runs against a real Neo4j when --uri is given (e.g. a local container:
+docker run -p 7687:7687 -e NEO4J_AUTH=neo4j/testpassword neo4j:5), otherwise
+against an in-process stand-in driver that charges a fixed round-trip latency
+per query plus a small per-row cost.
+
+Usage:
+    python benchmarks/bench_neo4j_writes.py --entities 2000 --relationships 2000 --batch-size 500
+"""
+
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import argparse
+import logging
+import time
+
+from KG_pipeline import neo4j_persistor
+from KG_pipeline.neo4j_persistor import Neo4jPersistor
+from KG_pipeline.schemas import ThreatEntity, ThreatRelationship, EntityType, RelationshipType
+
+logging.basicConfig(level=logging.WARNING)
+
+
+class StandInResult:
+    def consume(self):
+        return None
+
+    def __iter__(self):
+        return iter(())
+
+    def single(self):
+        return None
+
+
+class StandInSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, query, parameters=None, **kwargs):
+        rows = len((parameters or {}).get("rows", [None]))
+        time.sleep(self.driver.rtt + rows * self.driver.row_cost)
+        self.driver.round_trips += 1
+        return StandInResult()
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+    def begin_transaction(self, **kwargs):
+        return StandInTransaction(self)
+
+
+class StandInTransaction:
+    def __init__(self, session):
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def run(self, query, parameters=None, **kwargs):
+        return self.session.run(query, parameters, **kwargs)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class StandInDriver:
+    def __init__(self, rtt, row_cost):
+        self.rtt = rtt
+        self.row_cost = row_cost
+        self.round_trips = 0
+
+    def session(self, **kwargs):
+        return StandInSession(self)
+
+    def close(self):
+        pass
+
+
+def make_data(n_entities, n_relationships):
+    entities = [ThreatEntity(name=f"entity {i}", type=EntityType.MALWARE, confidence=0.9) for i in range(n_entities)]
+    relationships = [
+        ThreatRelationship(source_name=f"entity {i % max(n_entities, 1)}", source_type=EntityType.MALWARE,
+                           target_name=f"entity {(i * 7) % max(n_entities, 1)}", target_type=EntityType.MALWARE,
+                           relationship_type=RelationshipType.USES, confidence=0.8)
+        for i in range(n_relationships)
+    ]
+    return entities, relationships
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-object vs batched Neo4j writes")
+    parser.add_argument("--uri", default=None, help="Neo4j URI; omit to use the in-process stand-in")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="testpassword")
+    parser.add_argument("--entities", type=int, default=2000)
+    parser.add_argument("--relationships", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=1.0, help="Stand-in round-trip latency per query")
+    parser.add_argument("--row-us", type=float, default=20.0, help="Stand-in server cost per row")
+    args = parser.parse_args()
+
+    if args.uri is None:
+        stand_in = StandInDriver(args.rtt_ms / 1000, args.row_us / 1_000_000)
+        neo4j_persistor.GraphDatabase.driver = lambda *a, **kw: stand_in
+        # The stand-in has no schema to verify
+        logging.getLogger(neo4j_persistor.SchemaManager.__module__).setLevel(logging.ERROR)
+        uri = "bolt://stand-in"
+    else:
+        uri = args.uri
+
+    db = Neo4jPersistor(uri=uri, user=args.user, password=args.password, run_id="bench")
+    entities, relationships = make_data(args.entities, args.relationships)
+    total = len(entities) + len(relationships)
+
+    try:
+        db.clear_graph()
+        start = time.perf_counter()
+        for entity in entities:
+            db.save_entity(entity)
+        for relation in relationships:
+            db.save_relationship(relation)
+        single = time.perf_counter() - start
+
+        db.clear_graph()
+        start = time.perf_counter()
+        db.save_entities_bulk(entities, batch_size=args.batch_size)
+        db.save_relationships_bulk(relationships, batch_size=args.batch_size)
+        batched = time.perf_counter() - start
+        db.clear_graph()
+    finally:
+        db.close()
+
+    print(f"Target: {'Neo4j at ' + uri if args.uri else 'in-process stand-in'}; {total} writes")
+    print(f"Per-object:          {single:.2f}s ({total / single:,.0f} writes/sec)")
+    print(f"Batched (bs={args.batch_size}):  {batched:.2f}s ({total / batched:,.0f} writes/sec)")
+    print(f"Speedup: {single / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+bench_ner_granularity.py
+
+Latency and memory of NER per chunk versus per reconstructed record
+(windowed, and the original single full-text pass) on a chunked threat JSON file.
+Each mode runs in a fresh process so peak RSS numbers do not bleed into each other.
+
+Usage:
+    python benchmarks/bench_ner_granularity.py --data data_storage/threats_chunked_clean.json --limit 50
+"""
+
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import argparse
+import logging
+import multiprocessing as mp
+import resource
+import time
+import tracemalloc
+
+logging.basicConfig(level=logging.WARNING)
+
+MODES = ("chunk", "record_windowed", "record_full")
+
+
+def run_mode(mode, args, queue):
+    from KG_pipeline.ingestion import ingest_data
+    from KG_pipeline.ner_extractor import ner_registry
+
+    granularity = "chunk" if mode == "chunk" else "record"
+    documents = ingest_data(args.data, granularity=granularity)
+    if args.limit:
+        # Limit by record so every mode covers the same text
+        keep = set(sorted({doc["record_id"] for doc in documents})[:args.limit])
+        documents = [doc for doc in documents if doc["record_id"] in keep]
+    texts = [doc["text"] for doc in documents]
+
+    extractor = ner_registry.warm_up(args.model)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    window_tokens = args.window_tokens if mode == "record_windowed" else None
+    results = extractor.extract_entities_batch(texts, batch_size=args.batch_size,
+                                               window_tokens=window_tokens, stride=args.window_stride)
+    elapsed = time.perf_counter() - start
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    queue.put({
+        "mode": mode,
+        "documents": len(texts),
+        "entities": sum(len(r) for r in results),
+        "seconds": elapsed,
+        "docs_per_sec": len(texts) / elapsed if elapsed else 0.0,
+        "peak_rss_delta_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024,
+        "python_peak_mb": py_peak / (1024 * 1024),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-chunk vs per-record NER latency and memory")
+    parser.add_argument("--data", default="data_storage/threats_chunked_clean.json")
+    parser.add_argument("--limit", type=int, default=50, help="Number of records to include")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--window-tokens", type=int, default=384)
+    parser.add_argument("--window-stride", type=int, default=64)
+    parser.add_argument("--model", default=None)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    print(f"{'mode':<16}{'docs':>6}{'entities':>10}{'seconds':>10}{'docs/sec':>10}{'RSS +MB':>10}{'py peak MB':>12}")
+    for mode in MODES:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=run_mode, args=(mode, args, queue))
+        proc.start()
+        row = queue.get()
+        proc.join()
+        print(f"{row['mode']:<16}{row['documents']:>6}{row['entities']:>10}{row['seconds']:>10.2f}"
+              f"{row['docs_per_sec']:>10.2f}{row['peak_rss_delta_mb']:>10.1f}{row['python_peak_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from bs4 import BeautifulSoup
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import re
 
+from record_keys import record_key
+
 def clean_html(raw_html):
     """Enhanced HTML cleaning with JSON artifact removal"""
     if not raw_html or not isinstance(raw_html, str):
@@ -32,11 +34,19 @@ def chunk_threat_data(input_path, output_path, chunk_size=1000, chunk_overlap=20
 
     all_chunks = []
     skipped_count = 0
+    duplicate_count = 0
+    seen_keys = set()
 
     print(f"Total records to process: {len(data)}")
 
     for record_id, item in enumerate(data):
         raw_desc = item.get("description", "")
+        # Stable across feed reordering; parse_threat_data writes it, older threats.json files get it here
+        key = item.get("record_key") or record_key(item.get("source", ""), item.get("indicator", ""), raw_desc)
+        if key in seen_keys:
+            duplicate_count += 1
+            continue
+        seen_keys.add(key)
         cleaned_text = clean_html(raw_desc)
 
         if not cleaned_text.strip():
@@ -59,6 +69,7 @@ def chunk_threat_data(input_path, output_path, chunk_size=1000, chunk_overlap=20
             
             all_chunks.append({
                 "record_id": record_id,
+                "record_key": key,
                 "chunk_index": chunk_idx,
                 "source": item.get("source", ""),
                 "type": item.get("type", ""),
@@ -72,6 +83,7 @@ def chunk_threat_data(input_path, output_path, chunk_size=1000, chunk_overlap=20
 
     print(f"Finished processing. Total chunks created: {len(all_chunks)}")
     print(f"Total records skipped due to empty description: {skipped_count}")
+    print(f"Total duplicate records skipped (same source, indicator and text): {duplicate_count}")
 
     with open(output_path, "w", encoding="utf-8") as fout:
         json.dump(all_chunks, fout, indent=2, ensure_ascii=False)  # Preserve non-ASCII chars
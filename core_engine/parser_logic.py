@@ -8,6 +8,8 @@ import logging
 from pathlib import Path
 from typing import List, Dict, Union
 
+from record_keys import record_key
+
 # Setup logging once
 logging.basicConfig(
     filename='parser.log',
@@ -70,6 +72,7 @@ def normalize_data(raw_data: Union[dict, list, str], source_name: str) -> List[D
                 "indicator": indicator,
                 "description": description,
                 "date": pd.Timestamp.now().isoformat(),
+                "record_key": record_key(source_name, indicator, description),
                 "raw": raw
             })
         except Exception as e:
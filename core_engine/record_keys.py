@@ -0,0 +1,25 @@
+# src/record_keys.py
+
+import hashlib
+import re
+
+# Stable record keys: derived from where a record came from and what it says,
+# not from its position in the feed output, so reordering keeps every key
+# and an edited advisory gets a new one.
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text) -> str:
+    """Whitespace-insensitive form of a record's text (feeds re-wrap descriptions freely)."""
+    return _WHITESPACE.sub(" ", str(text or "")).strip()
+
+
+def text_hash(text) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def record_key(source, indicator, text) -> str:
+    """24 hex chars of SHA-256 over source, indicator and the normalized text hash."""
+    payload = "\x1f".join((str(source or ""), str(indicator or ""), text_hash(text)))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
@@ -1,8 +1,10 @@
 import os
 import json
 import argparse
-from cohere import Client as CohereClient
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from KG_pipeline.llm_clients import get_llm_client_factory
 
 load_dotenv()
 
@@ -14,7 +16,8 @@ class EnhancerAgent:
     """
 
     def __init__(self, cohere_api_key):
-        self.cohere = CohereClient(cohere_api_key)
+        # Shared, pooled client: repeated enrich_node calls reuse connections
+        self.cohere = get_llm_client_factory().cohere(cohere_api_key)
 
     def enrich_node(self, node):
         """Enriches a single node using a prompt and LLM."""
@@ -1,10 +1,12 @@
 # retriever_agent.py
 
 import argparse
-from cohere import Client as CohereClient
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
 import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from KG_pipeline.llm_clients import get_llm_client_factory
 
 load_dotenv()
 
@@ -18,7 +20,7 @@ class RetrieverAgent:
     """
 
     def __init__(self, cohere_api_key, neo4j_uri, neo4j_user, neo4j_password):
-        self.cohere = CohereClient(cohere_api_key)
+        self.cohere = get_llm_client_factory().cohere(cohere_api_key)
         self.neo4j_driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
         self.vector_db = self.MockVectorDB()
         self.embedding_store = {}  # Store embeddings for queries if needed
@@ -0,0 +1,12 @@
+import importlib
+import os
+import sys
+
+# The pipeline modules are imported as the threat_graph_engine package from the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Some modules import the package under its deployed name, KG_pipeline
+try:
+    import KG_pipeline  # noqa: F401
+except ImportError:
+    sys.modules["KG_pipeline"] = importlib.import_module("threat_graph_engine")
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from threat_graph_engine.checkpoint_journal import (CheckpointJournal, content_hash, FSYNC_ALWAYS, FSYNC_NEVER,
+                                                    STATUS_DONE, STATUS_FAILED)
+
+
+def lines(path):
+    return path.read_text(encoding="utf-8").splitlines()
+
+
+def test_marks_survive_a_reopen(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal(path, fsync=FSYNC_ALWAYS)
+    journal.mark_done("a", content_hash("text a"))
+    journal.mark_failed("b", content_hash("text b"))
+    journal.close()
+
+    reopened = CheckpointJournal(path)
+    assert reopened.is_done("a", content_hash("text a"))
+    assert reopened.status("b") == STATUS_FAILED
+    assert not reopened.is_done("b")
+    assert reopened.counts() == {STATUS_DONE: 1, STATUS_FAILED: 1}
+    reopened.close()
+
+
+def test_changed_content_is_not_done(tmp_path):
+    journal = CheckpointJournal(tmp_path / "journal.jsonl", fsync=FSYNC_NEVER)
+    journal.mark_done("a", content_hash("old text"))
+    assert not journal.is_done("a", content_hash("new text"))
+    # Without a hash on either side only the status counts
+    assert journal.is_done("a")
+    journal.close()
+
+
+def test_latest_record_wins(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal(path, fsync=FSYNC_NEVER)
+    journal.mark_failed("a")
+    journal.mark_done("a")
+    journal.close()
+    assert CheckpointJournal(path).status("a") == STATUS_DONE
+
+
+def test_torn_last_line_is_dropped_and_truncated(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal(path, fsync=FSYNC_ALWAYS)
+    journal.mark_done("a")
+    journal.mark_done("b")
+    journal.close()
+    intact = path.read_bytes()
+    path.write_bytes(intact + b'{"k":"c","s":"do')
+
+    reopened = CheckpointJournal(path)
+    assert reopened.status("c") is None
+    assert len(reopened) == 2
+    assert reopened.stats()["torn_lines"] == 1
+    assert path.read_bytes() == intact
+    # Appends after recovery start on a clean line
+    reopened.mark_done("c")
+    reopened.close()
+    assert [json.loads(line)["k"] for line in lines(path)] == ["a", "b", "c"]
+
+
+def test_compaction_keeps_one_line_per_record(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal(path, fsync=FSYNC_NEVER, compact_min_lines=10, compact_ratio=2.0)
+    for n in range(30):
+        journal.mark_done(f"doc{n % 3}", content_hash(str(n)))
+    stats = journal.stats()
+    assert stats["compactions"] >= 1
+    assert stats["lines"] < 30
+    journal.close()
+
+    assert not (tmp_path / "journal.jsonl.tmp").exists()
+    reopened = CheckpointJournal(path, compact_min_lines=10)
+    assert len(reopened) == 3
+    assert reopened.is_done("doc2", content_hash("29"))
+    reopened.close()
+
+
+def test_explicit_compact_rewrites_the_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal(path, fsync=FSYNC_NEVER)
+    for _ in range(5):
+        journal.mark_done("a")
+    journal.compact()
+    journal.mark_done("b")
+    journal.close()
+    assert [json.loads(line)["k"] for line in lines(path)] == ["a", "b"]
+
+
+def test_legacy_checkpoint_is_imported_once(tmp_path):
+    legacy = tmp_path / "processed_records.json"
+    legacy.write_text(json.dumps([1, 2, "r3"]), encoding="utf-8")
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal(path, legacy_path=legacy)
+    assert journal.is_done(1) and journal.is_done("r3", content_hash("anything"))
+    journal.close()
+
+    legacy.write_text(json.dumps([4]), encoding="utf-8")
+    reopened = CheckpointJournal(path, legacy_path=legacy)
+    assert reopened.status(4) is None
+    reopened.close()
+
+
+def test_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        CheckpointJournal(tmp_path / "journal.jsonl", fsync="sometimes")
@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("cachetools")
+
+from threat_graph_engine.gazetteer import MitreGazetteer
+from threat_graph_engine.schemas import EntityType
+
+
+def stix(obj_type, name, mitre_id, aliases=(), **extra):
+    return {"type": obj_type, "name": name, "x_mitre_aliases": list(aliases),
+            "external_references": [{"source_name": "mitre-attack", "external_id": mitre_id}], **extra}
+
+
+BUNDLE = {"objects": [
+    stix("intrusion-set", "APT29", "G0016", aliases=["APT29", "Cozy Bear", "The Dukes"]),
+    stix("tool", "Cobalt Strike", "S0154"),
+    stix("tool", "Cobalt", "S9999"),
+    stix("tool", "Net", "S0039", aliases=["net.exe"]),
+    stix("tool", "Ping", "S0097"),
+    stix("malware", "OldBot", "S0001", revoked=True),
+]}
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    return MitreGazetteer.from_stix(BUNDLE)
+
+
+def test_matches_names_and_aliases(gazetteer):
+    entities = gazetteer.extract("Cozy Bear (a.k.a. the dukes) deployed Cobalt Strike.")
+    assert [(e.name, e.mitre_id, e.mitre_name, e.type) for e in entities] == [
+        ("cozy bear", "G0016", "APT29", EntityType.THREAT_ACTOR),
+        ("the dukes", "G0016", "APT29", EntityType.THREAT_ACTOR),
+        ("cobalt strike", "S0154", "Cobalt Strike", EntityType.TOOL),
+    ]
+
+
+def test_ignores_stopwords_and_revoked_objects(gazetteer):
+    entities = gazetteer.extract("Operators ran ping and net view, then used net.exe; OldBot was not seen.")
+    assert [e.mitre_id for e in entities] == ["S0039"]
+    assert entities[0].name == "net.exe"
+
+
+def test_requires_word_boundaries(gazetteer):
+    assert gazetteer.extract("Cobalts and xAPT29 are not hits") == []
+    assert [e.mitre_id for e in gazetteer.extract("APT29, again APT29")] == ["G0016"]
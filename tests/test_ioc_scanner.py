@@ -0,0 +1,51 @@
+import re
+
+from threat_graph_engine.ioc_scanner import IOC_SCANNER
+from threat_graph_engine.schemas import EntityType
+
+# The per-pattern regexes extract_regex_entities ran before the single-pass scanner
+LEGACY_PATTERNS = [
+    (r'CVE-\d{4}-\d{4,7}', EntityType.VULNERABILITY),
+    (r'T\d{4}(?:\.\d{3})?', EntityType.MITRE_TECHNIQUE),
+    (r'\bAPT\d+\b', EntityType.THREAT_ACTOR),
+    (r'\b[\w-]+(Stealer|RAT|Malware|Bot)\b', EntityType.MALWARE),
+    (r'\b(?:\d{1,3}\.){3}\d{1,3}\b', EntityType.INDICATOR),
+    (r'\b[a-fA-F0-9]{32,64}\b', EntityType.INDICATOR),
+    (r'\b(EternalBlue|BlueKeep|Heartbleed)\b', EntityType.EXPLOIT),
+    (r'\b[a-zA-Z0-9_]+\.py\b', EntityType.TOOL),
+    (r'\b(Mimikatz|Cobalt Strike|Metasploit|Netcat|Meterpreter)\b', EntityType.TOOL),
+]
+
+TEXT = (
+    "APT29 used Mimikatz and cobalt strike to exploit CVE-2021-44228 (T1059.001, then T1566). "
+    "The RedLine-Stealer sample dropped loader.py and beaconed to 192.168.10.5; its MD5 is "
+    "d41d8cd98f00b204e9800998ecf8427e. EternalBlue, Netcat and Meterpreter were seen again with APT29. "
+    "Mid-word names such as xAPT28 or notMimikatz are not matches."
+)
+
+
+def legacy_hits(text):
+    return {(m.group().lower(), ent_type)
+            for pattern, ent_type in LEGACY_PATTERNS
+            for m in re.finditer(pattern, text, re.IGNORECASE)}
+
+
+def test_scanner_matches_legacy_regexes():
+    hits = {(m.value.lower(), m.type) for m in IOC_SCANNER.scan(TEXT)}
+    assert hits == legacy_hits(TEXT)
+    assert ("xapt28", EntityType.THREAT_ACTOR) not in hits and ("apt28", EntityType.THREAT_ACTOR) not in hits
+
+
+def test_scanner_reports_each_value_once_with_offsets():
+    matches = IOC_SCANNER.scan(TEXT)
+    assert [m.value for m in matches].count("APT29") == 1
+    for m in matches:
+        assert TEXT[m.start:m.end] == m.value
+
+
+def test_extract_builds_entities():
+    entities = IOC_SCANNER.extract("Seen with CVE-2017-0144 and T1059.001")
+    assert [(e.name, e.type, e.confidence) for e in entities] == [
+        ("cve-2017-0144", EntityType.VULNERABILITY, 0.9),
+        ("t1059.001", EntityType.MITRE_TECHNIQUE, 1.0),
+    ]
@@ -0,0 +1,78 @@
+import json
+import random
+
+from threat_graph_engine.json_stream import IncrementalJSONArrayParser, iter_json_array, parse_json_array
+
+RELATIONS = [
+    {"source_name": "apt28", "target_name": "mimikatz", "relationship_type": "uses",
+     "description": 'quotes "]}[{" and brackets inside strings'},
+    {"source_name": "emotet", "target_name": "cve-2021-1000", "nested": [1, {"x": "}"}], "escape": "\\\\"},
+    {"source_name": "lazarus", "target_name": "microsoft", "confidence": None},
+]
+
+
+def feed_in_chunks(text, seed):
+    rng = random.Random(seed)
+    parser = IncrementalJSONArrayParser()
+    out, i = [], 0
+    while i < len(text):
+        n = rng.randint(1, 7)
+        out += parser.feed(text[i:i + n])
+        i += n
+    return parser, out
+
+
+def test_plain_array():
+    assert parse_json_array(json.dumps(RELATIONS)) == RELATIONS
+
+
+def test_code_fence_and_prose_around_the_answer():
+    text = "Sure! Here are the relations:\n```json\n" + json.dumps(RELATIONS, indent=2) + "\n```\nHope that [helps]."
+    assert parse_json_array(text) == RELATIONS
+
+
+def test_brackets_inside_strings_with_any_chunking():
+    text = "[see below]\n" + json.dumps(RELATIONS)
+    for seed in range(50):
+        parser, out = feed_in_chunks(text, seed)
+        assert out == RELATIONS
+        assert parser.complete
+
+
+def test_truncated_array_keeps_complete_objects():
+    full = json.dumps(RELATIONS)
+    cut = full[:full.index('{"source_name": "lazarus"') + 10]
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed(cut) == RELATIONS[:2]
+    assert not parser.complete
+    assert parse_json_array(cut) == RELATIONS[:2]
+
+
+def test_scalar_array_in_preamble_does_not_end_the_search():
+    assert parse_json_array('Step [1]: here [{"a":1}]') == [{"a": 1}]
+    assert parse_json_array('Options ["a", "b"] then [{"a":1}, {"b":2}]') == [{"a": 1}, {"b": 2}]
+
+
+def test_empty_array_is_a_complete_answer():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed("No relations found: [ ]") == []
+    assert parser.complete
+    assert parse_json_array("[]") == []
+
+
+def test_no_array():
+    assert parse_json_array("no json here") is None
+    assert parse_json_array("[1, oops") is None
+
+
+def test_elements_are_emitted_as_they_complete():
+    chunks = ['[{"a"', ': 1},', ' {"b": 2}', "]"]
+    parser = IncrementalJSONArrayParser()
+    assert [parser.feed(chunk) for chunk in chunks] == [[], [{"a": 1}], [{"b": 2}], []]
+    assert list(iter_json_array(chunks)) == [{"a": 1}, {"b": 2}]
+
+
+def test_text_after_completion_is_ignored():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"a": 1}] and [{"b": 2}]') == [{"a": 1}]
+    assert parser.feed('[{"c": 3}]') == []
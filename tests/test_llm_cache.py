@@ -0,0 +1,83 @@
+import pytest
+
+from threat_graph_engine import llm_cache
+from threat_graph_engine.llm_cache import RelationCache, cache_key
+
+DAY = 86400.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        cache = RelationCache(str(tmp_path / f"cache{len(caches)}.sqlite"), **kwargs)
+        caches.append(cache)
+        return cache
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def relations(n):
+    return [{"source": f"apt{n}", "target": "mimikatz", "type": "uses"}]
+
+
+def test_cache_key_ignores_entity_order():
+    a = [{"name": "APT29", "type": "threat_actor"}, {"name": "Mimikatz", "type": "tool"}]
+    assert cache_key("m", "v1", "text", a) == cache_key("m", "v1", "text", a[::-1])
+    assert cache_key("m", "v1", "text", a) != cache_key("m", "v2", "text", a)
+
+
+def test_least_recently_used_entries_are_evicted_first(clock, make_cache):
+    cache = make_cache(max_entries=3, max_age_days=None)
+    for n in range(4):
+        clock.now += 1
+        cache.put(f"k{n}", "model", relations(n))
+    clock.now += 1
+    assert cache.get("k0") == relations(0)
+
+    assert cache.evict() == 1
+    assert cache.get("k1") is None
+    assert [cache.get(f"k{n}") for n in (0, 2, 3)] == [relations(0), relations(2), relations(3)]
+    assert cache.stats()["evicted"] == 1
+
+
+def test_entries_expire_by_age(clock, make_cache):
+    cache = make_cache(max_age_days=1)
+    cache.put("old", "model", relations(0))
+    clock.now += 0.5 * DAY
+    cache.put("new", "model", relations(1))
+    # A hit refreshes last_used but not the age
+    assert cache.get("old") == relations(0)
+
+    clock.now += 0.75 * DAY
+    assert cache.get("old") is None
+    assert cache.get("new") == relations(1)
+    stats = cache.stats()
+    assert stats["expired"] == 1 and stats["entries"] == 1
+
+
+def test_puts_trigger_periodic_eviction(clock, make_cache, monkeypatch):
+    monkeypatch.setattr(llm_cache, "EVICT_EVERY", 2)
+    cache = make_cache(max_entries=10, max_age_days=1)
+    cache.put("stale", "model", relations(0))
+    clock.now += 2 * DAY
+    cache.put("fresh", "model", relations(1))
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["evicted"] == 1
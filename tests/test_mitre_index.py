@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("cachetools")
+
+from threat_graph_engine.mitre_stix_integrator import MitreIndex
+from threat_graph_engine.schemas import EntityType, ThreatEntity
+
+
+def stix(obj_type, name, mitre_id, aliases=()):
+    return {"type": obj_type, "name": name, "description": f"{name} description", "x_mitre_aliases": list(aliases),
+            "external_references": [{"source_name": "mitre-attack", "external_id": mitre_id,
+                                     "url": f"https://attack.mitre.org/{mitre_id}"}]}
+
+
+BUNDLE = {"objects": [
+    stix("attack-pattern", "Command and Scripting Interpreter", "T1059"),
+    stix("attack-pattern", "PowerShell", "T1059.001"),
+    stix("tool", "Mimikatz", "S0002", aliases=["mimikatz"]),
+]}
+
+
+def test_lookup_by_id_name_and_alias():
+    index = MitreIndex(BUNDLE)
+    assert index.lookup("t1059.001")["name"] == "PowerShell"
+    assert index.lookup("  powershell ")["mitre_id"] == "T1059.001"
+    assert index.lookup("MIMIKATZ")["mitre_id"] == "S0002"
+    assert index.lookup("unknown") is None
+
+
+def test_parent_of_known_and_unknown_sub_techniques():
+    index = MitreIndex(BUNDLE)
+    assert index.parent("T1059.001")["mitre_id"] == "T1059"
+    assert index.parent("t1059.999")["mitre_id"] == "T1059"
+    assert index.parent("T1059") is None
+
+
+def test_enrich_resolves_scanner_technique_ids():
+    index = MitreIndex(BUNDLE)
+    exact = ThreatEntity(name="T1059.001", type=EntityType.MITRE_TECHNIQUE)
+    unknown_sub = ThreatEntity(name="T1059.999", type=EntityType.MITRE_TECHNIQUE)
+    missing = ThreatEntity(name="T9999", type=EntityType.MITRE_TECHNIQUE)
+    index.enrich([exact, unknown_sub, missing], fuzzy_threshold=0.3)
+    assert (exact.mitre_id, exact.mitre_name) == ("T1059.001", "PowerShell")
+    assert unknown_sub.mitre_id == "T1059"
+    assert missing.mitre_id is None
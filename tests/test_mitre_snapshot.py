@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("cachetools")
+
+from threat_graph_engine.mitre_snapshot import MitreSnapshot, compile_snapshot
+from threat_graph_engine.mitre_stix_integrator import MitreIndex
+
+
+def stix(obj_type, name, mitre_id=None, aliases=(), urls=()):
+    refs = [{"source_name": "mitre-attack", "external_id": mitre_id}] if mitre_id else []
+    refs += [{"source_name": "web", "url": url} for url in urls]
+    return {"type": obj_type, "name": name, "description": f"{name} — description",
+            "x_mitre_aliases": list(aliases), "external_references": refs}
+
+
+BUNDLE = {"objects": [
+    stix("attack-pattern", "Phishing", "T1566", urls=["https://attack.mitre.org/techniques/T1566"]),
+    stix("attack-pattern", "Spearphishing Attachment", "T1566.001"),
+    stix("intrusion-set", "APT29", "G0016", aliases=["APT29", "Cozy Bear", "NOBELIUM"]),
+    stix("tool", "Mimikatz", "S0002", urls=["https://a.example/1", "https://a.example/2"]),
+    # Duplicate ID and alias: the first object wins in both structures
+    stix("tool", "Mimikatz Copy", "S0002", aliases=["cozy bear"]),
+    stix("identity", "No ID Object"),
+]}
+
+QUERIES = ["T1566", "t1566.001", "Phishing", "  spearphishing   ATTACHMENT ", "apt29", "Cozy Bear", "nobelium",
+           "S0002", "mimikatz", "Mimikatz Copy", "no id object", "T9999", "unknown", ""]
+
+
+@pytest.fixture
+def structures(tmp_path):
+    source = tmp_path / "bundle.json"
+    source.write_text(json.dumps(BUNDLE), encoding="utf-8")
+    snapshot = MitreSnapshot(compile_snapshot(BUNDLE, str(tmp_path / "bundle.snapshot"), source_path=str(source)))
+    yield MitreIndex(BUNDLE), snapshot, source
+    snapshot.close()
+
+
+def test_snapshot_lookups_match_index(structures):
+    index, snapshot, _ = structures
+    for query in QUERIES:
+        assert snapshot.lookup(query) == index.lookup(query), query
+    for mitre_id in ("T1566.001", "T1566.999", "T1566", "G0016"):
+        assert snapshot.parent(mitre_id) == index.parent(mitre_id), mitre_id
+    assert sorted(snapshot.names()) == sorted(index.names())
+
+
+def test_snapshot_detects_a_changed_source(structures):
+    _, snapshot, source = structures
+    assert snapshot.is_current(str(source))
+    source.write_text(json.dumps({"objects": BUNDLE["objects"][:1]}), encoding="utf-8")
+    assert not snapshot.is_current(str(source))
@@ -0,0 +1,115 @@
+import pytest
+
+exceptions = pytest.importorskip("neo4j.exceptions")
+
+from threat_graph_engine import neo4j_persistor
+from threat_graph_engine.neo4j_persistor import Neo4jPersistor
+from threat_graph_engine.retry_policy import RetryPolicy
+from threat_graph_engine.schemas import EntityType, RelationshipType, ThreatEntity, ThreatRelationship
+
+
+class FakeTransaction:
+    def __init__(self, session):
+        self.session = session
+        self.rows = None
+
+    def run(self, query, params):
+        driver = self.session.driver
+        driver.runs += 1
+        if driver.runs in driver.failures:
+            raise driver.failures[driver.runs]
+        self.rows = params["rows"]
+        return self
+
+    def consume(self):
+        pass
+
+    def commit(self):
+        self.session.driver.committed.append((self.session, self.rows))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def begin_transaction(self):
+        return FakeTransaction(self)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeDriver:
+    def __init__(self):
+        self.committed = []
+        # run call number (1-based) -> error raised by that call
+        self.failures = {}
+        self.runs = 0
+        self.sessions = 0
+
+    def session(self, **kwargs):
+        self.sessions += 1
+        return FakeSession(self)
+
+    def close(self):
+        pass
+
+
+class FakeSchemaManager:
+    def __init__(self, driver, database=None):
+        pass
+
+    def ensure(self):
+        pass
+
+
+@pytest.fixture
+def persistor(monkeypatch):
+    driver = FakeDriver()
+    monkeypatch.setattr(neo4j_persistor.GraphDatabase, "driver", lambda *a, **kw: driver)
+    monkeypatch.setattr(neo4j_persistor, "SchemaManager", FakeSchemaManager)
+    return Neo4jPersistor("bolt://fake", "neo4j", "secret", run_id="run-1",
+                          retry_policy=RetryPolicy(base_delay=0.0, deadline=None))
+
+
+def entities(n):
+    return [ThreatEntity(name=f"host-{i}", type=EntityType.INDICATOR) for i in range(n)]
+
+
+def test_bulk_entities_split_into_unwind_batches_on_one_session(persistor):
+    assert persistor.save_entities_bulk(entities(1234), batch_size=500) == 1234
+    committed = persistor.driver.committed
+    assert [len(rows) for _, rows in committed] == [500, 500, 234]
+    assert len({id(session) for session, _ in committed}) == 1
+    assert persistor.driver.sessions == 1
+    assert [row["name"] for _, rows in committed for row in rows] == [f"host-{i}" for i in range(1234)]
+
+
+def test_bulk_relationships_skip_invalid_rows(persistor):
+    relations = [ThreatRelationship(f"apt{i}", EntityType.THREAT_ACTOR, "mimikatz", EntityType.TOOL,
+                                    RelationshipType.USES) for i in range(5)]
+    relations.append(ThreatRelationship("", EntityType.THREAT_ACTOR, "mimikatz", EntityType.TOOL,
+                                        RelationshipType.USES))
+    assert persistor.save_relationships_bulk(relations, batch_size=2) == 5
+    assert [len(rows) for _, rows in persistor.driver.committed] == [2, 2, 1]
+    assert persistor.driver.committed[0][1][0]["relationship_type"] == "uses"
+
+
+def test_failed_batch_is_retried_alone(persistor):
+    persistor.driver.failures = {2: exceptions.TransientError("deadlock")}
+    assert persistor.save_entities_bulk(entities(30), batch_size=10) == 30
+    assert persistor.driver.runs == 4
+    assert [rows[0]["name"] for _, rows in persistor.driver.committed] == ["host-0", "host-10", "host-20"]
+    assert persistor.retry_stats()["retries"] == 1
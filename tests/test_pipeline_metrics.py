@@ -0,0 +1,115 @@
+import json
+import pickle
+import urllib.request
+
+import pytest
+
+from threat_graph_engine.pipeline_metrics import LatencyHistogram, MetricsRegistry, start_metrics_server
+
+
+def test_counters_sum_over_matching_labels():
+    registry = MetricsRegistry()
+    registry.inc("entities", 3, source="cisa")
+    registry.inc("entities", 2, source="otx")
+    registry.inc("entities", source="cisa")
+    assert registry.value("entities") == 6
+    assert registry.value("entities", source="cisa") == 4
+    assert registry.value("entities", source="nvd") == 0
+    assert registry.label_values("entities", "source") == ["cisa", "otx"]
+
+
+def test_histogram_quantiles_are_interpolated_within_buckets():
+    histogram = LatencyHistogram(buckets=(1.0, 2.0, float("inf")))
+    for seconds in (0.5, 1.5, 1.5, 1.5, 10.0):
+        histogram.observe(seconds)
+    assert histogram.count == 5
+    assert histogram.quantile(0.2) == pytest.approx(1.0)
+    assert 1.0 < histogram.quantile(0.5) < 2.0
+    # The overflow bucket has no upper bound; its quantiles report its lower bound
+    assert histogram.quantile(0.99) == 2.0
+    assert LatencyHistogram().quantile(0.5) is None
+
+
+def test_histogram_merge_needs_the_same_buckets():
+    with pytest.raises(ValueError):
+        LatencyHistogram(buckets=(1.0,)).merge(LatencyHistogram(buckets=(2.0,)))
+
+
+def test_drain_resets_counters_and_histograms_but_keeps_gauges():
+    registry = MetricsRegistry()
+    registry.inc("relationships", 5, source="cisa")
+    registry.observe("stage_seconds", 0.2, stage="ner")
+    registry.set("documents_remaining", 7)
+    drained = registry.drain()
+    assert registry.value("relationships") == 0
+    assert registry.histogram("stage_seconds").count == 0
+    assert registry.gauge("documents_remaining") == 7
+
+    registry.inc("relationships", 1, source="cisa")
+    assert registry.drain()["counter"] == {("relationships", (("source", "cisa"),)): 1}
+    # Snapshots cross process boundaries
+    assert pickle.loads(pickle.dumps(drained)) == drained
+
+
+def test_merge_adds_worker_snapshots():
+    parent = MetricsRegistry()
+    parent.inc("relationships", 1, source="cisa")
+    parent.observe("stage_seconds", 0.1, stage="ner")
+    for _ in range(2):
+        worker = MetricsRegistry()
+        worker.inc("relationships", 2, source="cisa")
+        worker.observe("stage_seconds", 0.3, stage="ner")
+        worker.set("docs_per_second", 4.0)
+        parent.merge(worker.drain())
+    assert parent.value("relationships", source="cisa") == 5
+    histogram = parent.histogram("stage_seconds", stage="ner")
+    assert histogram.count == 3
+    assert histogram.sum == pytest.approx(0.7)
+    assert parent.gauge("docs_per_second") == 4.0
+
+
+def test_time_observes_the_block():
+    registry = MetricsRegistry()
+    with registry.time("stage_seconds", stage="persist"):
+        pass
+    assert registry.histogram("stage_seconds", stage="persist").count == 1
+
+
+def test_summary_and_json(tmp_path):
+    registry = MetricsRegistry()
+    registry.inc("entities", 2, source="cisa")
+    registry.set("eta_seconds", 12.5)
+    registry.observe("stage_seconds", 0.02, stage="ner", source="cisa")
+    path = tmp_path / "metrics.json"
+    registry.write_json(path)
+    summary = json.loads(path.read_text(encoding="utf-8"))
+    assert summary["counters"]["entities"] == {"source=cisa": 2}
+    assert summary["gauges"]["eta_seconds"] == {"total": 12.5}
+    assert summary["histograms"]["stage_seconds"]["source=cisa,stage=ner"]["count"] == 1
+
+
+def test_prometheus_text():
+    registry = MetricsRegistry(namespace="test")
+    registry.describe("entities", "Entities extracted")
+    registry.inc("entities", 2, source='we"ird')
+    registry.observe("stage_seconds", 0.02, stage="ner")
+    text = registry.render_prometheus()
+    assert "# HELP test_entities_total Entities extracted" in text
+    assert "# TYPE test_entities_total counter" in text
+    assert 'test_entities_total{source="we\\"ird"} 2' in text
+    assert 'test_stage_seconds_bucket{stage="ner",le="+Inf"} 1' in text
+    assert 'test_stage_seconds_count{stage="ner"} 1' in text
+
+
+def test_metrics_server_listens_locally_by_default():
+    registry = MetricsRegistry(namespace="test")
+    registry.inc("entities")
+    server = start_metrics_server(registry, 0)
+    try:
+        host, port = server.server_address[:2]
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert "test_entities_total 1" in response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
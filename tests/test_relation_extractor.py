@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+for _module in ("dotenv", "httpx", "groq", "openai"):
+    pytest.importorskip(_module)
+
+from KG_pipeline import llm_cache, relation_extractor
+from KG_pipeline.relation_extractor import (BaseLLMClient, PACKED_PROMPT_VERSION, PROMPT_VERSION, pack_documents,
+                                            relations_within)
+
+
+def relation(source, target, kind="uses"):
+    return {"source_name": source, "source_type": "threat_actor", "target_name": target, "target_type": "tool",
+            "relationship_type": kind, "confidence": 0.9, "description": ""}
+
+
+class FakeClient(BaseLLMClient):
+    """Answers packed prompts with a canned JSON object and single prompts with a canned array."""
+
+    def __init__(self, packed_answer, single_answer=None):
+        super().__init__(model="fake")
+        self.packed_answer = packed_answer
+        self.single_answer = single_answer if single_answer is not None else []
+        self.prompts = []
+
+    def _call_api(self, prompt, max_tokens=None):
+        self.prompts.append(prompt)
+        if "### doc1" in prompt:
+            return "Here you go:\n" + json.dumps(self.packed_answer)
+        return json.dumps(self.single_answer)
+
+
+DOCS = [
+    ("APT28 used Mimikatz.", [{"name": "apt28", "type": "threat_actor"}, {"name": "mimikatz", "type": "tool"}]),
+    ("Lazarus deployed Emotet.", [{"name": "lazarus", "type": "threat_actor"}, {"name": "emotet", "type": "malware"}]),
+    ("FIN7 used Carbanak.", [{"name": "fin7", "type": "threat_actor"}, {"name": "carbanak", "type": "malware"}]),
+]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    llm_cache.configure_relation_cache(enabled=True, path=str(tmp_path / "cache.sqlite"))
+    yield llm_cache.get_relation_cache()
+    llm_cache.configure_relation_cache(enabled=False)
+
+
+def test_relations_within_drops_foreign_entities():
+    relations = [relation("APT28", "mimikatz"), relation("apt28", "emotet")]
+    assert relations_within(relations, DOCS[0][1]) == [relations[0]]
+
+
+def test_packed_answer_is_split_filtered_and_missing_documents_refetched(cache):
+    answer = {
+        "doc1": [relation("apt28", "mimikatz"), relation("apt28", "emotet")],  # emotet belongs to doc2
+        "doc2": [relation("lazarus", "emotet")],
+        # doc3 missing
+    }
+    client = FakeClient(answer, single_answer=[relation("fin7", "carbanak")])
+    results = client.extract_relations_packed(DOCS)
+
+    assert results[0] == [relation("apt28", "mimikatz")]
+    assert results[1] == [relation("lazarus", "emotet")]
+    assert results[2] == [relation("fin7", "carbanak")]
+    assert len(client.prompts) == 2  # one packed request, one single-document fallback
+
+    packed_key = lambda n: llm_cache.cache_key("fake", PACKED_PROMPT_VERSION, *DOCS[n])
+    # The mixed-up answer is not cached; the clean one is
+    assert cache.get(packed_key(0)) is None
+    assert cache.get(packed_key(1)) == [relation("lazarus", "emotet")]
+    assert cache.get(llm_cache.cache_key("fake", PROMPT_VERSION, *DOCS[2])) == [relation("fin7", "carbanak")]
+
+
+def test_malformed_document_answers_fall_back_to_single_requests(cache):
+    answer = {"doc1": "none", "doc2": [relation("lazarus", "emotet"), "oops"], "doc3": []}
+    client = FakeClient(answer, single_answer=[relation("apt28", "mimikatz")])
+    results = client.extract_relations_packed(DOCS)
+    assert results[2] == []
+    assert len(client.prompts) == 3  # doc1 and doc2 were asked again on their own
+    assert results[0] == [relation("apt28", "mimikatz")]
+
+
+def test_cached_documents_are_not_sent_again(cache):
+    cache.put(llm_cache.cache_key("fake", PROMPT_VERSION, *DOCS[0]), "fake", [relation("apt28", "mimikatz")])
+    client = FakeClient({"doc1": [relation("lazarus", "emotet")], "doc2": [relation("fin7", "carbanak")]})
+    results = client.extract_relations_packed(DOCS)
+    assert results == [[relation("apt28", "mimikatz")], [relation("lazarus", "emotet")],
+                       [relation("fin7", "carbanak")]]
+    assert "APT28 used Mimikatz." not in client.prompts[0]
+
+
+def test_pack_documents_respects_budget_and_max_docs():
+    docs = [("x" * 400, [{"name": f"e{n}", "type": "tool"}]) for n in range(10)]
+    packs = pack_documents(docs, token_budget=350, max_docs=3)
+    assert sorted(i for pack in packs for i in pack) == list(range(10))
+    assert all(len(pack) <= 3 for pack in packs)
+    assert all(sum(relation_extractor.estimate_prompt_tokens(*docs[i]) for i in pack) <= 350
+               for pack in packs if len(pack) > 1)
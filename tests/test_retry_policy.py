@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+exceptions = pytest.importorskip("neo4j.exceptions")
+
+from threat_graph_engine import retry_policy
+from threat_graph_engine.retry_policy import RetryClass, RetryPolicy
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(retry_policy.time, "sleep", slept.append)
+    return slept
+
+
+def flaky(errors, result="ok"):
+    errors = list(errors)
+    calls = []
+
+    def func():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    func.calls = calls
+    return func
+
+
+def test_classify():
+    assert RetryPolicy.classify(exceptions.TransientError("deadlock")) == RetryClass.TRANSIENT
+    assert RetryPolicy.classify(exceptions.ServiceUnavailable("down")) == RetryClass.UNAVAILABLE
+    assert RetryPolicy.classify(exceptions.SessionExpired("expired")) == RetryClass.UNAVAILABLE
+    assert RetryPolicy.classify(ConnectionResetError()) == RetryClass.UNAVAILABLE
+    assert RetryPolicy.classify(ValueError("bad query")) == RetryClass.FATAL
+
+
+def test_transient_errors_are_retried(sleeps):
+    policy = RetryPolicy(max_retries=3, rng=random.Random(1))
+    func = flaky([exceptions.TransientError("deadlock"), exceptions.ServiceUnavailable("down")])
+    assert policy.run(func) == "ok"
+    assert len(func.calls) == 3
+    stats = policy.stats()
+    assert (stats["retries"], stats["transient_errors"], stats["unavailable_errors"], stats["successes"]) == (2, 1, 1, 1)
+    assert stats["backoff_seconds"] == pytest.approx(sum(sleeps))
+
+
+def test_fatal_errors_are_not_retried(sleeps):
+    policy = RetryPolicy()
+    func = flaky([ValueError("syntax error")])
+    with pytest.raises(ValueError):
+        policy.run(func)
+    assert len(func.calls) == 1
+    assert sleeps == []
+    assert policy.stats()["fatal_errors"] == 1
+
+
+def test_gives_up_after_max_retries(sleeps):
+    policy = RetryPolicy(max_retries=2, deadline=None)
+    func = flaky([exceptions.TransientError("deadlock")] * 5)
+    with pytest.raises(exceptions.TransientError):
+        policy.run(func)
+    assert len(func.calls) == 3
+    assert policy.stats()["gave_up"] == 1
+
+
+def test_deadline_stops_retrying(sleeps):
+    policy = RetryPolicy(max_retries=10, base_delay=1.0, max_delay=1.0, deadline=0.5,
+                         rng=random.Random(0))
+    policy._rng.uniform = lambda low, high: high
+    func = flaky([exceptions.TransientError("deadlock")] * 5)
+    with pytest.raises(exceptions.TransientError):
+        policy.run(func)
+    assert len(func.calls) == 1
+    assert policy.stats()["deadline_exceeded"] == 1
+
+
+def test_backoff_grows_and_is_capped():
+    policy = RetryPolicy(base_delay=0.1, max_delay=1.0, multiplier=2.0, unavailable_delay_factor=4.0)
+    policy._rng.uniform = lambda low, high: high
+    assert [policy.backoff(n) for n in (1, 2, 3, 5)] == pytest.approx([0.1, 0.2, 0.4, 1.0])
+    assert policy.backoff(1, RetryClass.UNAVAILABLE) == pytest.approx(0.4)
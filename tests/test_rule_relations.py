@@ -0,0 +1,101 @@
+import pytest
+
+from threat_graph_engine.rule_relations import RuleRelationExtractor, merge_relationships, relationship_key
+from threat_graph_engine.schemas import EntityType, ThreatEntity, ThreatRelationship
+
+
+def triples(text, entities):
+    result = RuleRelationExtractor().extract(text, entities)
+    return {(r.source_name, r.relationship_type, r.target_name) for r in result.relationships}, result
+
+
+def test_active_uses_with_coordinated_targets():
+    found, result = triples("APT29 used Mimikatz and Cobalt Strike to move laterally.",
+                            [ThreatEntity("APT29", EntityType.THREAT_ACTOR), ThreatEntity("Mimikatz", EntityType.TOOL),
+                             ThreatEntity("Cobalt Strike", EntityType.TOOL)])
+    assert found == {("apt29", "uses", "mimikatz"), ("apt29", "uses", "cobalt strike")}
+    assert not result.needs_llm
+
+
+def test_coordinated_sources():
+    found, _ = triples("APT28 and APT29 exploited CVE-2021-44228.",
+                       [ThreatEntity("APT28", EntityType.THREAT_ACTOR), ThreatEntity("APT29", EntityType.THREAT_ACTOR),
+                        ThreatEntity("CVE-2021-44228", EntityType.CVE)])
+    assert found == {("apt28", "exploits", "cve-2021-44228"), ("apt29", "exploits", "cve-2021-44228")}
+
+
+def test_passive_uses_only_points_from_the_agent():
+    found, _ = triples("Emotet was dropped by TrickBot.",
+                       [ThreatEntity("Emotet", EntityType.MALWARE), ThreatEntity("TrickBot", EntityType.MALWARE)])
+    assert found == {("trickbot", "uses", "emotet")}
+
+
+def test_passive_targets_does_not_fire_the_active_rule():
+    found, _ = triples("APT28 attacked by Microsoft.",
+                       [ThreatEntity("APT28", EntityType.THREAT_ACTOR),
+                        ThreatEntity("Microsoft", EntityType.ORGANIZATION)])
+    assert ("apt28", "targets", "microsoft") not in found
+
+    found, _ = triples("Microsoft was targeted by APT28.",
+                       [ThreatEntity("Microsoft", EntityType.ORGANIZATION),
+                        ThreatEntity("APT28", EntityType.THREAT_ACTOR)])
+    assert found == {("apt28", "targets", "microsoft")}
+
+
+def test_passive_exploits():
+    found, _ = triples("CVE-2023-1234 was exploited by LockBit.",
+                       [ThreatEntity("CVE-2023-1234", EntityType.CVE), ThreatEntity("LockBit", EntityType.MALWARE)])
+    assert found == {("lockbit", "exploits", "cve-2023-1234")}
+
+
+def test_negation_blocks_the_rule_and_escalates():
+    found, result = triples("APT41 did not use Mimikatz.",
+                            [ThreatEntity("APT41", EntityType.THREAT_ACTOR), ThreatEntity("Mimikatz", EntityType.TOOL)])
+    assert found == set()
+    assert result.unexplained_pairs == [("apt41", "mimikatz")]
+    assert result.needs_llm
+
+
+@pytest.mark.parametrize("verb", ["didn't use", "doesn't use", "hasn't used", "wasn't using", "never used"])
+def test_contracted_negation_blocks_the_rule(verb):
+    found, result = triples(f"APT41 {verb} Mimikatz.",
+                            [ThreatEntity("APT41", EntityType.THREAT_ACTOR), ThreatEntity("Mimikatz", EntityType.TOOL)])
+    assert found == set()
+    assert result.needs_llm
+
+
+def test_rules_stay_within_a_sentence():
+    found, result = triples("APT41 was active. Mimikatz used on hosts.",
+                            [ThreatEntity("APT41", EntityType.THREAT_ACTOR), ThreatEntity("Mimikatz", EntityType.TOOL)])
+    assert found == set()
+    # Entities of different sentences are not a co-mentioned pair
+    assert not result.needs_llm
+
+
+def test_variant_of():
+    found, _ = triples("Emotet is a variant of Geodo.",
+                       [ThreatEntity("Emotet", EntityType.MALWARE), ThreatEntity("Geodo", EntityType.MALWARE)])
+    assert found == {("emotet", "derives_from", "geodo")}
+
+
+def test_product_vulnerability_needs_a_single_vulnerability():
+    text = "Microsoft Exchange Server contains a remote code execution vulnerability. CVE-2021-26855 is listed."
+    found, _ = triples(text, [ThreatEntity("Microsoft Exchange Server", EntityType.TOOL),
+                              ThreatEntity("CVE-2021-26855", EntityType.CVE)])
+    assert found == {("cve-2021-26855", "targets", "microsoft exchange server")}
+
+
+def test_entity_not_named_in_text_is_unexplained():
+    _, result = triples("Report mentions a group.",
+                        [ThreatEntity("APT5", EntityType.THREAT_ACTOR), ThreatEntity("Mimikatz", EntityType.TOOL)])
+    assert result.needs_llm
+
+
+def test_merge_relationships_keeps_the_first_duplicate():
+    rule = ThreatRelationship(source_name="a", source_type="malware", target_name="b", target_type="tool",
+                              relationship_type="uses", confidence=0.9)
+    llm = ThreatRelationship(source_name="a", source_type="malware", target_name="b", target_type="tool",
+                             relationship_type="uses", confidence=0.5)
+    merged = merge_relationships([rule], [llm])
+    assert merged == [rule]
+    assert relationship_key(merged[0]) == ("a", "malware", "b", "tool", "uses")
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from threat_graph_engine.pipeline_metrics import MetricsRegistry
+from threat_graph_engine.stage_executor import Stage, StageExecutor
+
+
+def collecting():
+    done, lock = [], threading.Lock()
+
+    def on_complete(item):
+        with lock:
+            done.append(item)
+    return done, on_complete
+
+
+def test_items_flow_through_every_stage():
+    done, on_complete = collecting()
+    executor = StageExecutor([Stage("double", lambda x: x * 2, workers=3),
+                              Stage("inc", lambda x: x + 1, workers=2)], on_complete=on_complete)
+    for n in range(100):
+        executor.submit(n)
+    executor.close()
+    assert sorted(done) == [n * 2 + 1 for n in range(100)]
+    stats = executor.stats()
+    assert stats["double"]["processed"] == 100 and stats["inc"]["processed"] == 100
+
+
+def test_close_drains_slow_downstream_stages():
+    done, on_complete = collecting()
+
+    def slow(x):
+        time.sleep(0.005)
+        return x
+
+    executor = StageExecutor([Stage("fast", lambda x: x, workers=1, queue_size=2),
+                              Stage("slow", slow, workers=2, queue_size=2)], on_complete=on_complete)
+    for n in range(40):
+        executor.submit(n)
+    executor.close()
+    assert sorted(done) == list(range(40))
+    assert all(not thread.is_alive() for thread in executor._threads)
+
+
+def test_failures_and_none_results_are_dropped():
+    done, on_complete = collecting()
+
+    def picky(x):
+        if x % 5 == 0:
+            raise ValueError("bad item")
+        return None if x % 5 == 1 else x
+
+    executor = StageExecutor([Stage("picky", picky, workers=2)], on_complete=on_complete)
+    for n in range(20):
+        executor.submit(n)
+    executor.close()
+    assert sorted(done) == [n for n in range(20) if n % 5 not in (0, 1)]
+    stats = executor.stats()["picky"]
+    assert (stats["processed"], stats["failed"], stats["dropped"]) == (16, 4, 4)
+
+
+def test_every_item_ends_in_on_complete_or_on_drop():
+    done, on_complete = collecting()
+    lost, on_drop = collecting()
+
+    def first(x):
+        if x % 7 == 0:
+            raise ValueError("bad item")
+        return x
+
+    def second(items):
+        if 3 in items:
+            raise RuntimeError("batch failed")
+        return [None if x % 5 == 0 else x for x in items]
+
+    executor = StageExecutor([Stage("first", first, workers=2), Stage("second", second, batch_size=4)],
+                             on_complete=on_complete, on_drop=on_drop)
+    for n in range(50):
+        executor.submit(n)
+    executor.close()
+    assert sorted(done + lost) == list(range(50))
+    assert not set(done) & set(lost)
+    assert all(n % 7 and n % 5 and n != 3 for n in done)
+    stats = executor.stats()
+    assert len(lost) == sum(s["failed"] + s["dropped"] for s in stats.values())
+
+
+def test_batched_stage_gets_lists():
+    done, on_complete = collecting()
+    sizes = []
+
+    def batch(items):
+        sizes.append(len(items))
+        return [x * 10 for x in items]
+
+    executor = StageExecutor([Stage("batch", batch, batch_size=8)], on_complete=on_complete, batch_wait=0.05)
+    for n in range(20):
+        executor.submit(n)
+    executor.close()
+    assert sorted(done) == [n * 10 for n in range(20)]
+    assert max(sizes) <= 8 and sum(sizes) == 20
+
+
+def test_submit_after_close_and_close_twice():
+    executor = StageExecutor([Stage("noop", lambda x: x)])
+    executor.close()
+    executor.close()
+    with pytest.raises(RuntimeError):
+        executor.submit(1)
+
+
+def test_registry_sees_stage_metrics_and_queues_end_empty():
+    registry = MetricsRegistry()
+    executor = StageExecutor([Stage("a", lambda x: x, workers=2), Stage("b", lambda x: x)], registry=registry)
+    for n in range(10):
+        executor.submit(n)
+    executor.close()
+    assert registry.value("stage_items", stage="b", outcome="processed") == 10
+    assert registry.histogram("stage_service_seconds", stage="a").count == 10
+    assert registry.gauge("stage_queue_depth", stage="a") == 0
+    assert registry.gauge("stage_queue_depth", stage="b") == 0
+    assert len(executor.report()) == 2
+
+
+def test_needs_a_stage():
+    with pytest.raises(ValueError):
+        StageExecutor([])
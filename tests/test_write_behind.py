@@ -0,0 +1,82 @@
+import threading
+
+from threat_graph_engine.schemas import EntityType, RelationshipType, ThreatEntity, ThreatRelationship
+from threat_graph_engine.write_behind import WriteBehindWriter
+
+
+class FakePersistor:
+    """Records bulk writes; any batch containing a name in fail_names raises."""
+
+    def __init__(self, fail_names=()):
+        self.fail_names = set(fail_names)
+        self.entity_batches = []
+        self.relationship_batches = []
+
+    def save_entities_bulk(self, entities, batch_size):
+        if self.fail_names & {e.name for e in entities}:
+            raise RuntimeError("entity write failed")
+        self.entity_batches.append([e.name for e in entities])
+        return len(entities)
+
+    def save_relationships_bulk(self, relationships, batch_size):
+        if self.fail_names & {r.source_name for r in relationships}:
+            raise RuntimeError("relationship write failed")
+        self.relationship_batches.append([r.source_name for r in relationships])
+        return len(relationships)
+
+
+def entities(*names):
+    return [ThreatEntity(name=name, type=EntityType.TOOL) for name in names]
+
+
+def relation(source):
+    return ThreatRelationship(source, EntityType.THREAT_ACTOR, "mimikatz", EntityType.TOOL, RelationshipType.USES)
+
+
+def recorder():
+    results, lock = {}, threading.Lock()
+
+    def callback_for(key):
+        def on_written(ok):
+            with lock:
+                results[key] = ok
+        return on_written
+    return results, callback_for
+
+
+def test_callbacks_report_each_submit_separately():
+    persistor = FakePersistor(fail_names={"bad"})
+    results, callback_for = recorder()
+    writer = WriteBehindWriter(persistor, flush_size=100, flush_interval=60)
+    writer.submit(entities("good"), [relation("apt1")], on_written=callback_for("good"))
+    assert writer.flush(timeout=5)
+    writer.submit(entities("bad"), [], on_written=callback_for("bad"))
+    writer.close()
+    assert results == {"good": True, "bad": False}
+    assert persistor.entity_batches == [["good"]] and persistor.relationship_batches == [["apt1"]]
+    assert writer.stats()["failed_flushes"] == 1
+
+
+def test_submit_spanning_flushes_fails_if_any_flush_fails():
+    persistor = FakePersistor(fail_names={"e4"})
+    results, callback_for = recorder()
+    writer = WriteBehindWriter(persistor, flush_size=3, flush_interval=60)
+    writer.submit(entities("e0", "e1", "e2", "e3", "e4"), [], on_written=callback_for("spanning"))
+    writer.flush(timeout=5)
+    writer.submit(entities("e5"), [], on_written=callback_for("later"))
+    writer.close()
+    assert results == {"spanning": False, "later": True}
+    assert persistor.entity_batches == [["e0", "e1", "e2"], ["e5"]]
+
+
+def test_relationship_failure_only_fails_its_submits():
+    persistor = FakePersistor(fail_names={"apt-bad"})
+    results, callback_for = recorder()
+    writer = WriteBehindWriter(persistor, flush_size=100, flush_interval=60)
+    writer.submit(entities("a"), [relation("apt-bad")], on_written=callback_for("bad"))
+    writer.flush(timeout=5)
+    writer.submit([], [], on_written=callback_for("empty"))
+    writer.submit(entities("b"), [relation("apt-ok")], on_written=callback_for("ok"))
+    writer.close()
+    assert results == {"bad": False, "empty": True, "ok": True}
+    assert writer.stats()["entities_written"] == 2 and writer.stats()["relationships_written"] == 1
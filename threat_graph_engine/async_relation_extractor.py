@@ -0,0 +1,292 @@
+"""
+Concurrent LLM relation extraction.
+
+AsyncRelationExtractor keeps many chat completions in flight at once under a
+token bucket (requests/min and tokens/min), honours Retry-After on 429/5xx
+responses by pausing the whole bucket, and coalesces identical in-flight
+requests into a single call. Answers are read from and written to the
+persistent relation cache (llm_cache). RelationEngine runs it on a
+background event loop so synchronous callers (run_pipeline) can submit
+documents and keep doing NER while the LLM calls are outstanding.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from .schemas import ThreatEntity, ThreatRelationship
+from .json_stream import IncrementalJSONArrayParser
+from .relation_extractor import (PROMPT_VERSION, build_prompt, entity_dicts, parse_relations,
+                                 retry_delay, retry_after_seconds)
+from .llm_cache import RelationCache, cache_key, get_relation_cache
+from .llm_clients import LLMClientFactory, get_llm_client_factory
+
+logger = logging.getLogger(__name__)
+
+# Groq free/dev tier defaults for llama-3.3-70b-versatile; raise them for paid tiers
+DEFAULT_RPM = 30
+DEFAULT_TPM = 6000
+DEFAULT_LLM_CONCURRENCY = 8
+DEFAULT_MAX_TOKENS = 1024
+CHARS_PER_TOKEN = 4
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(prompt: str, max_tokens: int = DEFAULT_MAX_TOKENS) -> int:
+    """What a request counts against the tokens/min limit: prompt estimate plus the completion budget."""
+    return len(prompt) // CHARS_PER_TOKEN + max_tokens
+
+
+class TokenBucket:
+    """
+    Two continuously refilling buckets, requests and tokens, each holding at
+    most one minute's allowance. acquire() waits until both can pay.
+    """
+
+    def __init__(self, requests_per_minute: float = DEFAULT_RPM, tokens_per_minute: float = DEFAULT_TPM,
+                 clock=time.monotonic):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._clock = clock
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.waited = 0.0
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_time(self, tokens: float) -> float:
+        self._refill()
+        wait = max(0.0, self._blocked_until - self._clock())
+        if self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+        if self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+        return wait
+
+    async def acquire(self, tokens: int = 0):
+        tokens = min(tokens, self.tpm)  # a single oversized request must still be able to go out
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Serialised so waiters are served in arrival order rather than racing for refills
+        async with self._lock:
+            while True:
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                self.waited += wait
+                await asyncio.sleep(wait)
+            self._requests -= 1
+            self._tokens -= tokens
+
+    def settle(self, reserved: int, used: Optional[int]):
+        """Returns the unused part of a reservation once the real token usage is known."""
+        if used is not None and used < reserved:
+            self._tokens = min(self.tpm, self._tokens + reserved - used)
+
+    def pause(self, seconds: float):
+        """Blocks every caller for seconds (Retry-After applies to the account, not one request)."""
+        self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+class AsyncRelationExtractor:
+    """
+    client is an async OpenAI-compatible SDK client (AsyncGroq, AsyncOpenAI).
+    Prompts (build_prompt) and parsing are shared with the synchronous BaseLLMClient path.
+    """
+
+    def __init__(self, client, model: str, bucket: Optional[TokenBucket] = None,
+                 max_concurrency: int = DEFAULT_LLM_CONCURRENCY, max_retries: int = 3,
+                 temperature: float = 0.3, max_tokens: int = DEFAULT_MAX_TOKENS,
+                 cache: Optional[RelationCache] = None, use_cache: bool = True):
+        self.client = client
+        self.cache = (cache or get_relation_cache()) if use_cache else None
+        self.model = model
+        self.bucket = bucket or TokenBucket()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._stats: Dict[str, float] = {
+            "requests": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failures": 0,
+            "truncated": 0,
+            "tokens_used": 0,
+            "latency_total": 0.0,
+        }
+
+    async def _call_api(self, prompt: str) -> Tuple[Optional[List[dict]], bool]:
+        """
+        Streams the completion through the incremental parser: relation
+        objects are decoded while tokens arrive, and a response cut off at
+        max_tokens still yields the objects it completed. Returns
+        (relations, finished); salvaged truncated answers are not finished.
+        """
+        reserved = estimate_tokens(prompt, self.max_tokens)
+        await self.bucket.acquire(reserved)
+        start = time.perf_counter()
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=True
+        )
+        parser = IncrementalJSONArrayParser()
+        relations: List[dict] = []
+        used = None
+        async for chunk in stream:
+            # Groq reports usage on the last chunk under x_groq, OpenAI-compatible servers under usage
+            usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage is not None:
+                used = getattr(usage, "total_tokens", None)
+            if not chunk.choices:
+                continue
+            content = getattr(chunk.choices[0].delta, "content", None)
+            if content:
+                relations.extend(item for item in parser.feed(content) if isinstance(item, dict))
+        self._stats["latency_total"] += time.perf_counter() - start
+        self.bucket.settle(reserved, used)
+        self._stats["tokens_used"] += used or reserved
+        if parser.complete:
+            return relations, True
+        if relations:
+            self._stats["truncated"] += 1
+            logger.warning(f"LLM response truncated; salvaged {len(relations)} relations")
+            return relations, False
+        return None, False
+
+    async def _extract(self, prompt: str) -> Tuple[Optional[List[dict]], bool]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    self._stats["requests"] += 1
+                    relations, finished = await self._call_api(prompt)
+                    if relations is not None:
+                        return relations, finished
+                    logger.warning(f"Unparseable LLM response on attempt {attempt}")
+                except Exception as e:
+                    status = _status_code(e)
+                    if status is not None and status not in RETRYABLE_STATUS:
+                        logger.error(f"LLM request failed with status {status}: {e}")
+                        break
+                    if attempt == self.max_retries:
+                        logger.error(f"LLM request failed after {attempt} attempts: {e}")
+                        break
+                    delay = retry_delay(e, attempt)
+                    if status == 429 or retry_after_seconds(e) is not None:
+                        self._stats["rate_limited"] += 1
+                        self.bucket.pause(delay)
+                    self._stats["retries"] += 1
+                    logger.warning(f"LLM request failed ({e}); retry {attempt}/{self.max_retries - 1} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+            self._stats["failures"] += 1
+            return None, False
+
+    async def extract(self, text: str, entities: List[ThreatEntity]) -> List[ThreatRelationship]:
+        if not text or not entities:
+            return []
+        entities_sent = entity_dicts(entities)
+        key = cache_key(self.model, PROMPT_VERSION, text, entities_sent)
+        if self.cache is not None:
+            # SQLite I/O runs on a worker thread so it never stalls the other requests on this loop
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return parse_relations(cached)
+        # Identical requests already in flight (duplicate advisories, re-fed chunks) share one call
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._extract_and_cache(key, build_prompt(text, entities_sent)))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        relations = await asyncio.shield(task)
+        return parse_relations(relations) if relations else []
+
+    async def _extract_and_cache(self, key: str, prompt: str) -> Optional[List[dict]]:
+        relations, finished = await self._extract(prompt)
+        # Truncated answers are used for this document but not cached, so the next run asks again
+        if self.cache is not None and finished:
+            await asyncio.to_thread(self.cache.put, key, self.model, relations)
+        return relations
+
+    async def extract_many(self, items: List[tuple]) -> List[List[ThreatRelationship]]:
+        """items: (text, entities) pairs; results come back in the same order."""
+        return await asyncio.gather(*(self.extract(text, entities) for text, entities in items))
+
+    def stats(self) -> Dict[str, float]:
+        stats = {**self._stats, "rate_limit_wait": self.bucket.waited}
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+
+class RelationEngine:
+    """
+    Runs an AsyncRelationExtractor on a dedicated event-loop thread.
+    submit() returns a concurrent.futures.Future immediately, so the caller
+    can carry on with NER for other documents.
+    factory is the LLMClientFactory the extractor's client came from; its
+    async HTTP client is bound to this loop and is closed with the engine.
+    """
+
+    def __init__(self, extractor: AsyncRelationExtractor, factory: Optional[LLMClientFactory] = None):
+        self.extractor = extractor
+        self.factory = factory
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-relations", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str, entities: List[ThreatEntity]) -> "Future[List[ThreatRelationship]]":
+        return asyncio.run_coroutine_threadsafe(self.extractor.extract(text, entities), self._loop)
+
+    def close(self):
+        if not self._loop.is_running():
+            return
+        if self.factory is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self.factory.aclose(), self._loop).result()
+            except Exception as e:
+                logger.warning(f"Closing the async LLM HTTP client failed: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        logger.info(f"LLM relation engine closed: {self.extractor.stats()}")
+
+    def stats(self) -> Dict[str, float]:
+        return self.extractor.stats()
+
+
+def create_groq_engine(api_key: str, model: str = "llama-3.3-70b-versatile",
+                       requests_per_minute: float = DEFAULT_RPM, tokens_per_minute: float = DEFAULT_TPM,
+                       max_concurrency: int = DEFAULT_LLM_CONCURRENCY, use_cache: bool = True) -> RelationEngine:
+    factory = get_llm_client_factory()
+    extractor = AsyncRelationExtractor(factory.async_groq(api_key), model,
+                                       bucket=TokenBucket(requests_per_minute, tokens_per_minute),
+                                       max_concurrency=max_concurrency, use_cache=use_cache)
+    return RelationEngine(extractor, factory)
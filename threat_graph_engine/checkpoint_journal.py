@@ -0,0 +1,230 @@
+"""
+Append-only checkpoint journal for pipeline runs.
+
+Each finished (or failed) document adds one JSON line with its key, status
+and content hash, instead of rewriting the whole processed set every time.
+Loading replays the file once, so startup is linear in its size. A line
+torn by a crash is dropped on load. When the journal holds many superseded
+lines it is compacted: a snapshot goes to a temporary file that is fsynced
+and then renamed over the journal, so the previous state stays on disk
+until the new one is complete.
+
+Only the parent process writes the journal. Pool workers send their results
+back, and a key is marked done only after its rows are in Neo4j. A resumed
+--workers run therefore redoes exactly the documents that were in flight,
+whatever order they finished in.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+FSYNC_ALWAYS = "always"      # fsync after every record: nothing acknowledged is ever lost
+FSYNC_INTERVAL = "interval"  # fsync at most every fsync_interval seconds (and on close)
+FSYNC_NEVER = "never"        # leave it to the OS
+DEFAULT_FSYNC_POLICY = FSYNC_INTERVAL
+DEFAULT_FSYNC_INTERVAL = 1.0
+# Compact once the journal has this many times more lines than live records...
+DEFAULT_COMPACT_RATIO = 2.0
+# ...and at least this many lines, so small journals are left alone
+DEFAULT_COMPACT_MIN_LINES = 10_000
+
+Key = Union[int, str]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _encode(key: Key, record: Tuple[str, Optional[str], float]) -> str:
+    status, digest, timestamp = record
+    return json.dumps({"k": key, "s": status, "h": digest, "t": timestamp},
+                      ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+class CheckpointJournal:
+    """
+    Thread-safe; mark() is called from the write-behind thread as well as the
+    main one. legacy_path is the old processed_records.json (a JSON array of
+    keys), imported as done when no journal exists yet.
+    """
+
+    def __init__(self, path: Union[str, Path], fsync: str = DEFAULT_FSYNC_POLICY,
+                 fsync_interval: float = DEFAULT_FSYNC_INTERVAL, compact_ratio: float = DEFAULT_COMPACT_RATIO,
+                 compact_min_lines: int = DEFAULT_COMPACT_MIN_LINES, legacy_path: Optional[Union[str, Path]] = None):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = Path(path)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_ratio = compact_ratio
+        self.compact_min_lines = compact_min_lines
+        self._lock = threading.Lock()
+        # key -> (status, content hash, unix time of the record)
+        self._records: Dict[Key, Tuple[str, Optional[str], float]] = {}
+        self._lines = 0
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self._stats = {"appends": 0, "compactions": 0, "fsyncs": 0, "torn_lines": 0}
+
+        if self.path.exists():
+            self._replay()
+        elif legacy_path is not None and Path(legacy_path).exists():
+            self._import_legacy(Path(legacy_path))
+        self._file = self.path.open("a", encoding="utf-8")
+        if self._needs_compaction():
+            self.compact()
+
+    def _replay(self):
+        valid_bytes = 0
+        with self.path.open("rb") as f:
+            for raw in f:
+                try:
+                    if not raw.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    entry = json.loads(raw)
+                    self._records[entry["k"]] = (entry["s"], entry.get("h"), entry.get("t", 0.0))
+                except (ValueError, KeyError, TypeError):
+                    # Only the last line can be torn by a crash; anything after it is unreliable too
+                    self._stats["torn_lines"] += 1
+                    logger.warning(f"Checkpoint journal {self.path}: dropping torn record at byte {valid_bytes}")
+                    break
+                valid_bytes += len(raw)
+                self._lines += 1
+        if self._stats["torn_lines"]:
+            with self.path.open("r+b") as f:
+                f.truncate(valid_bytes)
+        logger.info(f"Loaded checkpoint journal {self.path}: {len(self._records)} records from {self._lines} lines.")
+
+    def _import_legacy(self, legacy_path: Path):
+        with legacy_path.open("r") as f:
+            keys = json.load(f)
+        now = round(time.time(), 3)
+        for key in keys:
+            self._records[key] = (STATUS_DONE, None, now)
+        self._write_snapshot()
+        logger.info(f"Imported {len(keys)} processed records from legacy checkpoint {legacy_path}.")
+
+    def status(self, key: Key) -> Optional[str]:
+        with self._lock:
+            record = self._records.get(key)
+        return record[0] if record else None
+
+    def is_done(self, key: Key, digest: Optional[str] = None) -> bool:
+        """Done, and (when both hashes are known) for the same content."""
+        with self._lock:
+            record = self._records.get(key)
+        if record is None or record[0] != STATUS_DONE:
+            return False
+        return digest is None or record[1] is None or record[1] == digest
+
+    def mark(self, key: Key, status: str, digest: Optional[str] = None):
+        record = (status, digest, round(time.time(), 3))
+        line = _encode(key, record)
+        with self._lock:
+            self._records[key] = record
+            self._file.write(line)
+            self._lines += 1
+            self._stats["appends"] += 1
+            self._dirty = True
+            self._sync_locked(force=self.fsync == FSYNC_ALWAYS)
+            if self._needs_compaction():
+                self._compact_locked()
+
+    def mark_done(self, key: Key, digest: Optional[str] = None):
+        self.mark(key, STATUS_DONE, digest)
+
+    def mark_failed(self, key: Key, digest: Optional[str] = None):
+        self.mark(key, STATUS_FAILED, digest)
+
+    def _sync_locked(self, force: bool = False):
+        if not self._dirty:
+            return
+        # Always hand the line to the OS, so a killed process loses nothing; fsync covers power loss
+        self._file.flush()
+        if self.fsync == FSYNC_NEVER and not force:
+            return
+        now = time.monotonic()
+        if force or now - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_sync = now
+            self._dirty = False
+            self._stats["fsyncs"] += 1
+
+    def sync(self):
+        """Flushes and fsyncs whatever has been appended, regardless of policy."""
+        with self._lock:
+            self._sync_locked(force=True)
+
+    def _needs_compaction(self) -> bool:
+        return self._lines >= self.compact_min_lines and self._lines > self.compact_ratio * len(self._records)
+
+    def compact(self):
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        self._file.close()
+        self._write_snapshot()
+        self._file = self.path.open("a", encoding="utf-8")
+        self._dirty = False
+        self._stats["compactions"] += 1
+
+    def _write_snapshot(self):
+        """One line per live record into a temporary file, fsynced, then renamed over the journal."""
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for key, record in self._records.items():
+                f.write(_encode(key, record))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._fsync_directory()
+        self._lines = len(self._records)
+
+    def _fsync_directory(self):
+        # Makes the rename itself durable; directories cannot be opened on Windows
+        try:
+            fd = os.open(self.path.parent, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for status, _, _ in self._records.values():
+                counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "records": len(self._records), "lines": self._lines}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._records)
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync_locked(force=True)
+            if self._needs_compaction():
+                self._compact_locked()
+            self._file.close()
@@ -0,0 +1,248 @@
+"""
+Gazetteer matcher for MITRE ATT&CK software, groups and techniques.
+Every MITRE name and alias is compiled into an Aho-Corasick automaton, so a
+document is matched against all of them in a single linear pass. Hits come out
+as ThreatEntity objects with the MITRE ID already attached.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from .schemas import ThreatEntity, EntityType
+from .mitre_stix_integrator import LOCAL_CACHE_PATH, fetch_mitre_data, mitre_external_id
+
+logger = logging.getLogger(__name__)
+
+# Bump when the automaton layout or term selection changes to invalidate disk caches
+GAZETTEER_VERSION = 1
+GAZETTEER_CACHE_PATH = os.path.splitext(LOCAL_CACHE_PATH)[0] + ".gazetteer.pkl"
+GAZETTEER_CONFIDENCE = 0.95
+MIN_TERM_LENGTH = 3
+
+STIX_TYPE_TO_ENTITY = {
+    "malware": EntityType.MALWARE,
+    "tool": EntityType.TOOL,
+    "intrusion-set": EntityType.THREAT_ACTOR,
+    "attack-pattern": EntityType.TTP,
+}
+
+# ATT&CK software names that are also everyday words and would match almost every advisory
+GAZETTEER_STOPWORDS = {"net", "cmd", "ping", "route", "reg", "ftp", "tor", "at", "page", "mail", "sys", "hole"}
+
+
+class GazetteerEntry(NamedTuple):
+    mitre_id: str
+    name: str
+    entity_type: EntityType
+    description: str
+    urls: Tuple[str, ...]
+    aliases: Tuple[str, ...]
+
+
+class AhoCorasick:
+    """Minimal Aho-Corasick automaton over lowercase strings."""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # For each state: (term length, payload) of every term ending there, via fail links too
+        self.out: List[List[Tuple[int, int]]] = [[]]
+
+    def add(self, term: str, payload: int):
+        state = 0
+        for ch in term:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = nxt
+        self.out[state].append((len(term), payload))
+
+    def build(self):
+        """Compute failure links breadth-first and merge outputs along them."""
+        queue = list(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def iter(self, text: str):
+        """Yields (start, end, payload) for every occurrence of every term in text."""
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, payload in out[state]:
+                yield i + 1 - length, i + 1, payload
+
+
+class MitreGazetteer:
+    """
+    Matches MITRE names/aliases in text with word boundaries, keeping the
+    leftmost-longest hit where candidates overlap.
+    """
+
+    def __init__(self, entries: List[GazetteerEntry], automaton: AhoCorasick):
+        self.entries = entries
+        self.automaton = automaton
+
+    @classmethod
+    def from_stix(cls, mitre_data: dict, min_term_length: int = MIN_TERM_LENGTH) -> "MitreGazetteer":
+        entries: List[GazetteerEntry] = []
+        automaton = AhoCorasick()
+        seen_terms = set()
+
+        for obj in mitre_data.get("objects", []):
+            entity_type = STIX_TYPE_TO_ENTITY.get(obj.get("type"))
+            if entity_type is None or obj.get("revoked") or obj.get("x_mitre_deprecated"):
+                continue
+            mitre_id = mitre_external_id(obj)
+            name = obj.get("name", "")
+            if not mitre_id or not name:
+                continue
+            aliases = tuple(obj.get("x_mitre_aliases", []) or obj.get("aliases", []) or [])
+            entry_idx = len(entries)
+            entries.append(GazetteerEntry(
+                mitre_id=mitre_id,
+                name=name,
+                entity_type=entity_type,
+                description=obj.get("description", ""),
+                urls=tuple(ref.get("url") for ref in obj.get("external_references", []) if ref.get("url")),
+                aliases=aliases,
+            ))
+            for term in (name, *aliases):
+                term = term.strip().lower()
+                if len(term) < min_term_length or term in GAZETTEER_STOPWORDS or term in seen_terms:
+                    continue
+                seen_terms.add(term)
+                automaton.add(term, entry_idx)
+
+        automaton.build()
+        logger.info(f"Built MITRE gazetteer with {len(seen_terms)} terms for {len(entries)} objects.")
+        return cls(entries, automaton)
+
+    def match(self, text: str) -> List[Tuple[int, int, GazetteerEntry]]:
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # A few characters lowercase to several code points; keep offsets aligned with text
+            lowered = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+        candidates = []
+        for start, end, idx in self.automaton.iter(lowered):
+            if start > 0 and (lowered[start - 1].isalnum() or lowered[start - 1] == "_"):
+                continue
+            if end < len(lowered) and (lowered[end].isalnum() or lowered[end] == "_"):
+                continue
+            candidates.append((start, end, idx))
+
+        # Leftmost-longest, non-overlapping
+        candidates.sort(key=lambda c: (c[0], -(c[1] - c[0])))
+        hits = []
+        last_end = -1
+        for start, end, idx in candidates:
+            if start >= last_end:
+                hits.append((start, end, self.entries[idx]))
+                last_end = end
+        return hits
+
+    def extract(self, text: str) -> List[ThreatEntity]:
+        entities = []
+        seen = set()
+        for start, end, entry in self.match(text):
+            surface = text[start:end]
+            key = (surface.lower(), entry.mitre_id)
+            if key in seen:
+                continue
+            seen.add(key)
+            entities.append(ThreatEntity(
+                name=surface,
+                type=entry.entity_type,
+                text=surface,
+                confidence=GAZETTEER_CONFIDENCE,
+                description=entry.description,
+                aliases=list(entry.aliases),
+                mitre_id=entry.mitre_id,
+                mitre_name=entry.name,
+                external_references=list(entry.urls),
+            ))
+        return entities
+
+
+def _source_fingerprint(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return f"{GAZETTEER_VERSION}:{digest.hexdigest()}"
+
+
+def load_gazetteer(cache_path: str = GAZETTEER_CACHE_PATH) -> MitreGazetteer:
+    """
+    Loads the compiled gazetteer from disk, rebuilding it from the MITRE cache
+    when the cached copy is missing or was built from a different bundle.
+    """
+    fingerprint = _source_fingerprint(LOCAL_CACHE_PATH)
+    if fingerprint and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                cached_fingerprint, gazetteer = pickle.load(f)
+            if cached_fingerprint == fingerprint:
+                logger.info("Loaded MITRE gazetteer from disk cache.")
+                return gazetteer
+        except Exception as e:
+            logger.warning(f"Failed to load gazetteer cache, rebuilding: {e}")
+
+    gazetteer = MitreGazetteer.from_stix(fetch_mitre_data())
+    if fingerprint:
+        tmp_path = None
+        try:
+            # A unique temporary name: several spawned --workers may build the cache at once
+            with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(os.path.abspath(cache_path)),
+                                             prefix=os.path.basename(cache_path) + ".", suffix=".tmp",
+                                             delete=False) as f:
+                tmp_path = f.name
+                pickle.dump((fingerprint, gazetteer), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            logger.warning(f"Failed to save gazetteer cache: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return gazetteer
+
+
+_gazetteer: Optional[MitreGazetteer] = None
+_gazetteer_lock = threading.Lock()
+_gazetteer_failed = False
+
+
+def get_gazetteer() -> Optional[MitreGazetteer]:
+    """Process-wide gazetteer, or None if MITRE data is unavailable."""
+    global _gazetteer, _gazetteer_failed
+    if _gazetteer is None and not _gazetteer_failed:
+        with _gazetteer_lock:
+            if _gazetteer is None and not _gazetteer_failed:
+                try:
+                    _gazetteer = load_gazetteer()
+                except Exception as e:
+                    logger.warning(f"MITRE gazetteer unavailable, continuing without it: {e}")
+                    _gazetteer_failed = True
+    return _gazetteer
@@ -1,7 +1,7 @@
 import json, ijson
 import logging
 from pathlib import Path
-from typing import List, Dict, Iterator, Optional
+from typing import List, Dict, Iterator, Optional, Union
 from collections import defaultdict
 import gzip
 from tqdm import tqdm
@@ -16,7 +16,8 @@ class ChunkedThreatLoader:
     """
     Loader for chunked threat JSON data files.
     Efficiently loads large chunked JSON file (optionally compressed),
-    reconstructs full documents by record_id, sorts chunks by chunk_index,
+    reconstructs full documents by record_key (record_id for files chunked
+    before record keys existed), sorts chunks by chunk_index,
     and yields combined documents.
     Handles incomplete or malformed chunks by logging and skipping.
     """
@@ -45,9 +46,47 @@ class ChunkedThreatLoader:
             for chunk in data:
                 yield chunk
 
+    def load_chunks(self) -> List[Dict]:
+        """
+        Loads chunks as standalone documents (no reconstruction), applying the same
+        data quality checks as load_and_reconstruct. Each document keeps its
+        record_id and chunk_index.
+        """
+        documents = []
+        skipped_chunks = 0
+
+        logger.info(f"Start loading chunks from {self.filepath}...")
+
+        for chunk in tqdm(self._stream_chunks(), desc="Loading chunks"):
+            try:
+                rec_id = int(chunk["record_id"])
+                chunk_idx = int(chunk["chunk_index"])
+                text = chunk.get("text", "")
+                if not (text and MIN_TEXT_LENGTH <= len(text) <= MAX_CHUNK_TEXT_LENGTH):
+                    logger.warning(f"Chunk text length out of bounds, skipping record_id {rec_id} chunk {chunk_idx}")
+                    skipped_chunks += 1
+                    continue
+                documents.append({
+                    "record_id": rec_id,
+                    "record_key": chunk.get("record_key"),
+                    "chunk_index": chunk_idx,
+                    "source": chunk.get("source", None),
+                    "type": chunk.get("type", None),
+                    "indicator": chunk.get("indicator", None),
+                    "date": chunk.get("date", None),
+                    "text": text.strip()
+                })
+            except Exception as e:
+                logger.error(f"Skipping malformed chunk: {chunk} Error: {e}")
+                skipped_chunks += 1
+
+        logger.info(f"Loaded {len(documents)} chunk documents, {skipped_chunks} skipped.")
+        return documents
+
     def load_and_reconstruct(self) -> List[Dict]:
-        records_map: Dict[int, Dict] = defaultdict(lambda: {
+        records_map: Dict[Union[str, int], Dict] = defaultdict(lambda: {
             "record_id": None,
+            "record_key": None,
             "source": None,
             "type": None,
             "indicator": None,
@@ -85,10 +124,13 @@ class ChunkedThreatLoader:
                     skipped_chunks += 1
                     continue
 
-                rec_entry = records_map[rec_id]
+                # Content-derived key: the same record keeps it when feed output is reordered
+                rec_key = chunk.get("record_key")
+                rec_entry = records_map[rec_key or rec_id]
                 # Set metadata only once or validate consistency
                 if rec_entry["record_id"] is None:
                     rec_entry["record_id"] = rec_id
+                    rec_entry["record_key"] = rec_key
                     rec_entry["source"] = source
                     rec_entry["type"] = typ
                     rec_entry["indicator"] = indicator
@@ -115,7 +157,8 @@ class ChunkedThreatLoader:
                 rec["text_chunks"].sort(key=lambda x: x[0])
                 full_text = " ".join(chunk[1] for chunk in rec["text_chunks"]).strip()
                 document = {
-                    "record_id": rec_id,
+                    "record_id": rec["record_id"],
+                    "record_key": rec["record_key"],
                     "source": rec["source"],
                     "type": rec["type"],
                     "indicator": rec["indicator"],
@@ -130,15 +173,21 @@ class ChunkedThreatLoader:
         return full_documents
 
 
-def ingest_data(filepath: str) -> List[Dict]:
+def ingest_data(filepath: str, granularity: str = "record") -> List[Dict]:
     """
     Top-level function to ingest chunked threat data from the given JSON file path.
 
     Args:
         filepath (str): Path to the chunked JSON file (.json or .json.gz).
+        granularity (str): "record" to reconstruct full documents, "chunk" to keep
+            one document per chunk.
 
     Returns:
-        List[Dict]: List of reconstructed full threat documents.
+        List[Dict]: List of threat documents at the requested granularity.
     """
     loader = ChunkedThreatLoader(filepath)
+    if granularity == "chunk":
+        return loader.load_chunks()
+    if granularity != "record":
+        raise ValueError(f"Unknown granularity '{granularity}', expected 'record' or 'chunk'.")
     return loader.load_and_reconstruct()
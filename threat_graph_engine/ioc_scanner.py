@@ -0,0 +1,74 @@
+"""
+Single-pass regex scanner for IOCs and well-known threat names.
+All patterns are compiled once into one alternation of named groups, so a
+document is scanned once instead of once per pattern.
+"""
+
+import re
+from typing import List, NamedTuple, Sequence, Set, Tuple
+from .schemas import ThreatEntity, EntityType
+
+# (group name, pattern, entity type, confidence)
+# Order matters: when several patterns match at the same position the first one wins,
+# so longer/more specific patterns come before the generic ones. Patterns starting
+# with \b share a single word-boundary check and are tried after the unanchored ones.
+IOC_PATTERNS: Sequence[Tuple[str, str, EntityType, float]] = (
+    ("cve", r'CVE-\d{4}-\d{4,7}', EntityType.VULNERABILITY, 0.9),
+    ("mitre_technique", r'T\d{4}(?:\.\d{3})?', EntityType.MITRE_TECHNIQUE, 1.0),
+    ("exploit", r'\b(?:EternalBlue|BlueKeep|Heartbleed)\b', EntityType.EXPLOIT, 0.85),
+    ("tool", r'\b(?:Mimikatz|Cobalt Strike|Metasploit|Netcat|Meterpreter)\b', EntityType.TOOL, 0.8),
+    ("script", r'\b[a-zA-Z0-9_]+\.py\b', EntityType.TOOL, 0.75),
+    ("malware", r'\b[\w-]+(?:Stealer|RAT|Malware|Bot)\b', EntityType.MALWARE, 0.8),
+    ("threat_actor", r'\bAPT\d+\b', EntityType.THREAT_ACTOR, 0.85),
+    ("ioc_hash", r'\b[a-fA-F0-9]{32,64}\b', EntityType.INDICATOR, 0.7),  # MD5, SHA256
+    ("ioc_ip", r'\b(?:\d{1,3}\.){3}\d{1,3}\b', EntityType.INDICATOR, 0.7),
+)
+
+
+class IOCMatch(NamedTuple):
+    kind: str
+    value: str
+    start: int
+    end: int
+    type: EntityType
+    confidence: float
+
+
+class IOCScanner:
+    """
+    Compiled IOC scanner. Matches never overlap (the combined regex resumes after
+    each hit) and repeated values of the same type are reported once.
+    """
+
+    def __init__(self, patterns: Sequence[Tuple[str, str, EntityType, float]] = IOC_PATTERNS,
+                 flags: int = re.IGNORECASE):
+        self._kinds = {name: (ent_type, confidence) for name, _, ent_type, confidence in patterns}
+        unanchored = [f"(?P<{name}>{pattern})" for name, pattern, _, _ in patterns if not pattern.startswith(r"\b")]
+        anchored = [f"(?P<{name}>{pattern[2:]})" for name, pattern, _, _ in patterns if pattern.startswith(r"\b")]
+        # Hoisting \b out of the word-anchored branches lets mid-word positions fail after one check
+        if anchored:
+            unanchored.append(r"\b(?:" + "|".join(anchored) + ")")
+        self._regex = re.compile("|".join(unanchored), flags)
+
+    def scan(self, text: str) -> List[IOCMatch]:
+        matches: List[IOCMatch] = []
+        seen: Set[Tuple[str, EntityType]] = set()
+        for match in self._regex.finditer(text):
+            kind = match.lastgroup
+            ent_type, confidence = self._kinds[kind]
+            value = match.group()
+            key = (value.lower(), ent_type)
+            if key in seen:
+                continue
+            seen.add(key)
+            matches.append(IOCMatch(kind, value, match.start(), match.end(), ent_type, confidence))
+        return matches
+
+    def extract(self, text: str) -> List[ThreatEntity]:
+        return [
+            ThreatEntity(name=m.value, type=m.type, text=m.value, confidence=m.confidence)
+            for m in self.scan(text)
+        ]
+
+
+IOC_SCANNER = IOCScanner()
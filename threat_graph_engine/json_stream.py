@@ -0,0 +1,175 @@
+"""
+Incremental parser for the JSON arrays LLMs return.
+
+Text is fed in chunks as it streams in. Each top-level array element is
+decoded as soon as its closing bracket arrives, so callers can act on
+relation objects before the completion finishes. If the response is cut
+off (max_tokens, dropped stream), everything completed so far is kept.
+Every character is scanned once, so parsing is linear in the response length.
+"""
+
+import json
+import logging
+from typing import Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_OPENERS = {"[": "]", "{": "}"}
+
+
+class IncrementalJSONArrayParser:
+    """
+    Finds the first JSON array of objects in the text (skipping prose or
+    ``` fences before it) and emits its elements. Until an object has been
+    emitted, an element that is not valid JSON or not an object abandons
+    that array and the search resumes after it, so a stray "[see below]" or
+    "Step [1]" in the preamble does not hide the real answer. An empty
+    array is a complete answer.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._element_start: Optional[int] = None
+        self.complete = False
+        self.emitted = 0
+
+    def feed(self, chunk: str) -> List[object]:
+        """Adds text; returns the elements completed by it."""
+        if self.complete or not chunk:
+            return []
+        self._buffer += chunk
+        out = []
+        buf = self._buffer
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            c = buf[i]
+            if not self._in_array:
+                if c == "[":
+                    self._in_array = True
+                    self._stack = []
+                    self._element_start = None
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                i += 1
+                continue
+
+            if not self._stack:
+                # Between elements at array level
+                if c == "]":
+                    if self._element_start is not None:
+                        self._finish_scalar(buf[self._element_start:i], out)
+                        if not self._in_array:
+                            i += 1
+                            continue
+                    self.complete = True
+                    self._pos = i + 1
+                    self._trim()
+                    return out
+                if c == ",":
+                    if self._element_start is not None:
+                        self._finish_scalar(buf[self._element_start:i], out)
+                        self._element_start = None
+                elif c in _OPENERS:
+                    self._element_start = i
+                    self._stack.append(_OPENERS[c])
+                elif c == '"':
+                    self._element_start = i
+                    self._in_string = True
+                elif not c.isspace() and self._element_start is None:
+                    self._element_start = i
+                i += 1
+                continue
+
+            if c == '"':
+                self._in_string = True
+            elif c in _OPENERS:
+                self._stack.append(_OPENERS[c])
+            elif c == self._stack[-1]:
+                self._stack.pop()
+                if not self._stack:
+                    self._finish(buf[self._element_start:i + 1], out)
+                    self._element_start = None
+            elif c in "]}":
+                # Mismatched bracket: not JSON after all, look for the next array
+                self._reset_search()
+            i += 1
+
+        self._pos = i
+        self._trim()
+        return out
+
+    def _finish(self, text: str, out: list):
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            if self.emitted == 0:
+                self._reset_search()
+            else:
+                logger.warning(f"Skipping malformed array element: {text[:80]!r}")
+            return
+        if self.emitted == 0 and not isinstance(value, dict):
+            self._reset_search()
+            return
+        out.append(value)
+        self.emitted += 1
+
+    def _finish_scalar(self, text: str, out: list):
+        text = text.strip()
+        if text:
+            self._finish(text, out)
+
+    def _reset_search(self):
+        self._in_array = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._element_start = None
+
+    def _trim(self):
+        # Drop consumed text, keeping any element still being read
+        keep = self._element_start if self._element_start is not None else self._pos
+        if keep > 4096:
+            self._buffer = self._buffer[keep:]
+            self._pos -= keep
+            if self._element_start is not None:
+                self._element_start = 0
+
+    @property
+    def started(self) -> bool:
+        return self._in_array or self.complete
+
+
+def iter_json_array(chunks: Iterable[str], parser: Optional[IncrementalJSONArrayParser] = None) -> Iterator[object]:
+    """Yields array elements from streamed text chunks as they complete."""
+    parser = parser or IncrementalJSONArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+
+
+def parse_json_array(text: str) -> Optional[List[object]]:
+    """
+    Whole-text convenience: the elements of the first JSON array of objects in text.
+    A truncated array returns the elements completed before the cut;
+    None when no array element could be recovered at all.
+    """
+    parser = IncrementalJSONArrayParser()
+    items = parser.feed(text)
+    if parser.complete or items:
+        if not parser.complete:
+            logger.warning(f"JSON array was truncated; salvaged {len(items)} complete elements")
+        return items
+    return None
@@ -0,0 +1,148 @@
+"""
+Persistent, content-addressed cache for LLM relation extraction.
+
+Entries are keyed by a SHA-256 over (model, prompt template version, text,
+entity list), so a re-run only pays for documents whose text or entities
+changed, and bumping the model or PROMPT_VERSION invalidates everything
+at once. Values are the parsed relation dicts as returned by the LLM.
+Stored in SQLite (WAL mode), so every process of a --workers run can share
+one file.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_relations_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 200_000
+DEFAULT_MAX_AGE_DAYS = 90.0
+# Evict at most once per this many writes; eviction scans the last_used index
+EVICT_EVERY = 500
+
+
+def cache_key(model: str, prompt_version: str, text: str, entities: List[dict]) -> str:
+    """Order-insensitive in the entities, which NER may emit in any order."""
+    entity_keys = sorted({(str(e["name"]), str(getattr(e["type"], "value", e["type"]))) for e in entities})
+    payload = json.dumps([model, prompt_version, text, entity_keys], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RelationCache:
+    """
+    get/put are thread-safe. Entries older than max_age_days are treated as
+    misses and deleted; beyond max_entries the least recently used go first.
+    """
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_age_days: Optional[float] = DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS relations ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, relations TEXT NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS relations_last_used ON relations (last_used)")
+        self._writes_since_evict = 0
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "expired": 0, "evicted": 0}
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT relations, created FROM relations WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                self._conn.execute("DELETE FROM relations WHERE key = ?", (key,))
+                self._stats["expired"] += 1
+                row = None
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE relations SET last_used = ? WHERE key = ?", (now, key))
+            self._stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, relations: List[dict]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO relations (key, model, relations, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, json.dumps(relations, ensure_ascii=False), now, now))
+            self._stats["writes"] += 1
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= EVICT_EVERY:
+                self._evict_locked(now)
+
+    def evict(self) -> int:
+        with self._lock:
+            return self._evict_locked(time.time())
+
+    def _evict_locked(self, now: float) -> int:
+        self._writes_since_evict = 0
+        removed = 0
+        if self.max_age is not None:
+            removed += self._conn.execute("DELETE FROM relations WHERE created < ?", (now - self.max_age,)).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM relations").fetchone()[0]
+        if count > self.max_entries:
+            removed += self._conn.execute(
+                "DELETE FROM relations WHERE key IN (SELECT key FROM relations ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)).rowcount
+        self._stats["evicted"] += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM relations")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM relations").fetchone()[0]
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        return {**stats, "entries": entries, "hit_rate": stats["hits"] / lookups if lookups else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[RelationCache] = None
+_cache_config = {"enabled": True, "path": DEFAULT_LLM_CACHE_PATH, "max_entries": DEFAULT_MAX_ENTRIES,
+                 "max_age_days": DEFAULT_MAX_AGE_DAYS}
+_cache_lock = threading.Lock()
+
+
+def configure_relation_cache(enabled: bool = True, path: str = DEFAULT_LLM_CACHE_PATH,
+                             max_entries: int = DEFAULT_MAX_ENTRIES,
+                             max_age_days: Optional[float] = DEFAULT_MAX_AGE_DAYS):
+    """Sets what get_relation_cache() returns; enabled=False bypasses the cache entirely."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+        _cache_config.update(enabled=enabled, path=path, max_entries=max_entries, max_age_days=max_age_days)
+
+
+def get_relation_cache() -> Optional[RelationCache]:
+    """The process-wide cache, opened lazily; None when disabled or unusable."""
+    global _cache
+    with _cache_lock:
+        if _cache is None and _cache_config["enabled"]:
+            try:
+                _cache = RelationCache(_cache_config["path"], _cache_config["max_entries"],
+                                       _cache_config["max_age_days"])
+            except sqlite3.Error as e:
+                logger.error(f"LLM relation cache at {_cache_config['path']} unavailable, continuing without: {e}")
+                _cache_config["enabled"] = False
+        return _cache
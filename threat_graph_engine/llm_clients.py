@@ -0,0 +1,171 @@
+"""
+Shared LLM client factory.
+
+SDK clients (Groq, OpenAI-compatible, Cohere) are created once per
+(provider, key, base URL) and all sit on the same pooled httpx transport, so
+TLS sessions and keep-alive connections survive across documents instead of
+being rebuilt for every request. Timeouts and pool limits come from one
+LLMClientConfig.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+from groq import Groq, AsyncGroq
+from openai import OpenAI
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LLMClientConfig:
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 10.0
+    # Retries done inside the SDKs; our own retry/backoff layers sit on top
+    sdk_max_retries: int = 0
+
+    @classmethod
+    def from_env(cls) -> "LLMClientConfig":
+        """LLM_MAX_CONNECTIONS, LLM_READ_TIMEOUT, ... override the defaults."""
+        config = cls()
+        for name, default in vars(cls()).items():
+            value = os.getenv(f"LLM_{name.upper()}")
+            if value is not None:
+                setattr(config, name, type(default)(value))
+        return config
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout,
+                             write=self.write_timeout, pool=self.pool_timeout)
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_keepalive_connections,
+                            keepalive_expiry=self.keepalive_expiry)
+
+
+class LLMClientFactory:
+    """
+    Thread-safe. The sync httpx.Client is shared by every sync SDK client;
+    the httpx.AsyncClient is shared by the async ones and must only be used
+    from a single event loop (RelationEngine's).
+    """
+
+    def __init__(self, config: Optional[LLMClientConfig] = None):
+        self.config = config or LLMClientConfig()
+        self._lock = threading.Lock()
+        self._http: Optional[httpx.Client] = None
+        self._async_http: Optional[httpx.AsyncClient] = None
+        self._clients: Dict[Tuple[str, Optional[str], Optional[str]], object] = {}
+
+    def http_client(self) -> httpx.Client:
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client(timeout=self.config.timeout(), limits=self.config.limits())
+            return self._http
+
+    def async_http_client(self) -> httpx.AsyncClient:
+        with self._lock:
+            if self._async_http is None:
+                self._async_http = httpx.AsyncClient(timeout=self.config.timeout(), limits=self.config.limits())
+            return self._async_http
+
+    def _get(self, key: Tuple[str, Optional[str], Optional[str]], build):
+        with self._lock:
+            client = self._clients.get(key)
+        if client is None:
+            client = build()
+            with self._lock:
+                client = self._clients.setdefault(key, client)
+        return client
+
+    def groq(self, api_key: Optional[str] = None):
+        return self._get(("groq", api_key, None), lambda: Groq(
+            api_key=api_key, http_client=self.http_client(), timeout=self.config.timeout(),
+            max_retries=self.config.sdk_max_retries))
+
+    def async_groq(self, api_key: Optional[str] = None):
+        return self._get(("async_groq", api_key, None), lambda: AsyncGroq(
+            api_key=api_key, http_client=self.async_http_client(), timeout=self.config.timeout(),
+            max_retries=self.config.sdk_max_retries))
+
+    def openai(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        """Any OpenAI-compatible endpoint (LM Studio, vLLM, the benchmark stub)."""
+        return self._get(("openai", api_key, base_url), lambda: OpenAI(
+            base_url=base_url, api_key=api_key, http_client=self.http_client(), timeout=self.config.timeout(),
+            max_retries=self.config.sdk_max_retries))
+
+    def cohere(self, api_key: Optional[str] = None):
+        # Only the defense agents use Cohere; the KG pipeline does not need it installed
+        from cohere import Client as CohereClient
+        def build():
+            try:
+                return CohereClient(api_key, httpx_client=self.http_client(), timeout=self.config.read_timeout)
+            except TypeError:
+                # cohere < 5 manages its own session and cannot take an httpx client
+                return CohereClient(api_key)
+        return self._get(("cohere", api_key, None), build)
+
+    async def aclose(self):
+        """Closes the httpx.AsyncClient and the async SDK clients on it; await it on the loop that used them."""
+        with self._lock:
+            async_http, self._async_http = self._async_http, None
+            for key in [key for key in self._clients if key[0].startswith("async_")]:
+                del self._clients[key]
+        if async_http is not None:
+            await async_http.aclose()
+
+    def close(self):
+        """
+        Closes every client. An httpx.AsyncClient still open (aclose() not
+        awaited) is closed as a task on the running loop, or with asyncio.run
+        when called outside one.
+        """
+        with self._lock:
+            http, self._http = self._http, None
+            async_http, self._async_http = self._async_http, None
+            self._clients.clear()
+        if http is not None:
+            http.close()
+        if async_http is not None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            try:
+                if loop is not None:
+                    loop.create_task(async_http.aclose())
+                else:
+                    asyncio.run(async_http.aclose())
+            except Exception as e:
+                logger.warning(f"Closing the async LLM HTTP client failed: {e}")
+
+
+_factory: Optional[LLMClientFactory] = None
+_factory_lock = threading.Lock()
+
+
+def configure_llm_clients(config: LLMClientConfig) -> LLMClientFactory:
+    """Replaces the process-wide factory; clients handed out earlier keep working until closed."""
+    global _factory
+    with _factory_lock:
+        _factory = LLMClientFactory(config)
+        return _factory
+
+
+def get_llm_client_factory() -> LLMClientFactory:
+    global _factory
+    with _factory_lock:
+        if _factory is None:
+            _factory = LLMClientFactory(LLMClientConfig.from_env())
+        return _factory
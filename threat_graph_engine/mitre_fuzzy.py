@@ -0,0 +1,87 @@
+"""
+Approximate MITRE name/alias matching backed by a character trigram inverted index.
+Used when an entity has no exact ID/name/alias hit, e.g. "cobalt strike beacon"
+or "spear-phishing attachments".
+"""
+
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FUZZY_THRESHOLD = 0.8
+DEFAULT_FUZZY_BUDGET_MS = 5.0
+SIZE_EPSILON = 1e-9
+
+
+def normalize_fuzzy(text: str) -> str:
+    """Lowercase, turn punctuation into spaces and collapse whitespace."""
+    return " ".join("".join(c if c.isalnum() else " " for c in text.lower()).split())
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Inverted index from character trigrams to terms. Candidates are scored with
+    the Dice coefficient of their trigram sets: 2 * |common| / (|query| + |term|).
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: List[str] = []
+        self.sizes: List[int] = []
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        seen = set()
+        for term in terms:
+            normalized = normalize_fuzzy(term)
+            if not normalized or normalized in seen:
+                continue
+            seen.add(normalized)
+            term_id = len(self.terms)
+            grams = trigrams(normalized)
+            self.terms.append(term)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(term_id)
+        self.postings = dict(self.postings)
+        logger.info(f"Built MITRE trigram index: {len(self.terms)} terms, {len(self.postings)} trigrams.")
+
+    def search(self, query: str, threshold: float = DEFAULT_FUZZY_THRESHOLD, top_k: int = 5,
+               budget_ms: Optional[float] = DEFAULT_FUZZY_BUDGET_MS) -> List[Tuple[str, float]]:
+        """
+        Ranked (term, score) candidates with score >= threshold.
+        Posting lists are walked rarest-first; when the latency budget runs out the
+        best candidates found so far are returned.
+        """
+        normalized = normalize_fuzzy(query)
+        if not normalized:
+            return []
+        grams = trigrams(normalized)
+        q_size = len(grams)
+        # Dice >= threshold requires the term size to lie within these bounds
+        # (with a little slack, so float rounding cannot prune a score exactly at the threshold)
+        min_size = threshold * q_size / (2 - threshold) - SIZE_EPSILON if threshold < 2 else q_size
+        max_size = (2 - threshold) * q_size / threshold + SIZE_EPSILON if threshold > 0 else float("inf")
+
+        deadline = time.perf_counter() + budget_ms / 1000 if budget_ms else None
+        counts: Dict[int, int] = defaultdict(int)
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            if deadline and time.perf_counter() > deadline:
+                logger.debug(f"Fuzzy MITRE search for '{query}' hit its {budget_ms}ms budget.")
+                break
+            for term_id in self.postings.get(gram, ()):
+                if min_size <= self.sizes[term_id] <= max_size:
+                    counts[term_id] += 1
+
+        scored = []
+        for term_id, common in counts.items():
+            score = 2 * common / (q_size + self.sizes[term_id])
+            if score >= threshold:
+                scored.append((self.terms[term_id], round(score, 4)))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:top_k]
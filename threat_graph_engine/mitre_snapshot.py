@@ -0,0 +1,274 @@
+"""
+Compact, memory-mapped snapshot of the MITRE ATT&CK STIX bundle.
+
+Only the fields enrichment uses (ID, name, type, description, URLs, aliases)
+are kept. The file is a header followed by fixed-size tables and a UTF-8
+string blob, so opening it is an mmap plus one header unpack; strings are
+decoded only when a lookup actually returns them.
+
+Layout (little-endian):
+    header   HEADER
+    records  n_records x RECORD   (string ids + ranges into the list table)
+    lists    n_lists x u32        (string ids of URLs and aliases)
+    keys     n_keys x KEY         (lookup key string id -> record), sorted by key bytes
+    offsets  (n_strings + 1) x u32 (byte offsets into the blob)
+    blob     UTF-8 strings
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from .mitre_stix_integrator import (
+    LOCAL_CACHE_PATH, MitreLookup, fetch_mitre_data, mitre_object_aliases,
+    mitre_object_info, normalize_mitre_name,
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"MTRSNAP\0"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PATH = os.path.splitext(LOCAL_CACHE_PATH)[0] + ".snapshot"
+
+# magic, version, n_records, n_lists, n_keys, n_strings, source sha256, source size, source mtime_ns
+HEADER = struct.Struct("<8sIIIII32sQQ")
+# mitre_id, name, type, description, urls start, urls count, aliases start, aliases count
+RECORD = struct.Struct("<8I")
+# key string id, record id
+KEY = struct.Struct("<II")
+U32 = struct.Struct("<I")
+
+
+def _sha256_file(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def compile_snapshot(mitre_data: dict, output_path: str, source_path: Optional[str] = None) -> str:
+    """
+    Writes a snapshot of mitre_data to output_path (atomically).
+    source_path is the bundle file the data came from; its hash, size and mtime
+    are recorded so stale snapshots can be detected.
+    """
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        idx = string_ids.get(value)
+        if idx is None:
+            idx = len(strings)
+            string_ids[value] = idx
+            strings.append(value)
+        return idx
+
+    intern("")
+    records: List[Tuple[int, ...]] = []
+    lists: List[int] = []
+    keys: Dict[str, int] = {}
+
+    for obj in mitre_data.get("objects", []):
+        info = mitre_object_info(obj)
+        if not info["mitre_id"] and not info["name"]:
+            continue
+        aliases = mitre_object_aliases(obj)
+        record_id = len(records)
+        urls_start = len(lists)
+        lists.extend(intern(url) for url in info["external_references"])
+        aliases_start = len(lists)
+        lists.extend(intern(alias) for alias in aliases)
+        records.append((intern(info["mitre_id"]), intern(info["name"]), intern(info["type"]),
+                        intern(info["description"]), urls_start, len(info["external_references"]),
+                        aliases_start, len(aliases)))
+        # Same precedence as MitreIndex: IDs first, first object wins
+        if info["mitre_id"]:
+            keys.setdefault("id:" + info["mitre_id"].upper(), record_id)
+        for name in (info["name"], *aliases):
+            if name:
+                keys.setdefault("name:" + normalize_mitre_name(name), record_id)
+
+    sorted_keys = sorted(((key.encode("utf-8"), intern(key), rec) for key, rec in keys.items()))
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    if source_path and os.path.exists(source_path):
+        stat = os.stat(source_path)
+        source_hash, source_size, source_mtime = _sha256_file(source_path), stat.st_size, stat.st_mtime_ns
+    else:
+        source_hash, source_size, source_mtime = b"\0" * 32, 0, 0
+
+    # A unique temporary name: several spawned --workers may compile the snapshot at once
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(os.path.abspath(output_path)),
+                                         prefix=os.path.basename(output_path) + ".", suffix=".tmp",
+                                         delete=False) as f:
+            tmp_path = f.name
+            f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(records), len(lists), len(sorted_keys),
+                                len(strings), source_hash, source_size, source_mtime))
+            for record in records:
+                f.write(RECORD.pack(*record))
+            f.write(struct.pack(f"<{len(lists)}I", *lists))
+            for _, key_id, record_id in sorted_keys:
+                f.write(KEY.pack(key_id, record_id))
+            f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+            f.write(b"".join(encoded))
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(f"Compiled MITRE snapshot {output_path}: {len(records)} records, {len(strings)} strings, "
+                f"{os.path.getsize(output_path) / 1024:.0f} KiB.")
+    return output_path
+
+
+class MitreSnapshot(MitreLookup):
+    """Read-only view over a snapshot file; lookups binary-search the mmapped key table."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.n_records, self.n_lists, self.n_keys, self.n_strings,
+         self.source_hash, self.source_size, self.source_mtime) = HEADER.unpack_from(self._buf, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} MITRE snapshot")
+        self._records_at = HEADER.size
+        self._lists_at = self._records_at + self.n_records * RECORD.size
+        self._keys_at = self._lists_at + self.n_lists * U32.size
+        self._offsets_at = self._keys_at + self.n_keys * KEY.size
+        self._blob_at = self._offsets_at + (self.n_strings + 1) * U32.size
+
+    def close(self):
+        self._buf.close()
+        self._file.close()
+
+    def _string_bytes(self, idx: int) -> bytes:
+        start, end = struct.unpack_from("<II", self._buf, self._offsets_at + idx * U32.size)
+        return self._buf[self._blob_at + start:self._blob_at + end]
+
+    def _string(self, idx: int) -> str:
+        return self._string_bytes(idx).decode("utf-8")
+
+    def _list(self, start: int, count: int) -> List[str]:
+        ids = struct.unpack_from(f"<{count}I", self._buf, self._lists_at + start * U32.size)
+        return [self._string(i) for i in ids]
+
+    def _find_record(self, key: str) -> Optional[int]:
+        target = key.encode("utf-8")
+        lo, hi = 0, self.n_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_id, record_id = KEY.unpack_from(self._buf, self._keys_at + mid * KEY.size)
+            current = self._string_bytes(key_id)
+            if current == target:
+                return record_id
+            if current < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def record(self, record_id: int) -> dict:
+        mitre_id, name, typ, description, urls_start, urls_count, _, _ = RECORD.unpack_from(
+            self._buf, self._records_at + record_id * RECORD.size)
+        return {
+            "mitre_id": self._string(mitre_id),
+            "description": self._string(description),
+            "external_references": self._list(urls_start, urls_count),
+            "type": self._string(typ),
+            "name": self._string(name)
+        }
+
+    def aliases(self, record_id: int) -> List[str]:
+        *_, aliases_start, aliases_count = RECORD.unpack_from(self._buf, self._records_at + record_id * RECORD.size)
+        return self._list(aliases_start, aliases_count)
+
+    def names(self) -> Iterable[str]:
+        prefix = b"name:"
+        for i in range(self.n_keys):
+            key_id, _ = KEY.unpack_from(self._buf, self._keys_at + i * KEY.size)
+            key = self._string_bytes(key_id)
+            if key.startswith(prefix):
+                yield key[len(prefix):].decode("utf-8")
+
+    def lookup(self, name: str) -> Optional[dict]:
+        """Exact lookup by ATT&CK ID, then by name or alias (case and whitespace insensitive)."""
+        if not name:
+            return None
+        record_id = self._find_record("id:" + name.strip().upper())
+        if record_id is None:
+            record_id = self._find_record("name:" + normalize_mitre_name(name))
+        return self.record(record_id) if record_id is not None else None
+
+    def is_current(self, source_path: str) -> bool:
+        """True if the snapshot was compiled from the current contents of source_path."""
+        if not os.path.exists(source_path):
+            # Nothing to compare against; keep serving the snapshot we have
+            return True
+        stat = os.stat(source_path)
+        if stat.st_size == self.source_size and stat.st_mtime_ns == self.source_mtime:
+            return True
+        return stat.st_size == self.source_size and _sha256_file(source_path) == self.source_hash
+
+
+def load_mitre_snapshot(snapshot_path: str = SNAPSHOT_PATH, source_path: str = LOCAL_CACHE_PATH) -> MitreSnapshot:
+    """
+    Opens the snapshot, compiling it first if it is missing, unreadable, or was
+    built from a different version of the source bundle.
+    """
+    if os.path.exists(snapshot_path):
+        try:
+            snapshot = MitreSnapshot(snapshot_path)
+            if snapshot.is_current(source_path):
+                return snapshot
+            logger.info("MITRE bundle changed since the snapshot was compiled; rebuilding.")
+            snapshot.close()
+        except Exception as e:
+            logger.warning(f"Failed to open MITRE snapshot, rebuilding: {e}")
+
+    compile_snapshot(fetch_mitre_data(), snapshot_path, source_path=source_path)
+    return MitreSnapshot(snapshot_path)
+
+
+_snapshot: Optional[MitreSnapshot] = None
+_snapshot_lock = threading.Lock()
+_snapshot_failed = False
+
+
+def get_mitre_snapshot() -> Optional[MitreSnapshot]:
+    """Process-wide snapshot of the local MITRE bundle, or None if it cannot be built."""
+    global _snapshot, _snapshot_failed
+    if _snapshot is None and not _snapshot_failed:
+        with _snapshot_lock:
+            if _snapshot is None and not _snapshot_failed:
+                try:
+                    _snapshot = load_mitre_snapshot()
+                except Exception as e:
+                    logger.warning(f"MITRE snapshot unavailable, falling back to the in-memory index: {e}")
+                    _snapshot_failed = True
+    return _snapshot
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile the MITRE STIX bundle into a compact snapshot")
+    parser.add_argument("--source", default=LOCAL_CACHE_PATH, help="STIX bundle JSON file")
+    parser.add_argument("--output", default=SNAPSHOT_PATH, help="Snapshot file to write")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import json
+    with open(args.source, "r", encoding="utf-8") as f:
+        compile_snapshot(json.load(f), args.output, source_path=args.source)
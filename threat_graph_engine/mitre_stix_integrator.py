@@ -1,8 +1,11 @@
-from typing import List, Optional
-from .schemas import ThreatEntity
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .schemas import EntityType, ThreatEntity
+from .mitre_fuzzy import TrigramIndex, DEFAULT_FUZZY_THRESHOLD, DEFAULT_FUZZY_BUDGET_MS
 import logging
 import os
 import json
+import re
+import threading
 import requests
 from cachetools import TTLCache, cached
 from pathlib import Path
@@ -18,6 +21,19 @@ LOCAL_CACHE_PATH = r"D:\Tiny_threat_dashboard\processed\mitre_attack_cache.json"
 # MITRE ATT&CK TAXII API or equivalent URL to fetch STIX data (replace with actual URL if needed)
 MITRE_STIX_API_URL = "https://cti-taxii.mitre.org/stix/collections/95ecc380-afe9-11e4-9b6c-751b66dd541e/objects"
 
+# Entity types that get MITRE enrichment
+MITRE_ENRICHED_TYPES = {"ttp", "technique", "tactic", EntityType.MITRE_TECHNIQUE.value}
+# ATT&CK technique / sub-technique IDs as the IOC scanner emits them
+MITRE_TECHNIQUE_ID = re.compile(r"T\d{4}(?:\.\d{3})?", re.IGNORECASE)
+# Software entity types; these only resolve to MITRE software objects, so a
+# tool name cannot (fuzzily) land on a technique
+MITRE_SOFTWARE_TYPES = {"tool", "malware"}
+MITRE_SOFTWARE_OBJECT_TYPES = {"tool", "malware"}
+# Fuzzy candidates checked for an allowed object type before giving up
+FUZZY_TYPED_CANDIDATES = 5
+
+_fuzzy_index_lock = threading.Lock()
+
 def load_local_cache() -> Optional[dict]:
     """Load cached MITRE data from local file if exists."""
     if os.path.exists(LOCAL_CACHE_PATH):
@@ -53,61 +69,189 @@ def fetch_mitre_data() -> dict:
         logger.critical(error_msg)
         raise FileNotFoundError(error_msg) # Raise an error if no local cache is found
         
-def find_mitre_info(name: str, mitre_data: dict) -> Optional[dict]:
-    """
-    Lookup MITRE technique or tactic info by name or ID from loaded STIX data.
-    Name matching logic can be adapted as needed.
-    """
-    if not mitre_data or "objects" not in mitre_data:
-        return None
-
-    name_upper = name.upper()
-    for obj in mitre_data["objects"]:
-        # Example: match on 'external_references' or 'name' fields
-        ext_refs = obj.get("external_references", [])
-        mitre_id = None
-        for ref in ext_refs:
-            if ref.get("source_name") == "mitre-attack":
-                mitre_id = ref.get("external_id")
-                break
-        if mitre_id and mitre_id.upper() == name_upper:
-            return {
-                "mitre_id": mitre_id,
-                "description": obj.get("description", ""),
-                "external_references": [ref.get("url") for ref in ext_refs if ref.get("url")],
-                "type": obj.get("type", ""),
-                "name": obj.get("name", "")
-            }
-        # Also match by name string (case insensitive)
-        if obj.get("name", "").upper() == name_upper:
-            return {
-                "mitre_id": mitre_id or "",
-                "description": obj.get("description", ""),
-                "external_references": [ref.get("url") for ref in ext_refs if ref.get("url")],
-                "type": obj.get("type", ""),
-                "name": obj.get("name", "")
-            }
+def mitre_external_id(obj: dict) -> Optional[str]:
+    """ATT&CK ID (e.g. T1566.001, S0002) of a STIX object, if any."""
+    for ref in obj.get("external_references", []):
+        if ref.get("source_name") == "mitre-attack":
+            return ref.get("external_id")
     return None
 
-def enrich_entities_with_mitre_stix(entities: List[ThreatEntity]) -> List[ThreatEntity]:
-    """
-    Enrich ThreatEntity list with MITRE ATT&CK data if applicable.
-    Supports TTP, technique, tactic types.
-    Falls back gracefully if MITRE data not available.
-    """
-    mitre_data = fetch_mitre_data()
-    enriched_entities = []
+def normalize_mitre_name(name: str) -> str:
+    return " ".join(name.lower().split())
 
-    for entity in entities:
-        if entity.type.lower() in {"ttp", "technique", "tactic"}:
-            mitre_info = find_mitre_info(entity.name, mitre_data)
+def mitre_object_info(obj: dict) -> dict:
+    """The fields enrichment uses from a STIX object, in the shape find_mitre_info returns."""
+    return {
+        "mitre_id": mitre_external_id(obj) or "",
+        "description": obj.get("description", ""),
+        "external_references": [ref.get("url") for ref in obj.get("external_references", []) if ref.get("url")],
+        "type": obj.get("type", ""),
+        "name": obj.get("name", "")
+    }
+
+def mitre_object_aliases(obj: dict) -> List[str]:
+    return obj.get("x_mitre_aliases", []) or obj.get("aliases", []) or []
+
+class MitreLookup:
+    """Shared enrichment logic for MITRE lookup structures; subclasses implement lookup()."""
+
+    def lookup(self, name: str) -> Optional[dict]:
+        raise NotImplementedError("Must be implemented by subclass.")
+
+    def parent(self, mitre_id: str) -> Optional[dict]:
+        """Parent technique info of a sub-technique ID (T1566.001 -> T1566)."""
+        if not mitre_id or "." not in mitre_id:
+            return None
+        return self.lookup(mitre_id.split(".", 1)[0])
+
+    def names(self) -> Iterable[str]:
+        """Every normalized name and alias lookup() resolves."""
+        raise NotImplementedError("Must be implemented by subclass.")
+
+    def fuzzy_index(self) -> TrigramIndex:
+        """Trigram index over names(), built on first use."""
+        if getattr(self, "_fuzzy_index", None) is None:
+            with _fuzzy_index_lock:
+                if getattr(self, "_fuzzy_index", None) is None:
+                    self._fuzzy_index = TrigramIndex(self.names())
+        return self._fuzzy_index
+
+    def fuzzy_lookup(self, name: str, threshold: float = DEFAULT_FUZZY_THRESHOLD,
+                     budget_ms: Optional[float] = DEFAULT_FUZZY_BUDGET_MS,
+                     object_types: Optional[Set[str]] = None) -> Optional[Tuple[dict, float]]:
+        """
+        Best approximate name/alias match as (info, score), or None below threshold.
+        With object_types, only STIX objects of those types qualify.
+        """
+        top_k = FUZZY_TYPED_CANDIDATES if object_types else 1
+        for term, score in self.fuzzy_index().search(name, threshold=threshold, top_k=top_k, budget_ms=budget_ms):
+            info = self.lookup(term)
+            if info and (not object_types or info.get("type") in object_types):
+                return info, score
+        return None
+
+    def enrich(self, entities: List[ThreatEntity], fuzzy_threshold: Optional[float] = None) -> List[ThreatEntity]:
+        """
+        Enrich TTP/technique/tactic entities and ATT&CK IDs, and tool/malware entities
+        against MITRE software, in one pass of O(1) lookups.
+        With fuzzy_threshold set, entities without an exact hit fall back to trigram matching.
+        """
+        for entity in entities:
+            if entity.mitre_id:
+                # Already resolved (e.g. by the MITRE gazetteer during NER)
+                continue
+            entity_type = entity.type.lower()
+            if entity_type in MITRE_SOFTWARE_TYPES:
+                object_types = MITRE_SOFTWARE_OBJECT_TYPES
+            elif entity_type in MITRE_ENRICHED_TYPES:
+                object_types = None
+            else:
+                continue
+            mitre_info = self.lookup(entity.name)
+            is_technique_id = bool(MITRE_TECHNIQUE_ID.fullmatch(entity.name.strip()))
+            if not mitre_info and is_technique_id:
+                # Sub-technique missing from the bundle: fall back to its parent technique
+                mitre_info = self.parent(entity.name.strip())
+            if mitre_info and object_types and mitre_info.get("type") not in object_types:
+                mitre_info = None
+            if not mitre_info and fuzzy_threshold and not is_technique_id:
+                fuzzy_hit = self.fuzzy_lookup(entity.name, threshold=fuzzy_threshold, object_types=object_types)
+                if fuzzy_hit:
+                    mitre_info, score = fuzzy_hit
+                    logger.debug(f"Fuzzy MITRE match '{entity.name}' -> '{mitre_info.get('name')}' (score {score}).")
             if mitre_info:
                 entity.mitre_id = mitre_info.get("mitre_id", entity.mitre_id)
+                entity.mitre_name = mitre_info.get("name") or entity.mitre_name
                 entity.description = mitre_info.get("description", entity.description)
-                entity.external_references = mitre_info.get("external_references", entity.external_references or [])
+                # A copy: the info dict (and its list) is shared by the index and every entity it enriches
+                entity.external_references = list(mitre_info.get("external_references", entity.external_references or []))
                 logger.debug(f"Enriched entity '{entity.name}' with MITRE ID '{entity.mitre_id}' and type '{mitre_info.get('type')}'.")
             else:
                 logger.debug(f"No MITRE enrichment found for entity '{entity.name}'.")
-        enriched_entities.append(entity)
+        return entities
 
-    return enriched_entities
+class MitreIndex(MitreLookup):
+    """
+    Hash-map index over a STIX bundle, built once:
+    - by_id: upper-case ATT&CK ID -> info
+    - by_name: normalized name or alias -> info
+    - parents: sub-technique ID -> parent technique ID
+    Info dicts have the same shape find_mitre_info has always returned.
+    """
+
+    def __init__(self, mitre_data: dict):
+        self.by_id: Dict[str, dict] = {}
+        self.by_name: Dict[str, dict] = {}
+        self.parents: Dict[str, str] = {}
+
+        for obj in (mitre_data or {}).get("objects", []):
+            info = mitre_object_info(obj)
+            mitre_id = info["mitre_id"]
+            # First object wins, as with the original linear scan
+            if mitre_id:
+                self.by_id.setdefault(mitre_id.upper(), info)
+                if "." in mitre_id:
+                    self.parents[mitre_id.upper()] = mitre_id.split(".", 1)[0].upper()
+            if info["name"]:
+                self.by_name.setdefault(normalize_mitre_name(info["name"]), info)
+            for alias in mitre_object_aliases(obj):
+                self.by_name.setdefault(normalize_mitre_name(alias), info)
+
+        logger.info(f"Built MITRE index: {len(self.by_id)} IDs, {len(self.by_name)} names/aliases.")
+
+    def lookup(self, name: str) -> Optional[dict]:
+        """Exact lookup by ATT&CK ID, then by name or alias (case and whitespace insensitive)."""
+        if not name:
+            return None
+        return self.by_id.get(name.strip().upper()) or self.by_name.get(normalize_mitre_name(name))
+
+    def parent(self, mitre_id: str) -> Optional[dict]:
+        mitre_id = (mitre_id or "").strip().upper()
+        # Sub-techniques missing from the bundle still map to their parent technique
+        parent_id = self.parents.get(mitre_id) or (mitre_id.split(".", 1)[0] if "." in mitre_id else None)
+        return self.by_id.get(parent_id) if parent_id else None
+
+    def names(self) -> Iterable[str]:
+        return self.by_name.keys()
+
+_mitre_index: Optional[MitreIndex] = None
+_mitre_index_source: Optional[dict] = None
+_mitre_index_lock = threading.Lock()
+
+def get_mitre_index(mitre_data: Optional[dict] = None) -> MitreLookup:
+    """
+    MitreIndex for mitre_data, rebuilt only when a different bundle object is passed in.
+    Without mitre_data, the compact on-disk snapshot of the local bundle is used so the
+    full STIX JSON is only parsed when the snapshot has to be (re)compiled.
+    """
+    global _mitre_index, _mitre_index_source
+    if mitre_data is None:
+        from .mitre_snapshot import get_mitre_snapshot
+        snapshot = get_mitre_snapshot()
+        if snapshot is not None:
+            return snapshot
+        mitre_data = fetch_mitre_data()
+    if _mitre_index is None or _mitre_index_source is not mitre_data:
+        with _mitre_index_lock:
+            if _mitre_index is None or _mitre_index_source is not mitre_data:
+                _mitre_index = MitreIndex(mitre_data)
+                _mitre_index_source = mitre_data
+    return _mitre_index
+
+def find_mitre_info(name: str, mitre_data: dict) -> Optional[dict]:
+    """
+    Lookup MITRE technique or tactic info by name, alias or ID from loaded STIX data.
+    Backed by a MitreIndex built once per bundle.
+    """
+    if not mitre_data or "objects" not in mitre_data:
+        return None
+    return get_mitre_index(mitre_data).lookup(name)
+
+def enrich_entities_with_mitre_stix(entities: List[ThreatEntity], fuzzy_threshold: Optional[float] = None) -> List[ThreatEntity]:
+    """
+    Enrich ThreatEntity list with MITRE ATT&CK data if applicable.
+    Supports TTP, technique, tactic types, plus tool and malware against MITRE software.
+    fuzzy_threshold (0-1) enables approximate name/alias matching for entities without an exact hit.
+    Falls back gracefully if MITRE data not available.
+    """
+    return get_mitre_index().enrich(list(entities), fuzzy_threshold=fuzzy_threshold)
@@ -1,124 +1,287 @@
 from neo4j import GraphDatabase, Session
-from neo4j.exceptions import TransientError
-from typing import List, Optional
+from neo4j.exceptions import ClientError
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
 from .schemas import ThreatEntity, ThreatRelationship
+from .retry_policy import RetryPolicy, RetryClass
+from .write_behind import WriteBehindWriter
+from .neo4j_schema import SchemaManager
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Rows per UNWIND query / transaction in the bulk write paths
+DEFAULT_WRITE_BATCH_SIZE = 500
+
+# Driver connection pool tuning (the driver's own defaults are 100 / 60s / 1h)
+DEFAULT_POOL_SIZE = 50
+DEFAULT_ACQUISITION_TIMEOUT = 60.0
+DEFAULT_CONNECTION_LIFETIME = 3600.0
+
+# Entities are keyed on (name, entity_type) everywhere, matching the
+# ThreatEntity uniqueness constraint created by SchemaManager
+ENTITY_UPSERT_QUERY = """
+MERGE (e:ThreatEntity {name: $name, entity_type: $entity_type})
+SET e.source_text = $source_text,
+    e.confidence = $confidence,
+    e.mitre_id = $mitre_id,
+    e.description = $description,
+    e.external_references = $external_references,
+    e.run_id = $run_id
+"""
+
+RELATIONSHIP_UPSERT_QUERY = """
+MERGE (source:ThreatEntity {name: $source_name, entity_type: $source_type})
+MERGE (target:ThreatEntity {name: $target_name, entity_type: $target_type})
+MERGE (source)-[r:RELATION {type: $relationship_type}]->(target)
+SET r.description = $description,
+    r.confidence = $confidence,
+    r.run_id = $run_id
+"""
+
+
+def _key(value) -> str:
+    """Enum members and plain strings both end up as the same stored key."""
+    return getattr(value, "value", value)
+
+
+def normalize_database_name(name: Optional[str]) -> Optional[str]:
+    """Neo4j database names are lowercase ASCII letters, digits, dots and dashes."""
+    if not name:
+        return None
+    return re.sub(r"[^a-z0-9.\-]", "-", name.lower())
 
 class Neo4jPersistor:
-    def __init__(self, uri: str, user: str, password: str, run_id: str = str(None), db_name: Optional[str] = None):     #db_name is new
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def __init__(self, uri: str, user: str, password: str, run_id: str = str(None), db_name: Optional[str] = None,
+                 retry_policy: Optional[RetryPolicy] = None, create_database: bool = False,
+                 max_connection_pool_size: int = DEFAULT_POOL_SIZE,
+                 connection_acquisition_timeout: float = DEFAULT_ACQUISITION_TIMEOUT,
+                 max_connection_lifetime: float = DEFAULT_CONNECTION_LIFETIME):
+        """
+        db_name routes every session to that database (None = server default).
+        With create_database the database is created if missing; servers that
+        cannot host more databases (Community edition) fall back to the default.
+        """
+        self.driver = GraphDatabase.driver(uri, auth=(user, password),
+                                           max_connection_pool_size=max_connection_pool_size,
+                                           connection_acquisition_timeout=connection_acquisition_timeout,
+                                           max_connection_lifetime=max_connection_lifetime)
         self.run_id = run_id  # store run_id here
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._write_behind: Optional[WriteBehindWriter] = None
+        self._local = threading.local()
+        self.database = normalize_database_name(db_name)
+        if self.database and self.database != db_name:
+            logger.info(f"Using database name '{self.database}' for '{db_name}'")
+        if self.database and create_database:
+            self._create_database()
+        self.schema = SchemaManager(self.driver, database=self.database)
         self._ensure_indexes()
 
     def close(self):
+        # Anything still buffered by the write-behind writer is flushed before the driver goes away
+        if self._write_behind is not None:
+            self._write_behind.close()
+            self._write_behind = None
         self.driver.close()
 
-    def _run_with_retry(self, func, *args, max_retries=3, **kwargs):
-        retries = 0
-        while retries < max_retries:
+    def _create_database(self):
+        def run_query():
+            with self.driver.session(database="system") as session:
+                session.run(f"CREATE DATABASE `{self.database}` IF NOT EXISTS WAIT").consume()
+        try:
+            self._run_with_retry(run_query, operation="create_database")
+            logger.info(f"Using Neo4j database '{self.database}'")
+        except ClientError as e:
+            logger.warning(f"Could not create database '{self.database}' ({e}); using the default database")
+            self.database = None
+
+    def _open_session(self) -> Session:
+        return self.driver.session(database=self.database) if self.database else self.driver.session()
+
+    @contextmanager
+    def session_scope(self) -> Iterator[Session]:
+        """
+        Reuses one session for every write made inside the block on this thread,
+        e.g. a run of save_entity calls or all batches of a bulk write. Nested
+        scopes share the outer session.
+        """
+        scoped = getattr(self._local, "session", None)
+        if scoped is not None:
+            yield scoped
+            return
+        session = self._open_session()
+        self._local.session = session
+        try:
+            yield session
+        finally:
+            # Close whichever session the scope ended with (_renew_scoped_session may have replaced it)
+            current, self._local.session = self._local.session, None
+            current.close()
+
+    def _renew_scoped_session(self):
+        """Replaces this thread's scoped session after a connection failure; the old one is dead."""
+        scoped = getattr(self._local, "session", None)
+        if scoped is None:
+            return
+        try:
+            scoped.close()
+        except Exception as e:
+            logger.debug(f"Closing a failed Neo4j session raised: {e}")
+        self._local.session = self._open_session()
+
+    @contextmanager
+    def _session(self) -> Iterator[Session]:
+        """The current scoped session, or a short-lived one routed to self.database."""
+        scoped = getattr(self._local, "session", None)
+        if scoped is not None:
+            yield scoped
+        else:
+            with self._open_session() as session:
+                yield session
+
+    def start_write_behind(self, **kwargs) -> WriteBehindWriter:
+        """Starts (or returns the running) background writer; see WriteBehindWriter for options."""
+        if self._write_behind is None:
+            self._write_behind = WriteBehindWriter(self, **kwargs)
+        return self._write_behind
+
+    def _run_with_retry(self, func, *args, operation: Optional[str] = None, **kwargs):
+        """
+        Runs func under the persistor's RetryPolicy (backoff, jitter, deadline, counters).
+        After a connection-class failure the thread's scoped session is replaced,
+        so the retry does not run on the same dead session.
+        """
+        def attempt(*a, **kw):
             try:
-                return func(*args, **kwargs)
-            except TransientError as e:
-                retries += 1
-                if retries == max_retries:
-                    raise
-                # Optional: add backoff delay here
+                return func(*a, **kw)
+            except Exception as e:
+                if self.retry_policy.classify(e) == RetryClass.UNAVAILABLE:
+                    self._renew_scoped_session()
+                raise
+        return self.retry_policy.run(attempt, *args, operation=operation or getattr(func, "__name__", "neo4j operation"), **kwargs)
+
+    def retry_stats(self) -> dict:
+        return self.retry_policy.stats()
 
     def _ensure_indexes(self):
-        """Create necessary indexes for performance if not exist"""
-        with self.driver.session() as session:
-            session.run("CREATE INDEX IF NOT EXISTS FOR (e:ThreatEntity) ON (e.name)")
-            session.run("CREATE INDEX IF NOT EXISTS FOR (r:RELATION) ON (r.type)")
+        """Creates and verifies the constraint/indexes backing the MERGE keys"""
+        self._run_with_retry(self.schema.ensure, operation="ensure_indexes")
+
+    def profile_upserts(self, entity: ThreatEntity, relation: ThreatRelationship) -> dict:
+        """PROFILE db hits of one entity and one relationship upsert (rolled back)."""
+        return {
+            "entity_upsert": self._run_with_retry(
+                self.schema.profile, ENTITY_UPSERT_QUERY, {**self._entity_params(entity), "run_id": self.run_id},
+                operation="profile_entity_upsert"),
+            "relationship_upsert": self._run_with_retry(
+                self.schema.profile, RELATIONSHIP_UPSERT_QUERY,
+                {**self._relationship_params(relation), "run_id": self.run_id},
+                operation="profile_relationship_upsert"),
+        }
+
+    def _entity_params(self, entity: ThreatEntity) -> dict:
+        return {
+            "name": entity.name,
+            "entity_type": _key(entity.type),
+            "source_text": entity.text,
+            "confidence": entity.confidence,
+            "mitre_id": entity.mitre_id,
+            "description": entity.description,
+            "external_references": entity.external_references or []
+        }
+
+    def _relationship_params(self, relation: ThreatRelationship) -> dict:
+        return {
+            "source_name": relation.source_name,
+            "source_type": _key(relation.source_type),
+            "target_name": relation.target_name,
+            "target_type": _key(relation.target_type),
+            "relationship_type": _key(relation.relationship_type),
+            "description": relation.description or "",
+            "confidence": relation.confidence or 0.0
+        }
 
     def save_entity(self, entity: ThreatEntity):
         if not entity.name or not entity.type:
             raise ValueError("Entity must have a valid name and type")
-        
-        query = """
-        MERGE (e:ThreatEntity {name: $name})
-        SET e.entity_type = $entity_type,
-            e.source_text = $source_text,
-            e.confidence = $confidence,
-            e.mitre_id = $mitre_id,
-            e.description = $description,
-            e.external_references = $external_references,
-            e.run_id = $run_id
-        """
+
         def run_query():
-            with self.driver.session() as session:
-                session.run(query, {
-                    "name": entity.name,
-                    "entity_type": entity.type,
-                    "source_text": entity.text,
-                    "confidence": entity.confidence,
-                    "mitre_id": entity.mitre_id,
-                    "description": entity.description,
-                    "external_references": entity.external_references or [],
-                    "run_id": self.run_id
-                })
-        self._run_with_retry(run_query)
+            with self._session() as session:
+                session.run(ENTITY_UPSERT_QUERY, {**self._entity_params(entity), "run_id": self.run_id})
+        self._run_with_retry(run_query, operation="save_entity")
 
     def save_relationship(self, relation: ThreatRelationship):
         if not relation.source_name or not relation.target_name or not relation.relationship_type:
             raise ValueError("Relationship must have source, target, and type")
 
-        query = """
-        MERGE (source:ThreatEntity {name: $source_name, entity_type: $source_type})
-        MERGE (target:ThreatEntity {name: $target_name, entity_type: $target_type})
-        MERGE (source)-[r:RELATION {type: $relationship_type}]->(target)
-        SET r.description = $description,
-            r.confidence = $confidence,
-            r.run_id = $run_id
-        """
         def run_query():
-            with self.driver.session() as session:
-                session.run(query, {
-                    "source_name": relation.source_name,
-                    "source_type": relation.source_type,
-                    "target_name": relation.target_name,
-                    "target_type": relation.target_type,
-                    "relationship_type": relation.relationship_type,
-                    "description": relation.description or "",
-                    "confidence": relation.confidence or 0.0,
-                    "run_id": self.run_id
-                })
-        self._run_with_retry(run_query)
-
-    def save_entities_bulk(self, entities: List[ThreatEntity]):
-        if not entities:
-            return
+            with self._session() as session:
+                session.run(RELATIONSHIP_UPSERT_QUERY, {**self._relationship_params(relation), "run_id": self.run_id})
+        self._run_with_retry(run_query, operation="save_relationship")
+
+    def _write_batches(self, query: str, rows: List[dict], batch_size: int, operation: str) -> int:
+        """
+        Writes rows with one UNWIND query per batch, each batch in its own
+        transaction and retried independently by the RetryPolicy, all on one
+        session. Returns the number of rows written.
+        """
+        written = 0
+        with self.session_scope():
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                def run_query():
+                    # An explicit transaction rather than execute_write, which would retry transient
+                    # errors with its own backoff underneath the RetryPolicy and multiply the attempts
+                    with self._session() as session:
+                        with session.begin_transaction() as tx:
+                            tx.run(query, {"rows": batch, "run_id": self.run_id}).consume()
+                            tx.commit()
+                self._run_with_retry(run_query, operation=f"{operation} batch of {len(batch)}")
+                written += len(batch)
+        return written
+
+    def save_entities_bulk(self, entities: List[ThreatEntity], batch_size: int = DEFAULT_WRITE_BATCH_SIZE) -> int:
+        valid = [e for e in entities if e.name and e.type]
+        if len(valid) < len(entities):
+            logger.warning(f"Skipping {len(entities) - len(valid)} entities without a name or type")
+        if not valid:
+            return 0
 
         query = """
-        UNWIND $entities AS entity
-        MERGE (e:ThreatEntity {name: entity.name})
-        SET e.entity_type = entity.entity_type,
-            e.source_text = entity.source_text,
+        UNWIND $rows AS entity
+        MERGE (e:ThreatEntity {name: entity.name, entity_type: entity.entity_type})
+        SET e.source_text = entity.source_text,
             e.confidence = entity.confidence,
             e.mitre_id = entity.mitre_id,
             e.description = entity.description,
             e.external_references = entity.external_references,
             e.run_id = $run_id
         """
-        params = {
-            "entities": [
-                {
-                    "name": e.name,
-                    "entity_type": e.type,
-                    "source_text": e.text,
-                    "confidence": e.confidence,
-                    "mitre_id": e.mitre_id,
-                    "description": e.description,
-                    "external_references": e.external_references or []
-                } for e in entities
-            ],
-            "run_id": self.run_id
-        }
-        def run_query():
-            with self.driver.session() as session:
-                session.run(query, params)
-        self._run_with_retry(run_query)
+        return self._write_batches(query, [self._entity_params(e) for e in valid], batch_size, "save_entities_bulk")
+
+    def save_relationships_bulk(self, relationships: List[ThreatRelationship], batch_size: int = DEFAULT_WRITE_BATCH_SIZE) -> int:
+        valid = [r for r in relationships if r.source_name and r.target_name and r.relationship_type]
+        if len(valid) < len(relationships):
+            logger.warning(f"Skipping {len(relationships) - len(valid)} relationships without source, target, or type")
+        if not valid:
+            return 0
+
+        query = """
+        UNWIND $rows AS rel
+        MERGE (source:ThreatEntity {name: rel.source_name, entity_type: rel.source_type})
+        MERGE (target:ThreatEntity {name: rel.target_name, entity_type: rel.target_type})
+        MERGE (source)-[r:RELATION {type: rel.relationship_type}]->(target)
+        SET r.description = rel.description,
+            r.confidence = rel.confidence,
+            r.run_id = $run_id
+        """
+        return self._write_batches(query, [self._relationship_params(r) for r in valid], batch_size, "save_relationships_bulk")
 
     def clear_graph(self):
         def run_query():
-            with self.driver.session() as session:
+            with self._session() as session:
                 session.run("MATCH (n) DETACH DELETE n")
-        self._run_with_retry(run_query)
+        self._run_with_retry(run_query, operation="clear_graph")
@@ -0,0 +1,162 @@
+"""
+Schema management for the threat graph.
+
+The upserts in Neo4jPersistor MERGE entities on (name, entity_type) and
+relationships on RELATION.type, so the schema has to index exactly those keys:
+- a composite uniqueness constraint on ThreatEntity(name, entity_type), whose
+  backing index serves every entity MERGE and stops duplicate nodes
+- a relationship property index on RELATION(type)
+SchemaManager creates both, drops the old node index on the non-existent
+RELATION label, verifies the result with SHOW CONSTRAINTS / SHOW INDEXES and
+can PROFILE the upserts to report db hits.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+from neo4j.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+ENTITY_KEY_CONSTRAINT = "threat_entity_key"
+ENTITY_NAME_INDEX = "threat_entity_name"
+RELATION_TYPE_INDEX = "relation_type"
+
+SCHEMA_STATEMENTS = [
+    f"CREATE CONSTRAINT {ENTITY_KEY_CONSTRAINT} IF NOT EXISTS "
+    f"FOR (e:ThreatEntity) REQUIRE (e.name, e.entity_type) IS UNIQUE",
+    # Name-only lookups (retrieval, dashboards) cannot use the composite index
+    f"CREATE INDEX {ENTITY_NAME_INDEX} IF NOT EXISTS FOR (e:ThreatEntity) ON (e.name)",
+    f"CREATE INDEX {RELATION_TYPE_INDEX} IF NOT EXISTS FOR ()-[r:RELATION]-() ON (r.type)",
+]
+
+# What verify() expects to find: name -> (entity type, label/relationship type, properties)
+EXPECTED_INDEXES: Dict[str, Tuple[str, str, List[str]]] = {
+    ENTITY_KEY_CONSTRAINT: ("NODE", "ThreatEntity", ["name", "entity_type"]),
+    ENTITY_NAME_INDEX: ("NODE", "ThreatEntity", ["name"]),
+    RELATION_TYPE_INDEX: ("RELATIONSHIP", "RELATION", ["type"]),
+}
+
+
+def plan_db_hits(plan: Optional[dict]) -> int:
+    """Sums dbHits over a PROFILE plan tree (as returned in ResultSummary.profile)."""
+    if not plan:
+        return 0
+    hits = plan.get("dbHits", 0) or 0
+    return hits + sum(plan_db_hits(child) for child in plan.get("children", []))
+
+
+def plan_operators(plan: Optional[dict]) -> List[str]:
+    """Operator types of a plan tree, root first."""
+    if not plan:
+        return []
+    ops = [plan.get("operatorType", "?")]
+    for child in plan.get("children", []):
+        ops.extend(plan_operators(child))
+    return ops
+
+
+class SchemaManager:
+    def __init__(self, driver, database: Optional[str] = None, await_timeout: int = 300):
+        self.driver = driver
+        self.database = database
+        self.await_timeout = await_timeout
+
+    def _session(self):
+        return self.driver.session(database=self.database) if self.database else self.driver.session()
+
+    def apply(self):
+        """Creates the constraint and indexes (idempotent) and drops legacy indexes."""
+        with self._session() as session:
+            for name in self._legacy_indexes(session):
+                logger.info(f"Dropping legacy index {name}")
+                session.run(f"DROP INDEX {name} IF EXISTS").consume()
+            for statement in SCHEMA_STATEMENTS:
+                session.run(statement).consume()
+            # New indexes populate in the background; verify() wants them ONLINE
+            session.run("CALL db.awaitIndexes($timeout)", {"timeout": self.await_timeout}).consume()
+
+    def drop(self):
+        """Removes the managed schema again; used to profile the unindexed baseline."""
+        with self._session() as session:
+            session.run(f"DROP CONSTRAINT {ENTITY_KEY_CONSTRAINT} IF EXISTS").consume()
+            session.run(f"DROP INDEX {ENTITY_NAME_INDEX} IF EXISTS").consume()
+            session.run(f"DROP INDEX {RELATION_TYPE_INDEX} IF EXISTS").consume()
+
+    @staticmethod
+    def _legacy_indexes(session) -> List[str]:
+        """
+        Indexes left by earlier versions: the node index on the RELATION label
+        (relationships are not nodes, so it never served a query) and the
+        unnamed ThreatEntity(name) index that ENTITY_NAME_INDEX replaces.
+        """
+        names = []
+        for record in session.run("SHOW INDEXES YIELD name, entityType, labelsOrTypes, properties, owningConstraint"):
+            if record["owningConstraint"] or record["name"] in EXPECTED_INDEXES:
+                continue
+            labels, props = record["labelsOrTypes"] or [], record["properties"] or []
+            if record["entityType"] == "NODE" and labels == ["RELATION"]:
+                names.append(record["name"])
+            elif record["entityType"] == "NODE" and labels == ["ThreatEntity"] and props == ["name"]:
+                names.append(record["name"])
+        return names
+
+    def verify(self) -> Dict[str, bool]:
+        """
+        Checks that the managed constraint and indexes exist, cover the right
+        keys and are ONLINE. Returns name -> ok and logs anything missing.
+        """
+        with self._session() as session:
+            constraints = {
+                r["name"]: r for r in session.run(
+                    "SHOW CONSTRAINTS YIELD name, type, entityType, labelsOrTypes, properties")
+            }
+            indexes = {
+                r["name"]: r for r in session.run(
+                    "SHOW INDEXES YIELD name, state, entityType, labelsOrTypes, properties, owningConstraint")
+            }
+
+        status = {}
+        for name, (entity_type, label, props) in EXPECTED_INDEXES.items():
+            if name == ENTITY_KEY_CONSTRAINT:
+                record = constraints.get(name)
+                ok = record is not None and record["type"] in ("UNIQUENESS", "NODE_PROPERTY_UNIQUENESS", "NODE_KEY")
+                # The constraint's backing index carries the same name
+                backing = indexes.get(name)
+                ok = ok and (backing is None or backing["state"] == "ONLINE")
+            else:
+                record = indexes.get(name)
+                ok = record is not None and record["state"] == "ONLINE"
+            ok = ok and record["entityType"] == entity_type and list(record["labelsOrTypes"] or []) == [label] \
+                and list(record["properties"] or []) == props
+            status[name] = ok
+            if not ok:
+                logger.warning(f"Schema check failed for {name}: expected {entity_type} {label}({', '.join(props)}), "
+                               f"found {dict(record) if record is not None else 'nothing'}")
+        return status
+
+    def ensure(self) -> Dict[str, bool]:
+        """apply() then verify(); what Neo4jPersistor runs at startup."""
+        try:
+            self.apply()
+        except ClientError as e:
+            # Most often duplicate (name, entity_type) nodes from before the constraint existed;
+            # writes still work, verify() reports what is missing
+            logger.error(f"Could not apply graph schema: {e}")
+        status = self.verify()
+        if all(status.values()):
+            logger.info(f"Graph schema verified: {', '.join(status)}")
+        return status
+
+    def profile(self, query: str, parameters: dict) -> dict:
+        """
+        PROFILEs a write query inside a transaction that is rolled back, so the
+        graph is left unchanged. Returns db hits and the operator chain.
+        """
+        with self._session() as session:
+            tx = session.begin_transaction()
+            try:
+                summary = tx.run(f"PROFILE {query}", parameters).consume()
+            finally:
+                tx.rollback()
+        plan = summary.profile
+        return {"db_hits": plan_db_hits(plan), "operators": plan_operators(plan)}
@@ -1,7 +1,22 @@
 from transformers.pipelines import pipeline
-from typing import List, Optional, Set, Tuple
-from KG_pipeline.schemas import ThreatEntity, map_entity_label, EntityType
+from typing import Dict, List, Optional, Set, Tuple
+from KG_pipeline.schemas import ThreatEntity, map_entity_label
+from KG_pipeline.ioc_scanner import IOC_SCANNER
+from KG_pipeline.gazetteer import get_gazetteer
+import gc
+import logging
 import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NER_MODEL = r"D:\Local_model\CyNER-2.0-DeBERTa-v3-base"
+DEFAULT_NER_BATCH_SIZE = 16
+# DeBERTa-v3 accepts 512 tokens; keep room for special tokens
+DEFAULT_WINDOW_TOKENS = 384
+DEFAULT_WINDOW_STRIDE = 64
+WARM_UP_TEXT = "APT29 used Mimikatz and Cobalt Strike to exploit CVE-2021-44228 (T1059.001)."
 
 def filter_and_deduplicate_entities(entities, min_confidence=0.7, exclude_short_names=True):
     """
@@ -30,52 +45,147 @@ def filter_and_deduplicate_entities(entities, min_confidence=0.7, exclude_short_
 
     return list(seen.values())
 
+def merge_overlapping_spans(spans: List[dict]) -> List[dict]:
+    """
+    Collapses overlapping pipeline spans (e.g. the same entity seen by two windows)
+    into one span per overlap group. The winner is chosen deterministically:
+    highest score, then longest span, then earliest start, then label.
+    """
+    ordered = sorted(spans, key=lambda s: (s["start"], -s["end"]))
+    merged: List[dict] = []
+    group: List[dict] = []
+    group_end = -1
+
+    def pick(candidates):
+        return min(candidates, key=lambda s: (-(s.get("score") or 0.0), -(s["end"] - s["start"]), s["start"],
+                                              str(s.get("entity_group") or s.get("entity"))))
+
+    for span in ordered:
+        if group and span["start"] < group_end:
+            group.append(span)
+            group_end = max(group_end, span["end"])
+            continue
+        if group:
+            merged.append(pick(group))
+        group = [span]
+        group_end = span["end"]
+    if group:
+        merged.append(pick(group))
+    return merged
+
 # === NERExtractor class with fixes ===
 class NERExtractor:
     def __init__(self, model_name: Optional[str] = None):
-        model_name = r"D:\Local_model\CyNER-2.0-DeBERTa-v3-base"
-        self.ner_pipeline = pipeline("ner", model=model_name, aggregation_strategy="simple")
+        self.model_name = model_name or DEFAULT_NER_MODEL
+        start = time.perf_counter()
+        self.ner_pipeline = pipeline("ner", model=self.model_name, aggregation_strategy="simple")
+        self.load_time = time.perf_counter() - start
+        self.inference_time = 0.0
+        self.inference_calls = 0
+        # Hugging Face pipelines keep per-call state, so inference is serialized per model
+        self._lock = threading.Lock()
+        logger.info(f"Loaded NER model {self.model_name} in {self.load_time:.2f}s")
+
+    def _run_pipeline(self, inputs, **kwargs):
+        """Run the transformer pipeline under the model lock and account inference time."""
+        with self._lock:
+            start = time.perf_counter()
+            results = self.ner_pipeline(inputs, **kwargs)
+            self.inference_time += time.perf_counter() - start
+            self.inference_calls += 1
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "model_name": self.model_name,
+            "load_time": round(self.load_time, 4),
+            "inference_time": round(self.inference_time, 4),
+            "inference_calls": self.inference_calls,
+        }
 
     def extract_regex_entities(self, text: str) -> List[ThreatEntity]:
-        entities = []
-        
-        # Regex patterns for different entity types
-        cve_pattern = r'CVE-\d{4}-\d{4,7}'
-        mitre_pattern = r'T\d{4}(?:\.\d{3})?'
-        threat_actor_pattern = r'\bAPT\d+\b'
-        malware_pattern = r'\b[\w-]+(Stealer|RAT|Malware|Bot)\b'
-        tool_pattern = r'\b(Mimikatz|Cobalt Strike|Metasploit)\b'
-        ioc_ip_pattern = r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
-        ioc_hash_pattern = r'\b[a-fA-F0-9]{32,64}\b'  # MD5, SHA256
-        exploit_pattern = r'\b(EternalBlue|BlueKeep|Heartbleed)\b'
-        script_pattern = r'\b[a-zA-Z0-9_]+\.py\b'
-        tool_pattern = r'\b(Mimikatz|Cobalt Strike|Metasploit|Netcat|Meterpreter)\b'
-        
-        patterns = [
-            (cve_pattern, EntityType.VULNERABILITY, 0.9),
-            (mitre_pattern, EntityType.MITRE_TECHNIQUE, 1.0),
-            (threat_actor_pattern, EntityType.THREAT_ACTOR, 0.85),
-            (malware_pattern, EntityType.MALWARE, 0.8),
-            (tool_pattern, EntityType.TOOL, 0.8),
-            (ioc_ip_pattern, EntityType.INDICATOR, 0.7),
-            (ioc_hash_pattern, EntityType.INDICATOR, 0.7),
-            (exploit_pattern, EntityType.EXPLOIT, 0.85),
-            (script_pattern, EntityType.TOOL, 0.75),
-            (tool_pattern, EntityType.TOOL, 0.8),
-        ]
-        
-        for pattern, ent_type, confidence in patterns:
-            for match in re.finditer(pattern, text, re.IGNORECASE):
-                entities.append(ThreatEntity(
-                    name=match.group(),
-                    type=ent_type,
-                    text=match.group(),
-                    confidence=confidence
-                ))
-        return entities
+        return IOC_SCANNER.extract(text)
+
+    def extract_gazetteer_entities(self, text: str) -> List[ThreatEntity]:
+        gazetteer = get_gazetteer()
+        return gazetteer.extract(text) if gazetteer else []
 
     def extract_entities(self, text: str) -> List[ThreatEntity]:
-        ner_results = self.ner_pipeline(text)
+        return self._build_entities(text, self._run_pipeline(text))
+
+    def extract_entities_batch(self, texts: List[str], batch_size: int = DEFAULT_NER_BATCH_SIZE,
+                               window_tokens: Optional[int] = None,
+                               stride: int = DEFAULT_WINDOW_STRIDE) -> List[List[ThreatEntity]]:
+        """
+        Batched counterpart of extract_entities.
+        Texts are sorted by length and packed into buckets of batch_size so each padded
+        batch wastes as little compute as possible; results come back in input order
+        with span offsets relative to their own source text.
+        If window_tokens is set, texts longer than that are split into overlapping token
+        windows (stride tokens of overlap) and the window spans are merged per text.
+        """
+        # (text index, char offset of the segment in its text, segment text)
+        segments: List[Tuple[int, int, str]] = []
+        for i, text in enumerate(texts):
+            if not text or not text.strip():
+                continue
+            if window_tokens:
+                for w_start, w_end in self._token_windows(text, window_tokens, stride):
+                    segments.append((i, w_start, text[w_start:w_end]))
+            else:
+                segments.append((i, 0, text))
+
+        spans_per_text: Dict[int, List[dict]] = {}
+        segments.sort(key=lambda seg: len(seg[2]))
+        for offset in range(0, len(segments), batch_size):
+            bucket = segments[offset:offset + batch_size]
+            ner_batch = self._run_pipeline([seg[2] for seg in bucket], batch_size=len(bucket))
+            # A single-item list input may come back unwrapped
+            if len(bucket) == 1 and ner_batch and isinstance(ner_batch[0], dict):
+                ner_batch = [ner_batch]
+            for (i, char_offset, _), ner_results in zip(bucket, ner_batch):
+                spans = spans_per_text.setdefault(i, [])
+                for ent in ner_results or []:
+                    if not isinstance(ent, dict) or ent.get("start") is None or ent.get("end") is None:
+                        continue
+                    spans.append({**ent, "start": ent["start"] + char_offset, "end": ent["end"] + char_offset})
+
+        results: List[List[ThreatEntity]] = [[] for _ in texts]
+        for i, spans in spans_per_text.items():
+            results[i] = self._build_entities(texts[i], merge_overlapping_spans(spans))
+        return results
+
+    def extract_entities_windowed(self, text: str, window_tokens: int = DEFAULT_WINDOW_TOKENS,
+                                  stride: int = DEFAULT_WINDOW_STRIDE,
+                                  batch_size: int = DEFAULT_NER_BATCH_SIZE) -> List[ThreatEntity]:
+        """NER over a long text in overlapping token windows instead of one truncated pass."""
+        return self.extract_entities_batch([text], batch_size=batch_size,
+                                           window_tokens=window_tokens, stride=stride)[0]
+
+    def _token_windows(self, text: str, window_tokens: int, stride: int) -> List[Tuple[int, int]]:
+        """
+        Character ranges covering text in windows of at most window_tokens tokens,
+        consecutive windows sharing stride tokens.
+        """
+        # Fast tokenizers are not reentrant ("Already borrowed"), so share the inference lock
+        with self._lock:
+            encoding = self.ner_pipeline.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoding["offset_mapping"]
+        if len(offsets) <= window_tokens:
+            return [(0, len(text))]
+        if stride >= window_tokens:
+            raise ValueError("stride must be smaller than window_tokens")
+
+        windows = []
+        step = window_tokens - stride
+        for first in range(0, len(offsets), step):
+            last = min(first + window_tokens, len(offsets)) - 1
+            windows.append((offsets[first][0], offsets[last][1]))
+            if last == len(offsets) - 1:
+                break
+        return windows
+
+    def _build_entities(self, text: str, ner_results) -> List[ThreatEntity]:
         entities: List[ThreatEntity] = []
         seen_spans: Set[Tuple[int, int]] = set()
         seen_entities: Set[Tuple[str, str]] = set()
@@ -122,6 +232,22 @@ class NERExtractor:
             )
             entities.append(entity)
 
+        # Add MITRE gazetteer hits; a transformer entity with the same surface form just gets the MITRE fields
+        by_name = {entity.name: entity for entity in entities}
+        for gazetteer_entity in self.extract_gazetteer_entities(text):
+            existing = by_name.get(gazetteer_entity.name)
+            if existing is not None and not existing.mitre_id:
+                existing.mitre_id = gazetteer_entity.mitre_id
+                existing.mitre_name = gazetteer_entity.mitre_name
+                existing.description = gazetteer_entity.description
+                existing.aliases = gazetteer_entity.aliases
+                existing.external_references = gazetteer_entity.external_references
+                continue
+            key = (gazetteer_entity.name, gazetteer_entity.type)
+            if key not in seen_entities:
+                entities.append(gazetteer_entity)
+                seen_entities.add(key)
+
         # Add regex-based entities without duplicate
         for regex_entity in self.extract_regex_entities(text):
             key = (regex_entity.name.lower(), regex_entity.type)
@@ -131,6 +257,68 @@ class NERExtractor:
 
         return entities
 
+class NERModelRegistry:
+    """
+    Process-wide pool of NERExtractor instances.
+    Each model is loaded once per process and shared by every caller (and thread).
+    """
+
+    def __init__(self):
+        self._extractors: Dict[str, NERExtractor] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: Optional[str] = None) -> NERExtractor:
+        key = model_name or DEFAULT_NER_MODEL
+        extractor = self._extractors.get(key)
+        if extractor is not None:
+            return extractor
+        with self._lock:
+            # Another thread may have finished loading while we waited on the lock
+            extractor = self._extractors.get(key)
+            if extractor is None:
+                extractor = NERExtractor(model_name=key)
+                self._extractors[key] = extractor
+        return extractor
+
+    def warm_up(self, model_name: Optional[str] = None, text: str = WARM_UP_TEXT) -> NERExtractor:
+        """Load the model (if needed) and run one inference so the first document pays no setup cost."""
+        extractor = self.get(model_name)
+        start = time.perf_counter()
+        extractor.extract_entities(text)
+        logger.info(f"Warmed up NER model {extractor.model_name} "
+                    f"(load {extractor.load_time:.2f}s, first inference {time.perf_counter() - start:.2f}s)")
+        return extractor
+
+    def unload(self, model_name: Optional[str] = None):
+        """Drop one model (or every model when model_name is None) and release its memory."""
+        with self._lock:
+            if model_name is None:
+                self._extractors.clear()
+            else:
+                self._extractors.pop(model_name, None)
+        gc.collect()
+
+    def is_loaded(self, model_name: Optional[str] = None) -> bool:
+        return (model_name or DEFAULT_NER_MODEL) in self._extractors
+
+    def stats(self) -> List[Dict[str, float]]:
+        return [extractor.stats() for extractor in list(self._extractors.values())]
+
+
+ner_registry = NERModelRegistry()
+
+
+def get_ner_extractor(model_name: Optional[str] = None) -> NERExtractor:
+    return ner_registry.get(model_name)
+
+
 def perform_hybrid_ner(text: str, model_name: Optional[str] = None) -> List[ThreatEntity]:
-    extractor = NERExtractor(model_name=model_name)
-    return extractor.extract_entities(text)
+    return get_ner_extractor(model_name).extract_entities(text)
+
+
+def perform_hybrid_ner_batch(texts: List[str], model_name: Optional[str] = None,
+                             batch_size: int = DEFAULT_NER_BATCH_SIZE,
+                             window_tokens: Optional[int] = None,
+                             stride: int = DEFAULT_WINDOW_STRIDE) -> List[List[ThreatEntity]]:
+    return get_ner_extractor(model_name).extract_entities_batch(texts, batch_size=batch_size,
+                                                                window_tokens=window_tokens, stride=stride)
@@ -0,0 +1,271 @@
+"""
+Counters, gauges and latency histograms for pipeline runs.
+
+Series are keyed by name and labels (e.g. stage, source). Every update is
+one dict lookup under a lock, so the registry is cheap enough to leave on
+and safe to share between threads. Processes do not share memory: a pool
+worker drain()s its registry after each block and sends the snapshot back
+with the results, and the parent merge()s it. Counters and histograms add
+up; gauges keep the latest value.
+
+A run can be exported as Prometheus text (render_prometheus(), served by
+start_metrics_server()) or as a JSON summary with p50/p95/p99 per
+histogram (write_json()).
+"""
+
+import bisect
+import contextlib
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAMESPACE = "kg_pipeline"
+# Upper bounds in seconds; the last bucket catches everything slower
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+                           float("inf"))
+SUMMARY_QUANTILES = (0.5, 0.95, 0.99)
+# The endpoint is unauthenticated, so it only listens locally unless asked otherwise
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+COUNTER, GAUGE, HISTOGRAM = "counter", "gauge", "histogram"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+SeriesKey = Tuple[str, LabelKey]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+def _matches(key: LabelKey, labels: LabelKey) -> bool:
+    return set(labels) <= set(key)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram; quantiles are interpolated within their bucket."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[min(bisect.bisect_left(self.buckets, seconds), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other: "LatencyHistogram"):
+        if other.buckets != self.buckets:
+            raise ValueError("Cannot merge histograms with different buckets")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts) if count}}
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {"count": self.count, "sum": round(self.sum, 6),
+                   "mean": round(self.sum / self.count, 6) if self.count else None}
+        for q in SUMMARY_QUANTILES:
+            value = self.quantile(q)
+            summary[f"p{round(q * 100)}"] = round(value, 6) if value is not None else None
+        return summary
+
+
+class MetricsRegistry:
+    """
+    inc() counters, set() gauges, observe() or time() histograms, each with
+    optional labels. Series are created on first use; describe() adds the
+    HELP text shown in the Prometheus output.
+    """
+
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[SeriesKey, float] = {}
+        self._gauges: Dict[SeriesKey, float] = {}
+        self._histograms: Dict[SeriesKey, LatencyHistogram] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def time(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def value(self, name: str, **labels) -> float:
+        """Sum of a counter (or of a histogram's observations) over every series carrying these labels."""
+        wanted = _label_key(labels)
+        with self._lock:
+            total = sum(v for (n, key), v in self._counters.items() if n == name and _matches(key, wanted))
+            total += sum(h.sum for (n, key), h in self._histograms.items() if n == name and _matches(key, wanted))
+        return total
+
+    def gauge(self, name: str, **labels) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get((name, _label_key(labels)))
+
+    def histogram(self, name: str, **labels) -> LatencyHistogram:
+        """All series of a histogram carrying these labels, merged."""
+        wanted = _label_key(labels)
+        merged = LatencyHistogram(self.buckets)
+        with self._lock:
+            for (n, key), histogram in self._histograms.items():
+                if n == name and _matches(key, wanted):
+                    merged.merge(histogram)
+        return merged
+
+    def label_values(self, name: str, label: str) -> List[str]:
+        with self._lock:
+            keys = [key for n, key in (*self._counters, *self._gauges, *self._histograms) if n == name]
+        return sorted({value for key in keys for lname, value in key if lname == label})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Picklable copy of every series, for merge() in another process."""
+        with self._lock:
+            return {COUNTER: dict(self._counters), GAUGE: dict(self._gauges),
+                    HISTOGRAM: {key: (h.counts[:], h.count, h.sum) for key, h in self._histograms.items()}}
+
+    def drain(self) -> Dict[str, Any]:
+        """snapshot() and reset counters and histograms, so the next drain only has what happened since."""
+        with self._lock:
+            snapshot = {COUNTER: self._counters, GAUGE: dict(self._gauges),
+                        HISTOGRAM: {key: (h.counts, h.count, h.sum) for key, h in self._histograms.items()}}
+            self._counters = {}
+            self._histograms = {}
+        return snapshot
+
+    def merge(self, snapshot: Dict[str, Any]):
+        with self._lock:
+            for key, value in snapshot[COUNTER].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            self._gauges.update(snapshot[GAUGE])
+            for key, (counts, count, total) in snapshot[HISTOGRAM].items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = LatencyHistogram(self.buckets)
+                incoming = LatencyHistogram(self.buckets)
+                incoming.counts, incoming.count, incoming.sum = list(counts), count, total
+                histogram.merge(incoming)
+
+    def summary(self) -> Dict[str, Any]:
+        def series(items):
+            out: Dict[str, Any] = {}
+            for (name, key), value in sorted(items, key=lambda item: item[0]):
+                labels = ",".join(f"{k}={v}" for k, v in key)
+                out.setdefault(name, {})[labels or "total"] = value
+            return out
+
+        with self._lock:
+            return {"counters": series(self._counters.items()), "gauges": series(self._gauges.items()),
+                    "histograms": series((key, h.summary()) for key, h in self._histograms.items())}
+
+    def write_json(self, path: Union[str, Path]):
+        path = Path(path)
+        path.write_text(json.dumps({"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **self.summary()},
+                                   indent=2), encoding="utf-8")
+        logger.info(f"Metrics summary written to {path}")
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        def labels_text(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = [(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in key + extra]
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        with self._lock:
+            families: Dict[str, Tuple[str, List]] = {}
+            for kind, items in ((COUNTER, self._counters), (GAUGE, self._gauges), (HISTOGRAM, self._histograms)):
+                for (name, key), value in items.items():
+                    families.setdefault(name, (kind, []))[1].append((key, value))
+            lines = []
+            for name, (kind, series) in sorted(families.items()):
+                full = f"{self.namespace}_{name}"
+                if kind == COUNTER and not full.endswith("_total"):
+                    full += "_total"
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} {kind}")
+                for key, value in sorted(series, key=lambda s: s[0]):
+                    if kind != HISTOGRAM:
+                        lines.append(f"{full}{labels_text(key)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{full}_bucket{labels_text(key, (('le', le),))} {cumulative}")
+                    lines.append(f"{full}_sum{labels_text(key)} {value.sum}")
+                    lines.append(f"{full}_count{labels_text(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(registry: MetricsRegistry, port: int, host: str = DEFAULT_METRICS_HOST) -> ThreadingHTTPServer:
+    """Serves registry.render_prometheus() at /metrics from a daemon thread; shutdown() the result to stop."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"Metrics endpoint: {format % args}")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -8,11 +8,11 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import json
 import logging
 import time
-from typing import List, Optional
-import re
-from openai import OpenAI
-from groq import Groq
+from typing import Iterator, List, Optional, Tuple
 from KG_pipeline.schemas import ThreatEntity, ThreatRelationship
+from KG_pipeline.json_stream import IncrementalJSONArrayParser, parse_json_array
+from KG_pipeline.llm_cache import cache_key, get_relation_cache
+from KG_pipeline.llm_clients import get_llm_client_factory
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,19 +20,182 @@ api_key = os.getenv("GROQ_API_KEY")
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever build_prompt / build_packed_prompt change so cached relations from the old prompt are not reused
+PROMPT_VERSION = "relations-v1"
+PACKED_PROMPT_VERSION = "relations-packed-v1"
+
+# Prompt packing: small documents share one request up to this many prompt tokens
+DEFAULT_PACK_TOKEN_BUDGET = 3000
+DEFAULT_PACK_MAX_DOCS = 8
+# Completion tokens reserved per packed document (plus one base allowance)
+PACK_COMPLETION_TOKENS_PER_DOC = 384
+CHARS_PER_TOKEN = 4
+
+RELATION_SPEC = (
+    "Each object must have:\n"
+    "- source_name (string)\n- source_type (string)\n"
+    "- target_name (string)\n- target_type (string)\n"
+    "- relationship_type (exploits, targets, uses, variant_of)\n"
+    "- confidence (float between 0 and 1)\n"
+    "- description (max 50 words)\n\n"
+)
+
+
+class IncompleteResponseError(RuntimeError):
+    """The completion stream broke after some relations were already handed to the caller."""
+
 
 def extract_json_array(text: str) -> Optional[List[dict]]:
-    """Extract JSON array from text containing extra text around it."""
+    """Extract JSON array from text containing extra text around it; a truncated array keeps its complete objects."""
+    items = parse_json_array(text)
+    relations = [item for item in items if isinstance(item, dict)] if items is not None else None
+    if items is None or (items and not relations):
+        logger.error("Failed to extract JSON array of relation objects")
+        return None
+    return relations
+
+
+def extract_json_object(text: str) -> Optional[dict]:
+    """Extract the outermost JSON object from text containing extra text around it."""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        value = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to extract JSON object: {e}")
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def estimate_prompt_tokens(text: str, entities: List[dict]) -> int:
+    return (len(text) + sum(len(str(e["name"])) + 16 for e in entities)) // CHARS_PER_TOKEN
+
+
+def pack_documents(items: List[Tuple[str, List[dict]]], token_budget: int = DEFAULT_PACK_TOKEN_BUDGET,
+                   max_docs: int = DEFAULT_PACK_MAX_DOCS) -> List[List[int]]:
+    """
+    Groups item indexes into packs whose combined prompt stays under
+    token_budget. Documents too big to share (over half the budget) get a
+    pack of their own, which callers send as an ordinary single prompt.
+    """
+    packs, current, used = [], [], 0
+    for index, (text, entities) in enumerate(items):
+        tokens = estimate_prompt_tokens(text, entities)
+        if tokens > token_budget // 2:
+            packs.append([index])
+            continue
+        if current and (used + tokens > token_budget or len(current) >= max_docs):
+            packs.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Server-requested wait from a rate-limit/overload error, if any. Groq and
+    OpenAI SDK errors carry the HTTP response; both send Retry-After (seconds)
+    and sometimes retry-after-ms.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
     try:
-        match = re.search(r'\[.*\]', text, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            return json.loads(json_str)
-    except Exception as e:
-        logger.error(f"Failed to extract JSON array: {e}")
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
     return None
 
 
+def retry_delay(error: Exception, attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Retry-After when the server gives one, otherwise exponential backoff."""
+    delay = retry_after_seconds(error)
+    if delay is None:
+        delay = base * 2 ** (attempt - 1)
+    return min(delay, cap)
+
+
+def stream_content(stream) -> Iterator[str]:
+    """Text deltas from an OpenAI-compatible streamed chat completion."""
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        content = getattr(choice.delta, "content", None)
+        if content:
+            yield content
+        if choice.finish_reason == "length":
+            logger.warning("LLM completion hit max_tokens; keeping the relations completed so far")
+
+
+def entity_dicts(entities: List[ThreatEntity]) -> List[dict]:
+    """Defensive extraction of name and type from entities, as sent to the LLM."""
+    dicts = [{"name": getattr(e, "name", None), "type": getattr(e, "type", None)} for e in entities]
+    return [e for e in dicts if e["name"] and e["type"]]
+
+
+def parse_relations(relations: List[dict]) -> List[ThreatRelationship]:
+    cleaned = []
+    for r in relations:
+        if all(k in r for k in ("source_name", "source_type", "target_name", "target_type", "relationship_type")):
+            cleaned.append(
+                ThreatRelationship(
+                    source_name=r["source_name"],
+                    source_type=r["source_type"],
+                    target_name=r["target_name"],
+                    target_type=r["target_type"],
+                    relationship_type=r["relationship_type"],
+                    confidence=r.get("confidence", 0.7),
+                    description=r.get("description", "")
+                )
+            )
+        else:
+            logger.warning(f"Incomplete relation data skipped: {r}")
+    return cleaned
+
+
+def relations_within(relations: List[dict], entities: List[dict]) -> List[dict]:
+    """The relations whose source and target are both among entities (e.g. one document of a packed answer)."""
+    names = {str(e["name"]).strip().lower() for e in entities}
+    return [r for r in relations
+            if str(r.get("source_name", "")).strip().lower() in names
+            and str(r.get("target_name", "")).strip().lower() in names]
+
+
+def build_prompt(text: str, entities: List[dict]) -> str:
+    """Single-document relation prompt, shared by the sync clients and AsyncRelationExtractor."""
+    entity_list = "\n".join(f"- {e['name']} ({e['type']})" for e in entities)
+    return (
+        f"Extract cybersecurity relationships from the following text.\n\n"
+        f"Text:\n{text}\n\n"
+        f"Entities:\n{entity_list}\n\n"
+        f"Return a JSON array of relation objects. {RELATION_SPEC}"
+        f"Output only valid JSON array.\nBegin extraction now."
+    )
+
+
+def build_packed_prompt(docs: List[Tuple[str, List[dict]]]) -> str:
+    sections = []
+    for n, (text, entities) in enumerate(docs, start=1):
+        entity_list = "\n".join(f"- {e['name']} ({e['type']})" for e in entities)
+        sections.append(f"### doc{n}\nText:\n{text}\n\nEntities:\n{entity_list}\n")
+    ids = ", ".join(f'"doc{n}"' for n in range(1, len(docs) + 1))
+    return (
+        f"Extract cybersecurity relationships from each of the following {len(docs)} independent documents. "
+        f"Only relate entities listed for the same document.\n\n"
+        + "\n".join(sections) +
+        f"\nReturn one JSON object with exactly the keys {ids}. Each value is a JSON array of "
+        f"relation objects for that document (empty array if none). {RELATION_SPEC}"
+        f"Output only the valid JSON object.\nBegin extraction now."
+    )
+
+
 class BaseLLMClient:
     """Base class for shared LLM logic."""
 
@@ -40,85 +203,194 @@ class BaseLLMClient:
         self.model = model
         self.temperature = temperature
 
-    def extract_relations(self, text: str, entities: List[dict], max_retries: int = 2) -> Optional[List[dict]]:
-        prompt = self._build_prompt(text, entities)
+    def extract_relations(self, text: str, entities: List[dict], max_retries: int = 2,
+                          use_cache: bool = True) -> Optional[List[dict]]:
+        """Served from the persistent relation cache when this exact request was answered before."""
+        stream = self.stream_relations(text, entities, max_retries, use_cache)
+        while True:
+            try:
+                next(stream)
+            except StopIteration as done:
+                return done.value
+
+    def stream_relations(self, text: str, entities: List[dict], max_retries: int = 2,
+                         use_cache: bool = True) -> Iterator[dict]:
+        """
+        Yields relation objects as the completion streams in, so callers can
+        persist them before the response finishes. The generator's return
+        value is the full list (None when extraction failed), as returned by
+        extract_relations. A stream that breaks part-way raises
+        IncompleteResponseError, so the document is not checkpointed as done.
+        """
+        cache = get_relation_cache() if use_cache else None
+        if cache is not None:
+            key = cache_key(self.model, PROMPT_VERSION, text, entities)
+            cached = cache.get(key)
+            if cached is not None:
+                yield from cached
+                return cached
+        relations, finished = yield from self._stream_relations(build_prompt(text, entities), max_retries)
+        if cache is not None and finished:
+            cache.put(key, self.model, relations)
+        return relations
+
+    def _stream_relations(self, prompt: str, max_retries: int) -> Iterator[dict]:
+        """Returns (relations, finished); truncated answers are not finished, and only finished ones are cached."""
         for attempt in range(1, max_retries + 1):
+            parser = IncrementalJSONArrayParser()
+            relations: List[dict] = []
             try:
-                response_text = self._call_api(prompt)
-                if not response_text:
-                    logger.warning(f"{self.__class__.__name__} empty response on attempt {attempt}.")
-                    continue
-                relations = extract_json_array(response_text)
-                if relations is None:
-                    logger.error("Failed to parse JSON array from response.")
-                    logger.debug(f"Raw output:\n{response_text}")
-                    continue
-                return relations
+                for chunk in self._stream_api(prompt):
+                    for item in parser.feed(chunk):
+                        if isinstance(item, dict):
+                            relations.append(item)
+                            yield item
+                        else:
+                            logger.warning(f"Non-object relation skipped: {item!r}")
             except Exception as e:
+                if relations:
+                    # Already handed to the caller, so asking again would repeat them; fail the document instead
+                    raise IncompleteResponseError(
+                        f"{self.__class__.__name__} stream broke after {len(relations)} relations: {e}") from e
                 logger.error(f"{self.__class__.__name__} API request failed: {e}")
                 if attempt < max_retries:
-                    time.sleep(1)
-        return None
+                    time.sleep(retry_delay(e, attempt))
+                continue
+            if parser.complete:
+                return relations, True
+            if relations:
+                # Cut off at max_tokens: keep the complete objects, but a retry or a larger budget may do better
+                logger.warning(f"{self.__class__.__name__} response truncated; salvaged {len(relations)} relations")
+                return relations, False
+            if not parser.started:
+                logger.warning(f"{self.__class__.__name__} empty or non-JSON response on attempt {attempt}.")
+            else:
+                logger.error("Failed to parse JSON array from response.")
+        return None, False
 
-    def _build_prompt(self, text: str, entities: List[dict]) -> str:
-        entity_list = "\n".join(f"- {e['name']} ({e['type']})" for e in entities)
-        return (
-            f"Extract cybersecurity relationships from the following text.\n\n"
-            f"Text:\n{text}\n\n"
-            f"Entities:\n{entity_list}\n\n"
-            f"Return a JSON array of relation objects. Each object must have:\n"
-            f"- source_name (string)\n- source_type (string)\n"
-            f"- target_name (string)\n- target_type (string)\n"
-            f"- relationship_type (exploits, targets, uses, variant_of)\n"
-            f"- confidence (float between 0 and 1)\n"
-            f"- description (max 50 words)\n\n"
-            f"Output only valid JSON array.\nBegin extraction now."
-        )
+    def extract_relations_packed(self, docs: List[Tuple[str, List[dict]]], max_retries: int = 2,
+                                 use_cache: bool = True) -> List[Optional[List[dict]]]:
+        """
+        Relations for several small documents from one request. The model
+        answers with a JSON object keyed by document id; any document missing
+        from (or malformed in) the answer is re-asked on its own. Relations
+        naming entities not listed for their document are dropped, and such
+        answers are not cached.
+        """
+        cache = get_relation_cache() if use_cache else None
+        keys = [cache_key(self.model, PACKED_PROMPT_VERSION, text, entities) for text, entities in docs]
+        results: List[Optional[List[dict]]] = [None] * len(docs)
+        if cache is not None:
+            for i, (text, entities) in enumerate(docs):
+                # An earlier single-document answer is just as good
+                results[i] = cache.get(keys[i])
+                if results[i] is None:
+                    results[i] = cache.get(cache_key(self.model, PROMPT_VERSION, text, entities))
+        todo = [i for i, r in enumerate(results) if r is None]
 
-    def _call_api(self, prompt: str) -> Optional[str]:
+        if len(todo) > 1:
+            prompt = build_packed_prompt([docs[i] for i in todo])
+            answer = None
+            for attempt in range(1, max_retries + 1):
+                try:
+                    response_text = self._call_api(prompt, max_tokens=PACK_COMPLETION_TOKENS_PER_DOC * (len(todo) + 1))
+                    answer = extract_json_object(response_text) if response_text else None
+                    if answer is not None:
+                        break
+                    logger.warning(f"{self.__class__.__name__} packed response unparseable on attempt {attempt}.")
+                except Exception as e:
+                    logger.error(f"{self.__class__.__name__} packed request failed: {e}")
+                    if attempt < max_retries:
+                        time.sleep(retry_delay(e, attempt))
+            for n, i in enumerate(todo):
+                relations = (answer or {}).get(f"doc{n + 1}")
+                if isinstance(relations, list) and all(isinstance(r, dict) for r in relations):
+                    # The prompt asks the model not to mix documents up; this enforces it
+                    results[i] = relations_within(relations, docs[i][1])
+                    if len(results[i]) < len(relations):
+                        logger.warning(f"Dropped {len(relations) - len(results[i])} relations of packed doc{n + 1} "
+                                       f"naming entities of other documents")
+                    elif cache is not None:
+                        cache.put(keys[i], self.model, relations)
+
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing and len(docs) > 1:
+            logger.info(f"Packed extraction fell back to single-document calls for {len(missing)}/{len(docs)} documents")
+        for i in missing:
+            results[i] = self.extract_relations(*docs[i], max_retries=max_retries, use_cache=use_cache)
+        return results
+
+    def _call_api(self, prompt: str, max_tokens: Optional[int] = None) -> Optional[str]:
         raise NotImplementedError("Must be implemented by subclass.")
 
+    def _stream_api(self, prompt: str, max_tokens: Optional[int] = None) -> Iterator[str]:
+        """Completion text in chunks; clients without streaming deliver it in one."""
+        response_text = self._call_api(prompt, max_tokens)
+        if response_text:
+            yield response_text
+
 
 class GroqClient(BaseLLMClient):
     """Handles Groq API communication"""
 
     def __init__(self, api_key: str, model: str = "llama-3.3-70b-versatile"):
         super().__init__(model)
-        self.client = Groq()
+        # Shared SDK client: keep-alive connections are reused across documents
+        self.client = get_llm_client_factory().groq(api_key)
 
-    def _call_api(self, prompt: str) -> Optional[str]:
+    def _call_api(self, prompt: str, max_tokens: Optional[int] = None) -> Optional[str]:
         response = self.client.chat.completions.create(
             model=self.model,
             messages=[{"role": "user", "content": prompt}],
             temperature=self.temperature,
-            max_tokens=1024
+            max_tokens=max_tokens or 1024
         )
         logger.debug(f"Groq raw response: {response}")
         return response.choices[0].message.content
 
+    def _stream_api(self, prompt: str, max_tokens: Optional[int] = None) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            max_tokens=max_tokens or 1024,
+            stream=True
+        )
+        yield from stream_content(stream)
+
 class LocalLlamaClient(BaseLLMClient):
     """Local LLaMA client using LM Studio's OpenAI-compatible API."""
 
     def __init__(self, base_url: str = "http://10.5.0.2:1229", model: str = "meta-llama-3.1-8b-instruct", temperature: float = 0.3):
         super().__init__(model, temperature)
-        self.client = OpenAI(
-        base_url = base_url,
-        api_key = "lm-studio"  # Required dummy key for LM Studio
+        self.client = get_llm_client_factory().openai(
+            base_url=base_url,
+            api_key="lm-studio"  # Required dummy key for LM Studio
         )
 
-    def _call_api(self, prompt: str) -> Optional[str]:
+    def _call_api(self, prompt: str, max_tokens: Optional[int] = None) -> Optional[str]:
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=self.temperature,
-                max_tokens=2048
+                max_tokens=max_tokens or 2048
             )
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Local LLaMA call failed: {e}")
             return None
 
+    def _stream_api(self, prompt: str, max_tokens: Optional[int] = None) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            max_tokens=max_tokens or 2048,
+            stream=True
+        )
+        yield from stream_content(stream)
+
 
 def extract_relationships_llm(
     text: str,
@@ -132,33 +404,10 @@ def extract_relationships_llm(
         logger.warning("Empty input received for relationship extraction.")
         return []
 
-    # Defensive extraction of name and type from entities
-    entity_dicts = [{"name": getattr(e, "name", None), "type": getattr(e, "type", None)} for e in entities]
-    entity_dicts = [e for e in entity_dicts if e["name"] and e["type"]]
-
-    def parse_relations(relations: List[dict]) -> List[ThreatRelationship]:
-        cleaned = []
-        for r in relations:
-            if all(k in r for k in ("source_name", "source_type", "target_name", "target_type", "relationship_type")):
-                cleaned.append(
-                    ThreatRelationship(
-                        source_name=r["source_name"],
-                        source_type=r["source_type"],
-                        target_name=r["target_name"],
-                        target_type=r["target_type"],
-                        relationship_type=r["relationship_type"],
-                        confidence=r.get("confidence", 0.7),
-                        description=r.get("description", "")
-                    )
-                )
-            else:
-                logger.warning(f"Incomplete relation data skipped: {r}")
-        return cleaned
-
     # Try Groq extraction
     if groq_key:
         logger.info("Attempting extraction with Groq LLM...")
-        relations = GroqClient(groq_key).extract_relations(text, entity_dicts)
+        relations = GroqClient(groq_key).extract_relations(text, entity_dicts(entities))
         if relations:
             logger.info(f"Groq succeeded with {len(relations)} relationships.")
             return parse_relations(relations)
@@ -171,3 +420,46 @@ def extract_relationships_llm(
         return []
 
     return []
+
+
+def stream_relationships_llm(
+    text: str,
+    entities: List[ThreatEntity],
+    groq_key: Optional[str] = None
+) -> Iterator[ThreatRelationship]:
+    """Like extract_relationships_llm, but yields each relationship as soon as the LLM has finished writing it."""
+    if not text or not entities or not groq_key:
+        return
+    count = 0
+    for relation in GroqClient(groq_key).stream_relations(text, entity_dicts(entities)):
+        for relationship in parse_relations([relation]):
+            count += 1
+            yield relationship
+    logger.info(f"Groq streamed {count} relationships.")
+
+
+def extract_relationships_llm_packed(
+    docs: List[Tuple[str, List[ThreatEntity]]],
+    groq_key: Optional[str] = None,
+    token_budget: int = DEFAULT_PACK_TOKEN_BUDGET,
+    max_docs: int = DEFAULT_PACK_MAX_DOCS
+) -> List[List[ThreatRelationship]]:
+    """
+    Relationship extraction for many documents, packing small ones into
+    shared requests. Returns one relationship list per input document.
+    """
+    results: List[List[ThreatRelationship]] = [[] for _ in docs]
+    if not groq_key:
+        return results
+    items = [(text, entity_dicts(entities)) for text, entities in docs]
+    live = [i for i, (text, entities) in enumerate(items) if text and entities]
+    client = GroqClient(groq_key)
+    for pack in pack_documents([items[i] for i in live], token_budget, max_docs):
+        indexes = [live[p] for p in pack]
+        if len(indexes) == 1:
+            answers = [client.extract_relations(*items[indexes[0]])]
+        else:
+            answers = client.extract_relations_packed([items[i] for i in indexes])
+        for i, relations in zip(indexes, answers):
+            results[i] = parse_relations(relations) if relations else []
+    return results
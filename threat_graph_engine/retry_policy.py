@@ -0,0 +1,102 @@
+"""
+Retry policy for Neo4j operations: exponential backoff with full jitter,
+a per-operation deadline, error classification and monitoring counters.
+"""
+
+import logging
+import random
+import threading
+import time
+from enum import Enum
+from typing import Callable, Dict, Optional
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+logger = logging.getLogger(__name__)
+
+
+class RetryClass(str, Enum):
+    TRANSIENT = "transient"        # deadlocks, lock timeouts, leader switches: retry soon
+    UNAVAILABLE = "unavailable"    # server/cluster unreachable: retry with longer waits
+    FATAL = "fatal"                # syntax, constraint and auth errors: never retry
+
+
+class RetryPolicy:
+    """
+    Shared by every Neo4jPersistor method. Thread-safe; counters are cumulative
+    for the lifetime of the policy.
+    """
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 0.1, max_delay: float = 5.0,
+                 multiplier: float = 2.0, deadline: Optional[float] = 30.0,
+                 unavailable_delay_factor: float = 4.0, rng: Optional[random.Random] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.deadline = deadline
+        self.unavailable_delay_factor = unavailable_delay_factor
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {
+            "calls": 0,
+            "successes": 0,
+            "retries": 0,
+            "transient_errors": 0,
+            "unavailable_errors": 0,
+            "fatal_errors": 0,
+            "gave_up": 0,
+            "deadline_exceeded": 0,
+            "backoff_seconds": 0.0,
+        }
+
+    @staticmethod
+    def classify(error: BaseException) -> RetryClass:
+        if isinstance(error, TransientError):
+            return RetryClass.TRANSIENT
+        if isinstance(error, (ServiceUnavailable, SessionExpired, ConnectionError)):
+            return RetryClass.UNAVAILABLE
+        return RetryClass.FATAL
+
+    def backoff(self, attempt: int, retry_class: RetryClass = RetryClass.TRANSIENT) -> float:
+        """Full-jitter delay before retry number attempt (1-based)."""
+        base = self.base_delay * (self.unavailable_delay_factor if retry_class == RetryClass.UNAVAILABLE else 1.0)
+        cap = min(self.max_delay, base * self.multiplier ** (attempt - 1))
+        return self._rng.uniform(0, cap)
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def run(self, func: Callable, *args, operation: str = "neo4j operation", **kwargs):
+        self._count("calls")
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                result = func(*args, **kwargs)
+                self._count("successes")
+                return result
+            except Exception as e:
+                retry_class = self.classify(e)
+                self._count(f"{retry_class.value}_errors")
+                if retry_class == RetryClass.FATAL:
+                    raise
+                attempt += 1
+                if attempt > self.max_retries:
+                    self._count("gave_up")
+                    logger.error(f"{operation} failed after {attempt} attempts: {e}")
+                    raise
+                delay = self.backoff(attempt, retry_class)
+                if self.deadline is not None and time.monotonic() - start + delay > self.deadline:
+                    self._count("deadline_exceeded")
+                    logger.error(f"{operation} exceeded its {self.deadline:.1f}s deadline: {e}")
+                    raise
+                self._count("retries")
+                self._count("backoff_seconds", delay)
+                logger.warning(f"{operation} hit a {retry_class.value} error ({e}); "
+                               f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
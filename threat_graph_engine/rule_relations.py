@@ -0,0 +1,266 @@
+"""
+Deterministic relation extraction over NER output.
+
+Runs before the LLM. Entity mentions are located in the text and lexical
+patterns are matched between neighbouring mentions of the same sentence,
+e.g. "APT29 used Mimikatz and Cobalt Strike" or "CVE-2021-44228 was
+exploited by APT41". A pattern is a source/target type pair plus a trigger
+phrase in the gap between the two mentions; active patterns do not fire on
+a passive gap ("dropped by"). Coordinated lists ("X, Y and Z") are expanded
+on both sides.
+
+Every pair of co-mentioned entities that some rule could have related, but
+none did, is "unexplained". Only documents with unexplained pairs need the
+LLM; everything else is done here.
+"""
+
+import bisect
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from .schemas import EntityType, RelationshipType, ThreatEntity, ThreatRelationship
+
+logger = logging.getLogger(__name__)
+
+ACTORS = frozenset({EntityType.THREAT_ACTOR.value, EntityType.MALWARE.value})
+CAPABILITIES = frozenset({EntityType.TOOL.value, EntityType.MALWARE.value, EntityType.SCRIPT.value,
+                          EntityType.EXPLOIT.value, EntityType.TTP.value, EntityType.MITRE_TECHNIQUE.value})
+VULNERABILITIES = frozenset({EntityType.CVE.value, EntityType.VULNERABILITY.value})
+EXPLOITERS = frozenset({EntityType.THREAT_ACTOR.value, EntityType.MALWARE.value, EntityType.EXPLOIT.value,
+                        EntityType.TOOL.value})
+VICTIMS = frozenset({EntityType.ORGANIZATION.value, EntityType.LOCATION.value})
+PRODUCTS = frozenset({EntityType.TOOL.value, EntityType.ORGANIZATION.value, EntityType.MISC.value})
+MALWARE = frozenset({EntityType.MALWARE.value})
+
+# Words allowed between two mentions for a rule to fire (trigger included)
+MAX_GAP_WORDS = 6
+
+
+class RelationRule(NamedTuple):
+    name: str
+    first_types: FrozenSet[str]   # types of the mention before the trigger
+    trigger: str                  # regex matched as whole words in the gap
+    second_types: FrozenSet[str]  # types of the mention after the trigger
+    relationship: RelationshipType
+    confidence: float
+    passive: bool = False         # True: the second mention is the source
+
+
+RELATION_RULES: Sequence[RelationRule] = (
+    RelationRule("uses", ACTORS,
+                 r"use[sd]?|using|employ(?:s|ed|ing)?|deploy(?:s|ed|ing)?|leverag(?:es|ed|ing)|"
+                 r"drop(?:s|ped|ping)?|utili[sz](?:es|ed|ing)|rel(?:y|ies|ied) on|install(?:s|ed|ing)?",
+                 CAPABILITIES, RelationshipType.USES, 0.9),
+    RelationRule("used_by", CAPABILITIES, r"(?:used|deployed|leveraged|employed|dropped|installed) by",
+                 ACTORS, RelationshipType.USES, 0.85, passive=True),
+    RelationRule("exploits", EXPLOITERS, r"exploit(?:s|ed|ing)?|weaponi[sz](?:es|ed|ing)|abus(?:es|ed|ing)",
+                 VULNERABILITIES, RelationshipType.EXPLOITS, 0.9),
+    RelationRule("exploited_by", VULNERABILITIES, r"(?:exploited|weaponi[sz]ed|abused) by",
+                 EXPLOITERS, RelationshipType.EXPLOITS, 0.85, passive=True),
+    RelationRule("targets", ACTORS,
+                 r"target(?:s|ed|ing)?|attack(?:s|ed|ing)?|compromis(?:es|ed|ing)|breach(?:es|ed|ing)?|against",
+                 VICTIMS, RelationshipType.TARGETS, 0.85),
+    RelationRule("targeted_by", VICTIMS, r"(?:targeted|attacked|compromised|breached) by",
+                 ACTORS, RelationshipType.TARGETS, 0.8, passive=True),
+    RelationRule("affects", VULNERABILITIES, r"affect(?:s|ed|ing)?|impact(?:s|ed|ing)?|(?:vulnerability|flaw|bug) in",
+                 PRODUCTS, RelationshipType.TARGETS, 0.8),
+    RelationRule("variant_of", MALWARE, r"(?:variant|version|fork|offshoot|successor) of|derived from|based on",
+                 MALWARE, RelationshipType.DERIVES_FROM, 0.85),
+)
+
+# KEV-style "Microsoft Exchange Server contains a remote code execution vulnerability"
+PRODUCT_VULNERABILITY = re.compile(
+    r"^\s*(?:contains?|has|had|is affected by|suffers? from)\b[^.]*?\b(?:vulnerabilit(?:y|ies)|flaw)\b", re.IGNORECASE)
+PRODUCT_VULNERABILITY_CONFIDENCE = 0.8
+
+COORDINATION = re.compile(r"^\s*(?:,|/|,?\s*(?:and|or|&|as well as|along with|plus))\s*(?:,\s*)?(?:the\s+)?$",
+                          re.IGNORECASE)
+# "n't" has no word boundary in front of it ("didn't"), so it is matched on its own
+NEGATION = re.compile(r"(?:\b(?:not|never|no|without|neither|nor)\b|n't\b)", re.IGNORECASE)
+# "was dropped by", "attacked by": the second mention is the agent, so only passive rules may fire
+PASSIVE_VOICE = re.compile(r"\b\w+ed\s+by\b|\bby\s*$", re.IGNORECASE)
+SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+(?=[A-Z0-9\"'(\[])|\n+")
+WORD = re.compile(r"\w+")
+
+
+def _type(value) -> str:
+    return str(getattr(value, "value", value))
+
+
+class Mention(NamedTuple):
+    start: int
+    end: int
+    sentence: int
+    entities: Tuple[ThreatEntity, ...]
+
+
+@dataclass
+class RuleResult:
+    relationships: List[ThreatRelationship] = field(default_factory=list)
+    # (entity, entity) name pairs some rule could relate but none did
+    unexplained_pairs: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def needs_llm(self) -> bool:
+        return bool(self.unexplained_pairs)
+
+
+def relationship_key(r: ThreatRelationship) -> Tuple[str, str, str, str, str]:
+    return (r.source_name, _type(r.source_type), r.target_name, _type(r.target_type), _type(r.relationship_type))
+
+
+def merge_relationships(first: Iterable[ThreatRelationship], second: Iterable[ThreatRelationship]
+                        ) -> List[ThreatRelationship]:
+    """Union of both lists; on duplicates the entry from first wins."""
+    merged: Dict[Tuple[str, str, str, str, str], ThreatRelationship] = {}
+    for r in list(first) + list(second):
+        merged.setdefault(relationship_key(r), r)
+    return list(merged.values())
+
+
+def _compatible(a: str, b: str) -> bool:
+    return any((a in rule.first_types and b in rule.second_types) or (b in rule.first_types and a in rule.second_types)
+               for rule in RELATION_RULES)
+
+
+RELATABLE_TYPES = frozenset().union(*(rule.first_types | rule.second_types for rule in RELATION_RULES))
+
+
+class RuleRelationExtractor:
+    """Stateless apart from the compiled rules; safe to share between threads."""
+
+    def __init__(self, rules: Sequence[RelationRule] = RELATION_RULES, max_gap_words: int = MAX_GAP_WORDS):
+        self.rules = [(rule, re.compile(rf"\b(?:{rule.trigger})\b", re.IGNORECASE)) for rule in rules]
+        self.max_gap_words = max_gap_words
+
+    def locate(self, text: str, entities: List[ThreatEntity]) -> List[Mention]:
+        """All mentions of the entities' names, surface forms and aliases, longest match first."""
+        by_form: Dict[str, List[ThreatEntity]] = {}
+        for entity in entities:
+            forms = {entity.name, (entity.text or "").strip().lower(), *entity.aliases}
+            for form in forms:
+                if len(form) >= 2 and entity not in by_form.setdefault(form, []):
+                    by_form[form].append(entity)
+        if not by_form:
+            return []
+        pattern = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(f) for f in sorted(by_form, key=len, reverse=True))
+                             + r")(?!\w)", re.IGNORECASE)
+        breaks = [m.start() for m in SENTENCE_BREAK.finditer(text)]
+        return [Mention(m.start(), m.end(), bisect.bisect_right(breaks, m.start()), tuple(by_form[m.group(0).lower()]))
+                for m in pattern.finditer(text)]
+
+    def extract(self, text: str, entities: List[ThreatEntity]) -> RuleResult:
+        result = RuleResult()
+        relatable = [e for e in entities if _type(e.type) in RELATABLE_TYPES]
+        if len(relatable) < 2 or not text:
+            return result
+        mentions = self.locate(text, relatable)
+        found: Dict[Tuple[str, str, str, str, str], ThreatRelationship] = {}
+
+        def emit(source: ThreatEntity, target: ThreatEntity, relationship: RelationshipType, confidence: float,
+                 rule: str, span: Tuple[int, int]):
+            if source.name == target.name:
+                return
+            r = ThreatRelationship(source_name=source.name, source_type=_type(source.type),
+                                   target_name=target.name, target_type=_type(target.type),
+                                   relationship_type=relationship.value, confidence=confidence,
+                                   description=f"{rule}: {' '.join(text[span[0]:span[1]].split())[:200]}")
+            found.setdefault(relationship_key(r), r)
+
+        for i in range(len(mentions) - 1):
+            left, right = mentions[i], mentions[i + 1]
+            if left.sentence != right.sentence:
+                continue
+            gap = text[left.end:right.start]
+            if len(WORD.findall(gap)) > self.max_gap_words or NEGATION.search(gap):
+                continue
+            passive_gap = bool(PASSIVE_VOICE.search(gap))
+            for rule, trigger in self.rules:
+                if (passive_gap and not rule.passive) or not trigger.search(gap):
+                    continue
+                firsts = self._coordinated(text, mentions, i, -1, rule.first_types)
+                seconds = self._coordinated(text, mentions, i + 1, 1, rule.second_types)
+                for first, first_entity in firsts:
+                    for second, second_entity in seconds:
+                        source, target = (second_entity, first_entity) if rule.passive else (first_entity, second_entity)
+                        emit(source, target, rule.relationship, rule.confidence, rule.name,
+                             (min(first.start, second.start), max(first.end, second.end)))
+        self._product_vulnerability(text, mentions, relatable, emit)
+
+        result.relationships = list(found.values())
+        result.unexplained_pairs = self._unexplained(mentions, relatable, result.relationships)
+        return result
+
+    def _coordinated(self, text: str, mentions: List[Mention], index: int, step: int,
+                     types: FrozenSet[str]) -> List[Tuple[Mention, ThreatEntity]]:
+        """The mention at index plus any run of mentions coordinated with it, as (mention, entity) pairs."""
+        picked = []
+        j = index
+        while 0 <= j < len(mentions):
+            mention = mentions[j]
+            matching = [e for e in mention.entities if _type(e.type) in types]
+            if not matching:
+                break
+            picked.extend((mention, e) for e in matching)
+            k = j + step
+            if not 0 <= k < len(mentions) or mentions[k].sentence != mention.sentence:
+                break
+            lo, hi = (mentions[k], mention) if step < 0 else (mention, mentions[k])
+            if not COORDINATION.match(text[lo.end:hi.start]):
+                break
+            j = k
+        return picked
+
+    def _product_vulnerability(self, text, mentions, entities, emit):
+        # Only when the document names exactly one vulnerability, so the product cannot be mismatched
+        vulnerabilities = [e for e in entities if _type(e.type) in VULNERABILITIES]
+        if len(vulnerabilities) != 1:
+            return
+        for index, mention in enumerate(mentions):
+            following = mentions[index + 1] if index + 1 < len(mentions) else None
+            end = following.start if following is not None and following.sentence == mention.sentence else len(text)
+            if not PRODUCT_VULNERABILITY.match(text[mention.end:end]):
+                continue
+            for product in mention.entities:
+                if _type(product.type) in PRODUCTS:
+                    emit(vulnerabilities[0], product, RelationshipType.TARGETS, PRODUCT_VULNERABILITY_CONFIDENCE,
+                         "product_vulnerability", (mention.start, mention.end))
+
+    def _unexplained(self, mentions: List[Mention], entities: List[ThreatEntity],
+                     relationships: List[ThreatRelationship]) -> List[Tuple[str, str]]:
+        linked: Set[FrozenSet[str]] = {frozenset((r.source_name, r.target_name)) for r in relationships}
+        explained = {name for r in relationships for name in (r.source_name, r.target_name)}
+        pairs: Set[FrozenSet[str]] = set()
+        by_sentence: Dict[int, List[ThreatEntity]] = {}
+        for mention in mentions:
+            by_sentence.setdefault(mention.sentence, []).extend(mention.entities)
+        for sentence_entities in by_sentence.values():
+            for a in range(len(sentence_entities)):
+                for b in range(a + 1, len(sentence_entities)):
+                    x, y = sentence_entities[a], sentence_entities[b]
+                    pair = frozenset((x.name, y.name))
+                    if len(pair) < 2 or pair in linked or pair in pairs:
+                        continue
+                    if x.name in explained and y.name in explained:
+                        continue
+                    if _compatible(_type(x.type), _type(y.type)):
+                        pairs.add(pair)
+        # Entities the text never names literally (normalised, enriched) can only be judged by the LLM
+        located = {e.name for mention in mentions for e in mention.entities}
+        for entity in entities:
+            if entity.name not in located and entity.name not in explained:
+                pairs.add(frozenset((entity.name, "*")))
+        return sorted(tuple(sorted(pair)) for pair in pairs)
+
+
+_extractor: Optional[RuleRelationExtractor] = None
+
+
+def extract_rule_relationships(text: str, entities: List[ThreatEntity]) -> RuleResult:
+    """Rule relations for one document and the entity pairs they leave unexplained."""
+    global _extractor
+    if _extractor is None:
+        _extractor = RuleRelationExtractor()
+    return _extractor.extract(text, entities)
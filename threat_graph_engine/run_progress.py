@@ -0,0 +1,99 @@
+"""
+Live throughput and ETA for a pipeline run.
+
+Estimates come from the main loop itself rather than a separate timing
+pass. Each finished block updates exponential moving averages of seconds
+per document, both overall and per stage (NER, enrichment, relations,
+persistence). Recent blocks therefore dominate: a warm LLM cache or a
+rate-limit stall shows up in the ETA within a few blocks.
+"""
+
+import datetime
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMA_ALPHA = 0.2
+DEFAULT_REPORT_INTERVAL = 30.0
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class ProgressEstimator:
+    """
+    update() after every finished block with the number of documents and the
+    cumulative per-stage seconds so far (stage time is summed across pool
+    workers, so with several workers it exceeds wall time).
+    """
+
+    def __init__(self, total: int, alpha: float = DEFAULT_EMA_ALPHA,
+                 report_interval: float = DEFAULT_REPORT_INTERVAL, clock=time.monotonic):
+        self.total = total
+        self.alpha = alpha
+        self.report_interval = report_interval
+        self._clock = clock
+        self.started = clock()
+        self._last = self.started
+        self._last_report = self.started
+        self.done = 0
+        self._seconds_per_doc: Optional[float] = None
+        self._stage_totals: Dict[str, float] = {}
+        self._stage_per_doc: Dict[str, float] = {}
+
+    def _ema(self, previous: Optional[float], value: float) -> float:
+        return value if previous is None else self.alpha * value + (1 - self.alpha) * previous
+
+    def update(self, docs: int, stage_seconds: Optional[Dict[str, float]] = None):
+        if docs <= 0:
+            return
+        now = self._clock()
+        self._seconds_per_doc = self._ema(self._seconds_per_doc, (now - self._last) / docs)
+        self._last = now
+        self.done += docs
+        for stage, total in (stage_seconds or {}).items():
+            spent = total - self._stage_totals.get(stage, 0.0)
+            self._stage_totals[stage] = total
+            self._stage_per_doc[stage] = self._ema(self._stage_per_doc.get(stage), spent / docs)
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            self._last_report = now
+            logger.info(self.summary())
+
+    @property
+    def rate(self) -> float:
+        """Moving-average documents per second."""
+        return 1 / self._seconds_per_doc if self._seconds_per_doc else 0.0
+
+    @property
+    def overall_rate(self) -> float:
+        elapsed = self._last - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        if self._seconds_per_doc is None:
+            return None
+        return max(0, self.total - self.done) * self._seconds_per_doc
+
+    def postfix(self) -> str:
+        """Short form for the progress bar."""
+        eta = self.eta_seconds
+        return f"{self.rate:.2f} docs/s, ETA {format_duration(eta) if eta is not None else '?'}"
+
+    def summary(self) -> str:
+        eta = self.eta_seconds
+        if eta is None:
+            projection = "ETA unknown"
+        else:
+            finish = datetime.datetime.now() + datetime.timedelta(seconds=eta)
+            projection = f"ETA {format_duration(eta)} (finish ~{finish:%H:%M:%S})"
+        stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self._stage_per_doc.items())
+        return (f"Progress {self.done}/{self.total} ({self.done / max(self.total, 1):.0%}) | "
+                f"{self.rate:.2f} docs/sec (run average {self.overall_rate:.2f}) | {projection}"
+                + (f" | per doc: {stages}" if stages else ""))
@@ -0,0 +1,247 @@
+"""
+Staged, pipelined executor.
+
+Each stage has its own worker threads and a bounded input queue, so a
+document can be in NER while earlier ones wait on the LLM and older ones
+are being written to Neo4j. Stages with very different resource profiles
+(CPU-bound model, in-memory lookup, network-bound LLM and database) are
+sized independently. A full queue blocks the stage before it, so memory
+stays bounded and the slowest stage sets the pace.
+
+Every stage records busy time (utilization = busy / (workers * wall)),
+queue depth, and histograms of queue wait and service time, which show
+where the bottleneck is.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from .pipeline_metrics import LatencyHistogram, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STAGE_QUEUE_SIZE = 64
+DEFAULT_BATCH_WAIT = 0.05
+
+_STOP = object()
+
+
+class Stage(NamedTuple):
+    """
+    func takes one item and returns the item for the next stage, or None to
+    drop it. With batch_size > 1 it takes and returns a list instead (same
+    order, None entries dropped), e.g. for batched NER.
+    """
+    name: str
+    func: Callable
+    workers: int = 1
+    queue_size: int = DEFAULT_STAGE_QUEUE_SIZE
+    batch_size: int = 1
+
+
+class _StageState:
+    def __init__(self, stage: Stage):
+        self.stage = stage
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max(1, stage.queue_size))
+        self.lock = threading.Lock()
+        self.live_workers = stage.workers
+        self.busy = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.depth_sum = 0
+        self.depth_samples = 0
+        self.wait = LatencyHistogram()
+        self.service = LatencyHistogram()
+
+
+class StageExecutor:
+    """
+    submit() feeds the first stage (blocking while its queue is full); what
+    the last stage returns goes to on_complete. Exceptions raised by a stage
+    are logged and the item is dropped, as are items a stage returns None
+    for, so callers only checkpoint what made it all the way through.
+    on_complete runs on the last stage's worker threads; on_drop gets every
+    item that failed or was dropped (the input of the stage that lost it),
+    on that stage's worker thread, so each submitted item ends in exactly
+    one of the two.
+    close() waits until everything submitted has drained through.
+    With a registry, queue depth, wait and service times and item outcomes
+    are also published there (labelled by stage) while the run is live.
+    """
+
+    def __init__(self, stages: List[Stage], on_complete: Optional[Callable[[Any], None]] = None,
+                 batch_wait: float = DEFAULT_BATCH_WAIT, registry: Optional[MetricsRegistry] = None,
+                 on_drop: Optional[Callable[[Any], None]] = None):
+        if not stages:
+            raise ValueError("StageExecutor needs at least one stage")
+        self._states = [_StageState(stage) for stage in stages]
+        self.on_complete = on_complete
+        self.on_drop = on_drop
+        self.batch_wait = batch_wait
+        self.registry = registry
+        self._closed = False
+        self._started = time.monotonic()
+        self._finished: Optional[float] = None
+        self._threads: List[threading.Thread] = []
+        for index, state in enumerate(self._states):
+            for n in range(max(1, state.stage.workers)):
+                thread = threading.Thread(target=self._run, args=(index,), name=f"stage-{state.stage.name}-{n}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, item: Any, timeout: Optional[float] = None):
+        if self._closed:
+            raise RuntimeError("StageExecutor is closed")
+        self._put(0, item, timeout)
+
+    def _put(self, index: int, item: Any, timeout: Optional[float] = None):
+        state = self._states[index]
+        state.queue.put((time.monotonic(), item), timeout=timeout)
+        depth = state.queue.qsize()
+        with state.lock:
+            state.max_depth = max(state.max_depth, depth)
+            state.depth_sum += depth
+            state.depth_samples += 1
+        if self.registry is not None:
+            self.registry.set('stage_queue_depth', depth, stage=state.stage.name)
+
+    def _take(self, state: _StageState) -> List:
+        """Next item, plus up to batch_size - 1 more arriving within batch_wait; _STOP ends the batch."""
+        entries = [state.queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(entries) < state.stage.batch_size and entries[-1][1] is not _STOP:
+            try:
+                entries.append(state.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return entries
+
+    def _run(self, index: int):
+        state = self._states[index]
+        stage = state.stage
+        while True:
+            entries = self._take(state)
+            stopping = entries[-1][1] is _STOP
+            if stopping:
+                entries.pop()
+            if entries:
+                self._process(index, state, entries)
+            if stopping:
+                break
+        with state.lock:
+            state.live_workers -= 1
+            last = state.live_workers == 0
+        if last:
+            if self.registry is not None:
+                self.registry.set('stage_queue_depth', 0, stage=stage.name)
+            # The last worker out passes the stop on, once per downstream worker
+            if index + 1 < len(self._states):
+                for _ in range(max(1, self._states[index + 1].stage.workers)):
+                    self._states[index + 1].queue.put((0.0, _STOP))
+            else:
+                self._finished = time.monotonic()
+        logger.debug(f"Stage {stage.name} worker exiting")
+
+    def _process(self, index: int, state: _StageState, entries: List):
+        stage = state.stage
+        start = time.monotonic()
+        items = [item for _, item in entries]
+        try:
+            outputs = stage.func(items) if stage.batch_size > 1 else [stage.func(items[0])]
+        except Exception as e:
+            logger.error(f"Stage {stage.name} failed on {len(items)} item(s): {e}")
+            outputs = None
+        elapsed = time.monotonic() - start
+        with state.lock:
+            state.busy += elapsed
+            for enqueued, _ in entries:
+                state.wait.observe(start - enqueued)
+                state.service.observe(elapsed)
+            if outputs is not None:
+                state.processed += len(items)
+                state.dropped += sum(1 for output in outputs if output is None)
+            else:
+                state.failed += len(items)
+        if self.registry is not None:
+            self.registry.inc('stage_busy_seconds', elapsed, stage=stage.name)
+            self.registry.set('stage_queue_depth', state.queue.qsize(), stage=stage.name)
+            for enqueued, _ in entries:
+                self.registry.observe('stage_queue_wait_seconds', start - enqueued, stage=stage.name)
+                self.registry.observe('stage_service_seconds', elapsed, stage=stage.name)
+            self.registry.inc('stage_items', len(items), stage=stage.name,
+                              outcome='failed' if outputs is None else 'processed')
+        if outputs is None:
+            self._dropped(items)
+            return
+
+        for item, output in zip(items, outputs):
+            if output is None:
+                self._dropped([item])
+                continue
+            if index + 1 < len(self._states):
+                self._put(index + 1, output)
+            elif self.on_complete is not None:
+                try:
+                    self.on_complete(output)
+                except Exception as e:
+                    logger.error(f"StageExecutor completion callback failed: {e}")
+
+    def _dropped(self, items: List):
+        if self.on_drop is None:
+            return
+        for item in items:
+            try:
+                self.on_drop(item)
+            except Exception as e:
+                logger.error(f"StageExecutor drop callback failed: {e}")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in range(max(1, self._states[0].stage.workers)):
+            self._states[0].queue.put((0.0, _STOP))
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        wall = max((self._finished or time.monotonic()) - self._started, 1e-9)
+        stats = {}
+        for state in self._states:
+            with state.lock:
+                stats[state.stage.name] = {
+                    "workers": state.stage.workers,
+                    "processed": state.processed,
+                    "failed": state.failed,
+                    "dropped": state.dropped,
+                    "utilization": round(state.busy / (max(1, state.stage.workers) * wall), 3),
+                    "queue_depth": state.queue.qsize(),
+                    "max_queue_depth": state.max_depth,
+                    "mean_queue_depth": round(state.depth_sum / max(state.depth_samples, 1), 2),
+                    "wait": state.wait.snapshot(),
+                    "service": state.service.snapshot(),
+                }
+        return stats
+
+    def report(self) -> List[str]:
+        """One line per stage for the run log."""
+        lines = []
+        all_stats = self.stats()
+        for state in self._states:
+            stats = all_stats[state.stage.name]
+            with state.lock:
+                quantiles = {name: [histogram.quantile(q) for q in (0.5, 0.95, 0.99)]
+                             for name, histogram in (("wait", state.wait), ("service", state.service))}
+            lines.append(
+                f"Stage {state.stage.name}: {stats['workers']} workers, {stats['utilization']:.0%} utilized, "
+                f"{stats['processed']} processed, {stats['failed']} failed, {stats['dropped']} dropped, "
+                f"queue depth max {stats['max_queue_depth']} mean {stats['mean_queue_depth']}, "
+                + ", ".join(f"{name} p50/p95/p99 " + "/".join(f"{v:.3f}s" if v is not None else "-" for v in values)
+                            for name, values in quantiles.items()))
+        return lines
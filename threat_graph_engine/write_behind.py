@@ -0,0 +1,152 @@
+"""
+Write-behind queue between extraction and Neo4j persistence.
+Producers hand over entities/relationships and return immediately; a
+background thread accumulates them and flushes through the persistor's bulk
+UNWIND paths when enough rows are pending or flush_interval has passed.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from .schemas import ThreatEntity, ThreatRelationship
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_FLUSH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+_ENTITY, _RELATIONSHIP, _CALLBACK, _FLUSH, _STOP = range(5)
+
+
+class _Submission:
+    """One submit() call; its rows may be spread over several flushes."""
+    __slots__ = ("failed",)
+
+    def __init__(self):
+        self.failed = False
+
+
+class WriteBehindWriter:
+    """
+    Bounded write-behind buffer with a single writer thread.
+    - submit() blocks when the queue is full, so extraction cannot outrun the database
+    - on_written callbacks fire after everything submitted with them has been flushed,
+      with True on success and False if any flush holding rows of that submit failed
+      (a submit's rows can span several flushes)
+    - close() drains the queue and performs a final flush
+    """
+
+    def __init__(self, persistor, max_queue: int = DEFAULT_QUEUE_SIZE, flush_size: int = DEFAULT_FLUSH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, batch_size: Optional[int] = None):
+        self.persistor = persistor
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size or flush_size
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._stats: Dict[str, int] = {
+            "entities_written": 0,
+            "relationships_written": 0,
+            "failed_flushes": 0,
+            "flushes": 0,
+            "max_queue_depth": 0,
+        }
+        self._thread = threading.Thread(target=self._run, name="neo4j-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, entities: List[ThreatEntity], relationships: List[ThreatRelationship],
+               on_written: Optional[Callable[[bool], None]] = None, timeout: Optional[float] = None):
+        if self._closed:
+            raise RuntimeError("WriteBehindWriter is closed")
+        submission = _Submission()
+        for entity in entities:
+            self._queue.put((_ENTITY, (entity, submission)), timeout=timeout)
+        for relation in relationships:
+            self._queue.put((_RELATIONSHIP, (relation, submission)), timeout=timeout)
+        if on_written is not None:
+            self._queue.put((_CALLBACK, (on_written, submission)), timeout=timeout)
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue.qsize())
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until everything submitted so far has been written."""
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_STOP, None))
+        self._thread.join()
+        logger.info(f"Write-behind writer closed: {self.stats()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "queue_depth": self._queue.qsize()}
+
+    def _run(self):
+        entities: List[ThreatEntity] = []
+        relationships: List[ThreatRelationship] = []
+        callbacks: List[Tuple[Callable[[bool], None], _Submission]] = []
+        # Submissions with rows in the current buffers
+        submissions: Set[_Submission] = set()
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            try:
+                kind, item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                kind, item = None, None
+
+            if kind == _ENTITY:
+                entities.append(item[0])
+                submissions.add(item[1])
+            elif kind == _RELATIONSHIP:
+                relationships.append(item[0])
+                submissions.add(item[1])
+            elif kind == _CALLBACK:
+                callbacks.append(item)
+
+            pending = len(entities) + len(relationships)
+            due = kind in (None, _FLUSH, _STOP) or pending >= self.flush_size
+            if due and (pending or callbacks):
+                self._flush(entities, relationships, callbacks, submissions)
+                entities, relationships, callbacks, submissions = [], [], [], set()
+            if due:
+                deadline = time.monotonic() + self.flush_interval
+            if kind == _FLUSH:
+                item.set()
+            elif kind == _STOP:
+                return
+
+    def _flush(self, entities: List[ThreatEntity], relationships: List[ThreatRelationship],
+               callbacks: List[Tuple[Callable[[bool], None], _Submission]], submissions: Set[_Submission]):
+        ok = True
+        # Entities first so relationship MERGEs find the nodes they point at
+        try:
+            if entities:
+                self._stats["entities_written"] += self.persistor.save_entities_bulk(entities, batch_size=self.batch_size)
+        except Exception as e:
+            ok = False
+            logger.error(f"Write-behind flush of {len(entities)} entities failed: {e}")
+        try:
+            if relationships:
+                self._stats["relationships_written"] += self.persistor.save_relationships_bulk(
+                    relationships, batch_size=self.batch_size)
+        except Exception as e:
+            ok = False
+            logger.error(f"Write-behind flush of {len(relationships)} relationships failed: {e}")
+
+        self._stats["flushes"] += 1
+        if not ok:
+            self._stats["failed_flushes"] += 1
+            for submission in submissions:
+                submission.failed = True
+        for callback, submission in callbacks:
+            try:
+                callback(not submission.failed)
+            except Exception as e:
+                logger.error(f"Write-behind callback failed: {e}")
@@ -1,13 +1,18 @@
 import sys
 import os
 import time, datetime
+import random
+import contextlib
+import threading
 from tqdm import tqdm  # progress bar with ETA
 from pathlib import Path
 import logging
-from typing import List, Tuple, Set
-import json
+from typing import Callable, Dict, List, Optional, Tuple, Set
 import functools
+from collections import deque
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
 
 # Load environment variables from .env if present
@@ -17,110 +22,441 @@ load_dotenv()
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from KG_pipeline.schemas import ThreatEntity, ThreatRelationship
-from KG_pipeline.ner_extractor import perform_hybrid_ner
-from KG_pipeline.relation_extractor import extract_relationships_llm
+from KG_pipeline.ner_extractor import (perform_hybrid_ner, perform_hybrid_ner_batch, ner_registry,
+                                       DEFAULT_NER_BATCH_SIZE, DEFAULT_WINDOW_TOKENS, DEFAULT_WINDOW_STRIDE)
+from KG_pipeline.relation_extractor import (extract_relationships_llm, extract_relationships_llm_packed,
+                                           stream_relationships_llm, DEFAULT_PACK_TOKEN_BUDGET)
+from KG_pipeline.rule_relations import extract_rule_relationships, merge_relationships, relationship_key
+from KG_pipeline.llm_cache import (configure_relation_cache, get_relation_cache, DEFAULT_LLM_CACHE_PATH,
+                                   DEFAULT_MAX_ENTRIES, DEFAULT_MAX_AGE_DAYS)
+from KG_pipeline.llm_clients import LLMClientConfig, configure_llm_clients
+from KG_pipeline.async_relation_extractor import (create_groq_engine, DEFAULT_RPM, DEFAULT_TPM,
+                                                  DEFAULT_LLM_CONCURRENCY)
 from KG_pipeline.mitre_stix_integrator import enrich_entities_with_mitre_stix
-from KG_pipeline.neo4j_persistor import Neo4jPersistor
+from KG_pipeline.mitre_fuzzy import DEFAULT_FUZZY_THRESHOLD
+from KG_pipeline.neo4j_persistor import (Neo4jPersistor, DEFAULT_WRITE_BATCH_SIZE, DEFAULT_POOL_SIZE,
+                                         DEFAULT_ACQUISITION_TIMEOUT, DEFAULT_CONNECTION_LIFETIME)
 from KG_pipeline.ingestion import ingest_data
+from KG_pipeline.write_behind import DEFAULT_QUEUE_SIZE, DEFAULT_FLUSH_INTERVAL
+from KG_pipeline.checkpoint_journal import (CheckpointJournal, content_hash, DEFAULT_FSYNC_POLICY, FSYNC_ALWAYS,
+                                           FSYNC_INTERVAL, FSYNC_NEVER)
+from KG_pipeline.run_progress import ProgressEstimator
+from KG_pipeline.pipeline_metrics import MetricsRegistry, start_metrics_server, DEFAULT_METRICS_HOST
+from KG_pipeline.stage_executor import Stage, StageExecutor, DEFAULT_STAGE_QUEUE_SIZE
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_JOURNAL = Path("processed_records.jsonl")
+# Pre-journal checkpoint (JSON array of keys); imported once if no journal exists
 CHECKPOINT_FILE = Path("processed_records.json")
 
-metrics = {
-    'empty_texts': 0,
-    'total_entities': 0,
-    'total_relationships': 0,
-    'malformed_docs': 0
+# Run metrics; pool workers keep their own registry and send it back drained with every block
+metrics = MetricsRegistry()
+METRIC_HELP = {
+    'documents_empty': 'Documents without text, by source',
+    'documents_malformed': 'Documents whose processing raised, by source',
+    'entities': 'Entities extracted, by source',
+    'relationships': 'Relationships extracted, by source',
+    'rule_relationships': 'Relationships found by the rule tier, by source',
+    'llm_escalations': 'Documents the rule tier sent on to the LLM, by source',
+    'llm_calls_avoided': 'Documents the rule tier settled without the LLM, by source',
+    'documents_checkpointed': 'Documents journaled after persistence, by status and source',
+    'stage_seconds': 'Seconds per document in each pipeline stage, by stage and source',
+    'documents_remaining': 'Documents of this run not yet processed',
+    'docs_per_second': 'Moving-average processing rate',
+    'eta_seconds': 'Projected seconds until the run finishes',
 }
+for _name, _help in METRIC_HELP.items():
+    metrics.describe(_name, _help)
+STAGES = ('ner', 'enrich', 'relations', 'persist')
+# Threads per stage for --staged runs: the LLM stage waits on the network, so it gets the most
+DEFAULT_STAGE_WORKERS = {'ner': 1, 'enrich': 1, 'relations': 4, 'persist': 1}
 
-def timeit(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        start = time.time()
-        result = func(*args, **kwargs)
-        elapsed = time.time() - start
-        logger.info(f"Step {func.__name__} took {elapsed:.2f}s")
-        return result
-    return wrapper
-
-def load_checkpoint() -> Set[int]:
-    if CHECKPOINT_FILE.exists():
-        with CHECKPOINT_FILE.open("r") as f:
-            processed = set(json.load(f))
-            logger.info(f"Loaded checkpoint with {len(processed)} processed records.")
-            return processed
-    return set()
-
-def save_checkpoint(processed_ids: Set[int]):
-    with CHECKPOINT_FILE.open("w") as f:
-        json.dump(list(processed_ids), f)
-    logger.debug(f"Saved checkpoint with {len(processed_ids)} processed records.")
-
-@timeit
-def process_document(doc: dict) -> Tuple[List[ThreatEntity], List[ThreatRelationship]]:
+def source_label(doc: dict) -> str:
+    return doc.get("source") or "unknown"
+
+@contextlib.contextmanager
+def timed_stage(stage: str, *sources: str):
+    """
+    Records the block's duration in the stage_seconds histogram, split evenly
+    over the documents it covered (one source label per document).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        sources = sources or ("unknown",)
+        for source in sources:
+            metrics.observe('stage_seconds', elapsed / len(sources), stage=stage, source=source)
+
+def stage_seconds() -> Dict[str, float]:
+    """Total seconds spent so far in each stage (summed over documents and pool workers)."""
+    return {stage: metrics.value('stage_seconds', stage=stage) for stage in STAGES}
+
+def select_documents(documents: List[dict], limit: Optional[int] = None, sample: Optional[int] = None,
+                     seed: Optional[int] = None) -> List[dict]:
+    """
+    Narrows a run for trials: a random sample of `sample` documents (reproducible
+    with seed, original order kept), then at most the first `limit` of them.
+    """
+    if sample is not None and sample < len(documents):
+        chosen = set(random.Random(seed).sample(range(len(documents)), sample))
+        documents = [doc for n, doc in enumerate(documents) if n in chosen]
+    if limit is not None:
+        documents = documents[:limit]
+    return documents
+
+def checkpoint_key(doc: dict):
+    """
+    Checkpoint key of a document: its content-derived record_key (source,
+    indicator and text hash; record_id for files chunked before record keys
+    existed), or record_key:chunk_index for chunk documents.
+    """
+    record = doc.get("record_key") or doc.get("record_id")
+    if doc.get("chunk_index") is not None:
+        return f"{record}:{doc.get('chunk_index')}"
+    return record
+
+def load_checkpoint(fsync: str = DEFAULT_FSYNC_POLICY, database: Optional[str] = None) -> CheckpointJournal:
+    """
+    The journal of documents persisted to database. Each non-default database
+    has its own journal, so a document done in one is not skipped for another.
+    """
+    if database:
+        return CheckpointJournal(CHECKPOINT_JOURNAL.with_name(f"{CHECKPOINT_JOURNAL.stem}.{database}.jsonl"),
+                                 fsync=fsync)
+    return CheckpointJournal(CHECKPOINT_JOURNAL, fsync=fsync, legacy_path=CHECKPOINT_FILE)
+
+def rule_tier(text: str, entities: List[ThreatEntity], enabled: bool = True,
+              source: str = "unknown") -> Tuple[List[ThreatRelationship], bool]:
+    """Rule-based relationships for a document and whether it still has to go to the LLM."""
+    if not enabled:
+        return [], True
+    result = extract_rule_relationships(text, entities)
+    metrics.inc('rule_relationships', len(result.relationships), source=source)
+    if result.needs_llm:
+        metrics.inc('llm_escalations', source=source)
+        logger.debug(f"Escalating to LLM, unexplained entity pairs: {result.unexplained_pairs}")
+    else:
+        metrics.inc('llm_calls_avoided', source=source)
+    return result.relationships, result.needs_llm
+
+def process_document(doc: dict, entities: Optional[List[ThreatEntity]] = None,
+                     mitre_fuzzy_threshold: Optional[float] = DEFAULT_FUZZY_THRESHOLD,
+                     extract_relations: bool = True,
+                     on_extracted: Optional[Callable[[List[ThreatEntity], List[ThreatRelationship]], None]] = None,
+                     rule_relations: bool = True
+                     ) -> Tuple[List[ThreatEntity], List[ThreatRelationship]]:
     """
     Processes a single document through the full KG pipeline:
     - NER → MITRE Enrichment → Relationship Extraction
+    If entities is given (e.g. from a batched NER pass), the NER step is skipped.
+    With extract_relations=False the relation step is left to the caller (async engine).
+    Relationships come from the rule tier first; the LLM is only asked when
+    entity pairs remain unexplained (always, with rule_relations=False).
+    on_extracted receives the enriched entities with the rule relationships,
+    then each LLM relationship as it streams in, so they can be persisted
+    before the completion finishes.
+    Errors are counted as malformed and re-raised, so the document is not checkpointed.
     """
     text = doc.get("text", "")
+    source = source_label(doc)
     if not text.strip():
         logger.warning(f"Empty text found in record_id: {doc.get('record_id')}")
-        metrics['empty_texts'] += 1
+        metrics.inc('documents_empty', source=source)
         return [], []
 
     try:
-        logger.info(f"Performing NER for record_id {doc.get('record_id')}")
-        entities = perform_hybrid_ner(text)
-        metrics['total_entities'] += len(entities)
+        if entities is None:
+            logger.info(f"Performing NER for record_id {doc.get('record_id')}")
+            with timed_stage('ner', source):
+                entities = perform_hybrid_ner(text)
+        metrics.inc('entities', len(entities), source=source)
 
         logger.info(f"Enriching entities with MITRE ATT&CK for record_id {doc.get('record_id')}")
-        enriched_entities = enrich_entities_with_mitre_stix(entities)
+        with timed_stage('enrich', source):
+            enriched_entities = enrich_entities_with_mitre_stix(entities, fuzzy_threshold=mitre_fuzzy_threshold)
+
+        if not extract_relations:
+            return enriched_entities, []
 
         logger.info(f"Extracting relationships for record_id {doc.get('record_id')}")
-        relationships = extract_relationships_llm(text, enriched_entities, groq_key=GROQ_API_KEY)
+        with timed_stage('relations', source):
+            relationships, needs_llm = rule_tier(text, enriched_entities, rule_relations, source)
+            if on_extracted is not None:
+                on_extracted(enriched_entities, relationships)
+                seen = {relationship_key(r) for r in relationships}
+                stream = stream_relationships_llm(text, enriched_entities, groq_key=GROQ_API_KEY) if needs_llm else ()
+                for relationship in stream:
+                    if relationship_key(relationship) not in seen:
+                        seen.add(relationship_key(relationship))
+                        on_extracted([], [relationship])
+                        relationships.append(relationship)
+            elif needs_llm:
+                relationships = merge_relationships(
+                    relationships, extract_relationships_llm(text, enriched_entities, groq_key=GROQ_API_KEY))
         #relationships = extract_relationships_llm(text, enriched_entities)
-        metrics['total_relationships'] += len(relationships)
+        metrics.inc('relationships', len(relationships), source=source)
 
         return enriched_entities, relationships
     except Exception as e:
         logger.error(f"Error processing record_id {doc.get('record_id')}: {e}")
-        metrics['malformed_docs'] += 1
-        return [], []
+        metrics.inc('documents_malformed', source=source)
+        raise
 
-def ingest_to_neo4j(entities: List[ThreatEntity], relationships: List[ThreatRelationship], db: Neo4jPersistor, dry_run: bool = False):
+def ingest_to_neo4j(entities: List[ThreatEntity], relationships: List[ThreatRelationship], db: Neo4jPersistor,
+                    dry_run: bool = False, batch_size: int = DEFAULT_WRITE_BATCH_SIZE) -> bool:
     """
-    Persists extracted entities and relationships to the Neo4j database.
+    Persists extracted entities and relationships to the Neo4j database
+    using batched UNWIND writes (one transaction per batch, one session for both).
+    Returns False if any write failed, so the caller does not checkpoint the document.
     """
     if dry_run:
         logger.info(f"Dry-run mode: would save {len(entities)} entities and {len(relationships)} relationships.")
-        return
+        return True
 
-    for entity in entities:
+    ok = True
+    with db.session_scope():
         try:
-            db.save_entity(entity)
+            db.save_entities_bulk(entities, batch_size=batch_size)
         except Exception as e:
-            logger.error(f"Failed to persist entity {entity.name}: {e}")
+            ok = False
+            logger.error(f"Failed to persist {len(entities)} entities: {e}")
 
-    for relation in relationships:
         try:
-            db.save_relationship(relation)
+            db.save_relationships_bulk(relationships, batch_size=batch_size)
         except Exception as e:
-            logger.error(f"Failed to persist relationship: {relation}: {e}")
+            ok = False
+            logger.error(f"Failed to persist {len(relationships)} relationships: {e}")
+    return ok
+
+def run_ner_batch(docs: List[dict], batch_size: int, window_tokens: Optional[int] = None,
+                  stride: int = DEFAULT_WINDOW_STRIDE) -> List[List[ThreatEntity]]:
+    """Runs batched NER over a block of documents, one entity list per document."""
+    return perform_hybrid_ner_batch([doc.get("text", "") for doc in docs], batch_size=batch_size,
+                                    window_tokens=window_tokens, stride=stride)
+
+def process_block(block: List[dict], ner_batch_size: int, ner_window: Optional[int] = None,
+                  stride: int = DEFAULT_WINDOW_STRIDE,
+                  mitre_fuzzy_threshold: Optional[float] = DEFAULT_FUZZY_THRESHOLD, extract_relations: bool = True,
+                  pack_token_budget: Optional[int] = None, rule_relations: bool = True,
+                  stream_sink: Optional[Callable[[str], Callable]] = None
+                  ) -> List[Tuple[str, List[ThreatEntity], List[ThreatRelationship]]]:
+    """
+    Batched NER plus per-document enrichment and relation extraction for one block.
+    Returns (checkpoint key, entities, relationships) for every document that
+    processed cleanly; failures are logged and left out so they are retried next run.
+    With pack_token_budget, small documents the rule tier could not settle share LLM requests.
+    stream_sink(key) gives each document's on_extracted callback (see process_document).
+    """
+    packed = bool(extract_relations and pack_token_budget)
+    try:
+        with timed_stage('ner', *map(source_label, block)):
+            block_entities = run_ner_batch(block, ner_batch_size, window_tokens=ner_window, stride=stride)
+    except Exception as e:
+        logger.error(f"Batched NER failed, falling back to per-document NER: {e}")
+        block_entities = [None] * len(block)
+
+    results = []
+    for doc, doc_entities in zip(block, block_entities):
+        try:
+            on_extracted = stream_sink(checkpoint_key(doc)) if stream_sink is not None and not packed else None
+            entities, relationships = process_document(doc, entities=doc_entities,
+                                                       mitre_fuzzy_threshold=mitre_fuzzy_threshold,
+                                                       extract_relations=extract_relations and not packed,
+                                                       on_extracted=on_extracted, rule_relations=rule_relations)
+            results.append((checkpoint_key(doc), entities, relationships))
+        except Exception as e:
+            logger.error(f"Processing failed for record_id {doc.get('record_id')}: {e}")
+
+    if packed and results:
+        texts = {checkpoint_key(doc): doc.get("text", "") for doc in block}
+        sources = {checkpoint_key(doc): source_label(doc) for doc in block}
+        with timed_stage('relations', *(sources[key] for key, _, _ in results)):
+            tiers = [rule_tier(texts[key], entities, rule_relations, sources[key]) for key, entities, _ in results]
+        escalated = [n for n, (_, needs_llm) in enumerate(tiers) if needs_llm]
+        block_relationships = [relationships for relationships, _ in tiers]
+        failed = set()
+        try:
+            with timed_stage('relations', *(sources[results[n][0]] for n in escalated)):
+                llm_relationships = extract_relationships_llm_packed(
+                    [(texts[results[n][0]], results[n][1]) for n in escalated], groq_key=GROQ_API_KEY,
+                    token_budget=pack_token_budget)
+        except Exception as e:
+            logger.error(f"Packed relation extraction failed for a block of {len(escalated)} documents, "
+                         f"falling back to per-document extraction: {e}")
+            llm_relationships = []
+            for n in escalated:
+                key, entities, _ = results[n]
+                try:
+                    with timed_stage('relations', sources[key]):
+                        llm_relationships.append(extract_relationships_llm(texts[key], entities, groq_key=GROQ_API_KEY))
+                except Exception as e:
+                    logger.error(f"Relation extraction failed for record {key}: {e}")
+                    metrics.inc('documents_malformed', source=sources[key])
+                    failed.add(n)
+                    llm_relationships.append([])
+        for n, relationships in zip(escalated, llm_relationships):
+            block_relationships[n] = merge_relationships(block_relationships[n], relationships)
+        for n, ((key, _, _), relationships) in enumerate(zip(results, block_relationships)):
+            if n not in failed:
+                metrics.inc('relationships', len(relationships), source=sources[key])
+        # Documents whose extraction failed are left out, so they are retried next run
+        results = [(key, entities, relationships)
+                   for n, ((key, entities, _), relationships) in enumerate(zip(results, block_relationships))
+                   if n not in failed]
+    return results
+
+def build_document_stages(persist: Callable[[str, List[ThreatEntity], List[ThreatRelationship]], None],
+                          ner_batch_size: int, ner_window: Optional[int] = None, stride: int = DEFAULT_WINDOW_STRIDE,
+                          mitre_fuzzy_threshold: Optional[float] = DEFAULT_FUZZY_THRESHOLD,
+                          rule_relations: bool = True, stage_workers: Optional[Dict[str, int]] = None,
+                          queue_size: int = DEFAULT_STAGE_QUEUE_SIZE) -> List[Stage]:
+    """
+    The steps of process_document plus persistence as executor stages. Items
+    are dicts with the document's checkpoint key and doc; each stage adds its
+    output (entities, then relationships). persist(key, entities, relationships)
+    is the pipeline's persist step, which also checkpoints the document.
+    """
+    workers = {**DEFAULT_STAGE_WORKERS, **(stage_workers or {})}
+
+    def ner(items):
+        texts = [item["doc"].get("text", "") for item in items]
+        with timed_stage('ner', *(source_label(item["doc"]) for item in items)):
+            try:
+                block_entities = perform_hybrid_ner_batch(texts, batch_size=len(texts), window_tokens=ner_window,
+                                                          stride=stride)
+            except Exception as e:
+                logger.error(f"Batched NER failed, falling back to per-document NER: {e}")
+                block_entities = [perform_hybrid_ner(text) if text.strip() else [] for text in texts]
+        for item, entities in zip(items, block_entities):
+            source = source_label(item["doc"])
+            if not item["doc"].get("text", "").strip():
+                logger.warning(f"Empty text found in record_id: {item['doc'].get('record_id')}")
+                metrics.inc('documents_empty', source=source)
+            item["entities"] = entities
+            metrics.inc('entities', len(entities), source=source)
+        return items
+
+    def enrich(item):
+        with timed_stage('enrich', source_label(item["doc"])):
+            item["entities"] = enrich_entities_with_mitre_stix(item["entities"], fuzzy_threshold=mitre_fuzzy_threshold)
+        return item
+
+    def relations(item):
+        text = item["doc"].get("text", "")
+        source = source_label(item["doc"])
+        relationships = []
+        if item["entities"]:
+            with timed_stage('relations', source):
+                relationships, needs_llm = rule_tier(text, item["entities"], rule_relations, source)
+                if needs_llm:
+                    relationships = merge_relationships(
+                        relationships, extract_relationships_llm(text, item["entities"], groq_key=GROQ_API_KEY))
+        item["relationships"] = relationships
+        metrics.inc('relationships', len(relationships), source=source)
+        return item
+
+    def store(item):
+        persist(item["key"], item["entities"], item["relationships"])
+        return item
+
+    return [Stage('ner', ner, workers['ner'], queue_size, batch_size=ner_batch_size),
+            Stage('enrich', enrich, workers['enrich'], queue_size),
+            Stage('relations', relations, workers['relations'], queue_size),
+            Stage('persist', store, workers['persist'], queue_size)]
+
+def parse_stage_workers(spec: str) -> Dict[str, int]:
+    """'relations=8,persist=2' -> {'relations': 8, 'persist': 2}"""
+    workers = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        stage, _, count = part.partition("=")
+        if stage not in STAGES or not count.isdigit() or int(count) < 1:
+            raise ValueError(f"Invalid stage worker setting '{part}' (stages: {', '.join(STAGES)})")
+        workers[stage] = int(count)
+    return workers
 
-def run_pipeline(chunked_json_path: str, neo4j_uri: str, neo4j_user: str, neo4j_password: str, dry_run: bool = False):
+def _init_worker(groq_key: Optional[str], cache_config: dict, llm_client_config: Optional[LLMClientConfig]):
+    """Process pool initializer: every worker loads and warms its own NER model once."""
+    global GROQ_API_KEY
+    GROQ_API_KEY = groq_key
+    configure_relation_cache(**cache_config)
+    if llm_client_config is not None:
+        configure_llm_clients(llm_client_config)
+    ner_registry.warm_up()
+
+def _process_block_in_worker(block: List[dict], *args) -> Tuple[int, float, list, dict]:
+    """
+    Runs process_block in a pool worker; returns (pid, busy seconds, results,
+    the worker's metrics drained since its previous block) for the parent to merge.
+    """
+    start = time.time()
+    results = process_block(block, *args)
+    return os.getpid(), time.time() - start, results, metrics.drain()
+
+def run_pipeline(chunked_json_path: str, neo4j_uri: str, neo4j_user: str, neo4j_password: str, dry_run: bool = False,
+                 ner_batch_size: int = DEFAULT_NER_BATCH_SIZE, granularity: str = "record",
+                 window_tokens: int = DEFAULT_WINDOW_TOKENS, window_stride: int = DEFAULT_WINDOW_STRIDE,
+                 mitre_fuzzy_threshold: Optional[float] = DEFAULT_FUZZY_THRESHOLD,
+                 write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE, write_behind: bool = False,
+                 write_queue_size: int = DEFAULT_QUEUE_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 per_run_database: bool = False, pool_size: int = DEFAULT_POOL_SIZE,
+                 acquisition_timeout: float = DEFAULT_ACQUISITION_TIMEOUT,
+                 connection_lifetime: float = DEFAULT_CONNECTION_LIFETIME, workers: int = 1,
+                 llm_concurrency: int = 0, llm_rpm: float = DEFAULT_RPM, llm_tpm: float = DEFAULT_TPM,
+                 llm_cache: bool = True, llm_cache_path: str = DEFAULT_LLM_CACHE_PATH,
+                 llm_cache_max_entries: int = DEFAULT_MAX_ENTRIES,
+                 llm_cache_max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                 llm_client_config: Optional[LLMClientConfig] = None, pack_token_budget: Optional[int] = None,
+                 rule_relations: bool = True, checkpoint_fsync: str = DEFAULT_FSYNC_POLICY, delta: bool = True,
+                 limit: Optional[int] = None, sample: Optional[int] = None, sample_seed: Optional[int] = None,
+                 staged: bool = False, stage_workers: Optional[Dict[str, int]] = None,
+                 stage_queue_size: int = DEFAULT_STAGE_QUEUE_SIZE, metrics_port: Optional[int] = None,
+                 metrics_json: Optional[str] = None, metrics_host: str = DEFAULT_METRICS_HOST):
     """
     Full pipeline execution:
-    - Load chunked JSON
-    - Process each document
-    - Persist results to Neo4j (or dry-run)
+    - Load chunked JSON, either as reconstructed records or as individual chunks
+    - Run NER over blocks of ner_batch_size documents at once
+      (records are split into overlapping token windows so nothing is truncated)
+    - Process each document; with workers > 1 blocks are fanned out to a
+      process pool (one warmed NER model per worker) and results come back
+      to this process, the single writer
+    - With llm_concurrency > 0, relation extraction runs on a background async
+      engine (rate limited, Retry-After aware) while NER continues on later blocks
+    - LLM answers are cached on disk by (model, prompt version, text, entities);
+      llm_cache=False bypasses the cache
+    - A rule tier relates entities first; only documents with entity pairs it
+      cannot explain go to the LLM (rule_relations=False sends every document)
+    - With pack_token_budget (and no async engine), small documents of a block
+      are packed into shared LLM requests
+    - Progress is journaled per document (status and content hash) to
+      CHECKPOINT_JOURNAL (one journal per database) under its content-derived
+      record key. In delta mode
+      (the default) only new or modified documents go through NER, the LLM
+      and Neo4j; delta=False reprocesses everything
+    - sample/limit narrow the documents still to process (a seeded random
+      sample, then the first N) for trial runs
+    - With staged=True, NER, enrichment, relation extraction and persistence
+      run as a pipeline of thread stages, each with its own worker count
+      (stage_workers) and bounded queue, and the run reports per-stage
+      utilization, queue depth and latency histograms (replaces workers,
+      llm_concurrency and packing)
+    - A live moving-average ETA (docs/sec, seconds per document per stage,
+      projected finish) is computed from the main loop and logged periodically
+    - Counters, gauges and per-stage latency histograms (by stage and source)
+      go to the metrics registry: served as Prometheus text on
+      metrics_host:metrics_port during the run and/or written as a JSON summary to metrics_json at the end
+    - Persist results to Neo4j (or dry-run), optionally through a background
+      write-behind queue so extraction overlaps with database writes; with
+      per_run_database everything goes to a dated database created on demand
+      (otherwise to the server's default database)
     """
     logger.info(f"Loading documents from {chunked_json_path}")
-    documents = ingest_data(chunked_json_path)
-    
-    import random
-    documents = random.sample(documents, min(3, len(documents)))  
+    documents = ingest_data(chunked_json_path, granularity=granularity)
+    # Chunks already fit the model; only reconstructed records need windowing
+    ner_window = window_tokens if granularity == "record" else None
 
     total_docs = len(documents)
     logger.info(f"{total_docs} documents loaded.")
@@ -129,52 +465,332 @@ def run_pipeline(chunked_json_path: str, neo4j_uri: str, neo4j_user: str, neo4j_
         logger.warning("No documents found to process. Exiting pipeline.")
         return
 
-    processed_ids = load_checkpoint()
+    metrics_server = start_metrics_server(metrics, metrics_port, metrics_host) if metrics_port is not None else None
+
+    if staged and (workers > 1 or llm_concurrency > 0 or pack_token_budget):
+        logger.warning("--staged runs every stage in this process; --workers, --llm-concurrency and --pack-llm "
+                       "are ignored (size the stages with --stage-workers instead)")
+        workers, llm_concurrency, pack_token_budget = 1, 0, None
+
+    # Load the NER model once for the whole run instead of once per document
+    # (pool workers load their own, so the parent skips it)
+    if workers <= 1:
+        ner_registry.warm_up()
 
     # Generate a run_id once here, pass to Neo4jPersistor
     run_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    db_name = f"threat_data_{datetime.datetime.now().strftime('%Y%m%d')}"
-    db = Neo4jPersistor(uri=neo4j_uri, user=neo4j_user, password=neo4j_password, run_id=run_id, db_name=db_name)
+    db_name = f"threat-data-{datetime.datetime.now().strftime('%Y%m%d')}" if per_run_database else None
+    db = Neo4jPersistor(uri=neo4j_uri, user=neo4j_user, password=neo4j_password, run_id=run_id, db_name=db_name,
+                        create_database=per_run_database, max_connection_pool_size=pool_size,
+                        connection_acquisition_timeout=acquisition_timeout,
+                        max_connection_lifetime=connection_lifetime)
+    # db.database, not db_name: servers without multi-database support fall back to the default
+    journal = load_checkpoint(checkpoint_fsync, db.database)
 
-    try:
-        # Estimate total time by timing a sample first (optional)
-        sample_size = min(3, total_docs)
-        if sample_size > 0:
-            logger.info(f"Estimating total time by processing sample of {sample_size} documents...")
-            start_sample = time.time()
-            for i in range(sample_size):
-                process_document(documents[i])
-            end_sample = time.time()
-            avg_per_doc = (end_sample - start_sample) / sample_size
-            estimated_total = avg_per_doc * total_docs
-            logger.info(f"Estimated total processing time: {estimated_total:.2f} seconds (~{estimated_total/60:.2f} minutes)")
+    writer = None
+    if write_behind and not dry_run:
+        writer = db.start_write_behind(max_queue=write_queue_size, flush_size=write_batch_size,
+                                       flush_interval=flush_interval)
+
+    cache_config = dict(enabled=llm_cache, path=llm_cache_path, max_entries=llm_cache_max_entries,
+                        max_age_days=llm_cache_max_age_days)
+    configure_relation_cache(**cache_config)
+    if llm_client_config is not None:
+        configure_llm_clients(llm_client_config)
 
+    engine = None
+    if llm_concurrency > 0 and GROQ_API_KEY:
+        engine = create_groq_engine(GROQ_API_KEY, requests_per_minute=llm_rpm, tokens_per_minute=llm_tpm,
+                                    max_concurrency=llm_concurrency, use_cache=llm_cache)
+    # (key, entities, future) for documents whose relations are still being extracted
+    llm_pending: deque = deque()
+    max_llm_pending = 4 * max(llm_concurrency, 1)
+
+    # checkpoint key -> content hash of the text it was processed with, and its source label
+    digests: dict = {}
+    sources: Dict[str, str] = {}
+
+    def mark_processed(key, written: bool = True):
+        # With write-behind this runs on the writer thread once the document's rows are in Neo4j
+        metrics.inc('documents_checkpointed', status='done' if written else 'failed', source=sources.get(key))
+        if not written:
+            logger.error(f"Neo4j write failed for document {key}; it will be retried on the next run")
+            journal.mark_failed(key, digests.get(key))
+            return
+        journal.mark_done(key, digests.get(key))
+
+    try:
         # Process full dataset with progress bar and checkpointing
-        for i, doc in enumerate(tqdm(documents, desc="Processing documents")):
-            record_id = doc.get("record_id")
-            if record_id is None:
-                logger.warning("Skipping document without a record_id")
+        pending = []
+        unchanged = 0
+        for doc in documents:
+            if doc.get("record_id") is None and not doc.get("record_key"):
+                logger.warning("Skipping document without a record_key or record_id")
                 continue
-            if record_id in processed_ids:
-                logger.info(f"Skipping already processed record_id {record_id}")
+            key = checkpoint_key(doc)
+            digests[key] = content_hash(doc.get("text", ""))
+            sources[key] = source_label(doc)
+            # Record keys already change with the text; the stored hash also catches edits under record_id keys
+            if delta and journal.is_done(key, digests[key]):
+                logger.debug(f"Skipping already processed document {key}")
+                unchanged += 1
                 continue
+            pending.append(doc)
+        if delta:
+            logger.info(f"Delta: {unchanged} unchanged documents skipped, {len(pending)} new or modified to process")
+        else:
+            logger.info(f"Full run: processing all {len(pending)} documents, ignoring {len(journal)} journaled")
+        if sample is not None or limit is not None:
+            selected = select_documents(pending, limit=limit, sample=sample, seed=sample_seed)
+            logger.info(f"Processing {len(selected)} of {len(pending)} documents (sample={sample}, limit={limit})")
+            pending = selected
+
+        # Sequential runs with write-behind hand relationships to the writer as the LLM streams them
+        streaming = writer is not None and engine is None and not pack_token_budget and workers <= 1 and not staged
+        stream_failed: Set[str] = set()
+
+        def stream_sink(key):
+            def on_written(written):
+                if not written:
+                    stream_failed.add(key)
+
+            def on_extracted(entities, relationships):
+                writer.submit(entities, relationships, on_written=on_written)
+            return on_extracted
+
+        def mark_streamed(key, written: bool = True):
+            # Runs after every earlier submit for this document (the writer is FIFO)
+            mark_processed(key, written and key not in stream_failed)
+            stream_failed.discard(key)
+
+        def persist(key, entities, relationships):
+            if streaming:
+                # Rows were already submitted; only the checkpoint callback is left
+                writer.submit([], [], on_written=functools.partial(mark_streamed, key))
+                return
             try:
-                entities, relationships = process_document(doc)
-                ingest_to_neo4j(entities, relationships, db, dry_run=dry_run)
-                processed_ids.add(record_id)
-                save_checkpoint(processed_ids)
+                with timed_stage('persist', sources[key]):
+                    if writer is not None:
+                        writer.submit(entities, relationships, on_written=functools.partial(mark_processed, key))
+                    else:
+                        written = ingest_to_neo4j(entities, relationships, db, dry_run=dry_run,
+                                                  batch_size=write_batch_size)
+                        mark_processed(key, written)
             except Exception as e:
-                logger.error(f"Processing failed for record_id {record_id}: {e}")
+                logger.error(f"Persisting document {key} failed: {e}")
+
+        def drain_llm(wait_all: bool = False):
+            # Oldest first; blocks only when too many documents are waiting on the LLM
+            while llm_pending and (wait_all or llm_pending[0][3].done() or len(llm_pending) > max_llm_pending):
+                key, entities, rule_relationships, future = llm_pending.popleft()
+                try:
+                    with timed_stage('relations', sources[key]):
+                        relationships = merge_relationships(rule_relationships, future.result())
+                except Exception as e:
+                    logger.error(f"Relation extraction failed for document {key}: {e}")
+                    continue
+                metrics.inc('relationships', len(relationships), source=sources[key])
+                persist(key, entities, relationships)
+
+        def handle_results(block, results):
+            if engine is None:
+                for key, entities, relationships in results:
+                    persist(key, entities, relationships)
+                return
+            texts = {checkpoint_key(doc): doc.get("text", "") for doc in block}
+            for key, entities, _ in results:
+                with timed_stage('relations', sources[key]):
+                    relationships, needs_llm = rule_tier(texts[key], entities, rule_relations, sources[key])
+                if needs_llm:
+                    llm_pending.append((key, entities, relationships, engine.submit(texts[key], entities)))
+                else:
+                    metrics.inc('relationships', len(relationships), source=sources[key])
+                    persist(key, entities, relationships)
+            drain_llm()
+
+        blocks = [pending[i:i + ner_batch_size] for i in range(0, len(pending), ner_batch_size)]
+        if engine is not None and pack_token_budget:
+            logger.warning("Prompt packing is not used with --llm-concurrency; documents are sent individually")
+        block_args = (ner_batch_size, ner_window, window_stride, mitre_fuzzy_threshold, engine is None,
+                      pack_token_budget, rule_relations)
+        run_start = time.time()
+        estimator = ProgressEstimator(len(pending))
+        metrics.set('documents_remaining', len(pending))
+
+        def advance(docs: int):
+            progress.update(docs)
+            estimator.update(docs, stage_seconds())
+            progress.set_postfix_str(estimator.postfix())
+            metrics.set('documents_remaining', len(pending) - estimator.done)
+            metrics.set('docs_per_second', round(estimator.rate, 3))
+            metrics.set('eta_seconds', round(estimator.eta_seconds or 0.0, 1))
+
+        with tqdm(total=len(pending), desc="Processing documents") as progress:
+            if staged:
+                progress_lock = threading.Lock()
+
+                def finished(item):
+                    # Failed and dropped documents count too, so progress and the ETA reach the total
+                    with progress_lock:
+                        advance(1)
+
+                executor = StageExecutor(
+                    build_document_stages(persist, ner_batch_size, ner_window, window_stride, mitre_fuzzy_threshold,
+                                          rule_relations, stage_workers, stage_queue_size),
+                    on_complete=finished, on_drop=finished, registry=metrics)
+                try:
+                    for doc in pending:
+                        executor.submit({"key": checkpoint_key(doc), "doc": doc})
+                finally:
+                    executor.close()
+                for line in executor.report():
+                    logger.info(line)
+            elif workers <= 1:
+                for block in blocks:
+                    handle_results(block, process_block(block, *block_args,
+                                                        stream_sink=stream_sink if streaming else None))
+                    advance(len(block))
+            else:
+                per_worker: Dict[int, Dict[str, float]] = {}
+                # spawn: forking a parent that has touched torch/tokenizers threads is unsafe
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=_init_worker, initargs=(GROQ_API_KEY, cache_config, llm_client_config)) as pool:
+                    queued = iter(blocks)
+                    in_flight = {}
+                    # Keep at most two blocks per worker outstanding so results never pile up in memory
+                    for block in queued:
+                        in_flight[pool.submit(_process_block_in_worker, block, *block_args)] = block
+                        if len(in_flight) >= 2 * workers:
+                            break
+                    while in_flight:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            block = in_flight.pop(future)
+                            try:
+                                pid, busy, results, worker_metrics = future.result()
+                            except Exception as e:
+                                logger.error(f"Worker failed on a block of {len(block)} documents: {e}")
+                            else:
+                                metrics.merge(worker_metrics)
+                                stats = per_worker.setdefault(pid, {"docs": 0, "busy": 0.0})
+                                stats["docs"] += len(block)
+                                stats["busy"] += busy
+                                handle_results(block, results)
+                            advance(len(block))
+                            next_block = next(queued, None)
+                            if next_block is not None:
+                                in_flight[pool.submit(_process_block_in_worker, next_block, *block_args)] = next_block
+                for pid, stats in sorted(per_worker.items()):
+                    logger.info(f"Worker {pid}: {stats['docs']} docs in {stats['busy']:.2f}s busy "
+                                f"({stats['docs'] / max(stats['busy'], 1e-9):.2f} docs/sec)")
+            drain_llm(wait_all=True)
+        wall = time.time() - run_start
+        logger.info(f"Processed {len(pending)} documents in {wall:.2f}s "
+                    f"({len(pending) / max(wall, 1e-9):.2f} docs/sec, workers={workers})")
+        for stage in STAGES:
+            histogram = metrics.histogram('stage_seconds', stage=stage)
+            if histogram.count:
+                p50, p95, p99 = (histogram.quantile(q) for q in (0.5, 0.95, 0.99))
+                logger.info(f"Stage {stage}: {histogram.count} observations, {histogram.sum:.2f}s total, "
+                            f"p50 {p50:.3f}s / p95 {p95:.3f}s / p99 {p99:.3f}s per document")
 
     finally:
+        if engine is not None:
+            engine.close()
+            logger.info(f"LLM relation extraction stats: {engine.stats()}")
+        elif get_relation_cache() is not None:
+            # Pool workers keep their own counters; entries is the shared total
+            logger.info(f"LLM relation cache stats: {get_relation_cache().stats()}")
+        # close() flushes the write-behind queue before shutting the driver down
         db.close()
         logger.info("Neo4j connection closed.")
+        logger.info(f"Neo4j retry stats: {db.retry_stats()}")
+        # After db.close(): the last write-behind callbacks have marked their documents
+        journal.close()
+        logger.info(f"Checkpoint journal: {journal.counts()} ({journal.stats()})")
+        if metrics_json:
+            metrics.write_json(metrics_json)
+        if metrics_server is not None:
+            metrics_server.shutdown()
 
-    logger.info(f"Metrics summary: {metrics}")
+    logger.info(f"Metrics summary: {metrics.summary()['counters']}")
+    if rule_relations:
+        settled = int(metrics.value('llm_calls_avoided'))
+        total = settled + int(metrics.value('llm_escalations'))
+        logger.info(f"Rule relation tier: {int(metrics.value('rule_relationships'))} relationships; "
+                    f"{settled}/{total} documents needed no LLM call ({settled / total if total else 0:.0%} avoided)")
+    for stats in ner_registry.stats():
+        logger.info(f"NER model {stats['model_name']}: load {stats['load_time']:.2f}s, "
+                    f"inference {stats['inference_time']:.2f}s over {stats['inference_calls']} calls")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Threat Intelligence KG Pipeline")
     parser.add_argument("--dry-run", action="store_true", help="Run pipeline without saving to DB")
+    parser.add_argument("--ner-batch-size", type=int, default=DEFAULT_NER_BATCH_SIZE, help="Documents per batched NER call")
+    parser.add_argument("--granularity", choices=["record", "chunk"], default="record",
+                        help="Process reconstructed records (windowed NER) or individual chunks")
+    parser.add_argument("--window-tokens", type=int, default=DEFAULT_WINDOW_TOKENS, help="Tokens per NER window for records")
+    parser.add_argument("--window-stride", type=int, default=DEFAULT_WINDOW_STRIDE, help="Overlapping tokens between NER windows")
+    parser.add_argument("--mitre-fuzzy-threshold", type=float, default=DEFAULT_FUZZY_THRESHOLD,
+                        help="Minimum trigram similarity for approximate MITRE matches (0 disables)")
+    parser.add_argument("--write-batch-size", type=int, default=DEFAULT_WRITE_BATCH_SIZE, help="Rows per Neo4j UNWIND transaction")
+    parser.add_argument("--write-behind", action="store_true", help="Persist to Neo4j from a background writer thread")
+    parser.add_argument("--write-queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Max entities/relationships buffered before extraction blocks")
+    parser.add_argument("--flush-interval", type=float, default=DEFAULT_FLUSH_INTERVAL,
+                        help="Seconds between write-behind flushes")
+    parser.add_argument("--per-run-database", action="store_true",
+                        help="Write to a dated database (threat-data-YYYYMMDD), created if missing, with its own "
+                             "checkpoint journal, instead of the server's default database")
+    parser.add_argument("--neo4j-pool-size", type=int, default=DEFAULT_POOL_SIZE, help="Max pooled Neo4j connections")
+    parser.add_argument("--neo4j-acquisition-timeout", type=float, default=DEFAULT_ACQUISITION_TIMEOUT,
+                        help="Seconds to wait for a free pooled connection")
+    parser.add_argument("--neo4j-connection-lifetime", type=float, default=DEFAULT_CONNECTION_LIFETIME,
+                        help="Seconds before a pooled connection is recycled")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for NER/extraction, each with its own model (1 = in-process)")
+    parser.add_argument("--llm-concurrency", type=int, default=0,
+                        help=f"Concurrent async LLM relation requests overlapping NER (0 = blocking per document; "
+                             f"{DEFAULT_LLM_CONCURRENCY} is a sensible start)")
+    parser.add_argument("--llm-rpm", type=float, default=DEFAULT_RPM, help="LLM requests per minute limit")
+    parser.add_argument("--llm-tpm", type=float, default=DEFAULT_TPM, help="LLM tokens per minute limit")
+    parser.add_argument("--pack-llm", action="store_true",
+                        help="Pack several small documents into one LLM request (per-document keyed JSON output)")
+    parser.add_argument("--pack-token-budget", type=int, default=DEFAULT_PACK_TOKEN_BUDGET,
+                        help="Max estimated prompt tokens per packed LLM request")
+    parser.add_argument("--no-rule-relations", action="store_true",
+                        help="Send every document to the LLM instead of only those the rule tier cannot settle")
+    parser.add_argument("--full", action="store_true",
+                        help="Reprocess every document instead of only new or modified ones (delta mode)")
+    parser.add_argument("--checkpoint-fsync", choices=[FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER],
+                        default=DEFAULT_FSYNC_POLICY, help="When the checkpoint journal is fsynced to disk")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="Process at most this many of the documents still to process (e.g. for a trial run)")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="Process a random sample of this many documents still to process")
+    parser.add_argument("--sample-seed", type=int, default=None, help="Seed for --sample, for repeatable samples")
+    parser.add_argument("--staged", action="store_true",
+                        help="Run NER, enrichment, relation extraction and persistence as concurrent pipeline stages")
+    parser.add_argument("--stage-workers", type=parse_stage_workers, default=None,
+                        help=f"Threads per stage with --staged, e.g. relations=8,persist=2 "
+                             f"(default: {','.join(f'{k}={v}' for k, v in DEFAULT_STAGE_WORKERS.items())})")
+    parser.add_argument("--stage-queue-size", type=int, default=DEFAULT_STAGE_QUEUE_SIZE,
+                        help="Documents buffered in front of each stage with --staged")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on this port at /metrics while the run lasts")
+    parser.add_argument("--metrics-host", default=DEFAULT_METRICS_HOST,
+                        help="Interface for --metrics-port (0.0.0.0 to allow remote scrapes)")
+    parser.add_argument("--metrics-json", default=None, help="Write a JSON metrics summary to this file at run end")
+    parser.add_argument("--no-llm-cache", action="store_true", help="Bypass the on-disk LLM relation cache")
+    parser.add_argument("--llm-cache-path", default=DEFAULT_LLM_CACHE_PATH, help="SQLite file for cached LLM relations")
+    parser.add_argument("--llm-cache-max-entries", type=int, default=DEFAULT_MAX_ENTRIES,
+                        help="Least recently used cache entries beyond this are evicted")
+    parser.add_argument("--llm-cache-max-age-days", type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help="Cached relations older than this are re-extracted")
+    parser.add_argument("--llm-max-connections", type=int, default=None,
+                        help="Pooled HTTP connections shared by all LLM clients (default: LLM_MAX_CONNECTIONS or 20)")
+    parser.add_argument("--llm-read-timeout", type=float, default=None,
+                        help="Seconds to wait for an LLM response (default: LLM_READ_TIMEOUT or 60)")
     args = parser.parse_args()
 
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -183,9 +799,33 @@ if __name__ == "__main__":
     NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
     NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "testpassword")
 
+    llm_client_config = LLMClientConfig.from_env()
+    if args.llm_max_connections is not None:
+        llm_client_config.max_connections = args.llm_max_connections
+        llm_client_config.max_keepalive_connections = min(llm_client_config.max_keepalive_connections,
+                                                          args.llm_max_connections)
+    if args.llm_read_timeout is not None:
+        llm_client_config.read_timeout = args.llm_read_timeout
+
     logger.info(f"Pipeline started at {time.strftime('%Y-%m-%d %H:%M:%S')}")
     start_time = time.time()
-    run_pipeline(CHUNKED_JSON_PATH, NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, dry_run=args.dry_run)
+    run_pipeline(CHUNKED_JSON_PATH, NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, dry_run=args.dry_run,
+                 ner_batch_size=args.ner_batch_size, granularity=args.granularity,
+                 window_tokens=args.window_tokens, window_stride=args.window_stride,
+                 mitre_fuzzy_threshold=args.mitre_fuzzy_threshold, write_batch_size=args.write_batch_size,
+                 write_behind=args.write_behind, write_queue_size=args.write_queue_size,
+                 flush_interval=args.flush_interval, per_run_database=args.per_run_database,
+                 pool_size=args.neo4j_pool_size, acquisition_timeout=args.neo4j_acquisition_timeout,
+                 connection_lifetime=args.neo4j_connection_lifetime, workers=args.workers,
+                 llm_concurrency=args.llm_concurrency, llm_rpm=args.llm_rpm, llm_tpm=args.llm_tpm,
+                 llm_cache=not args.no_llm_cache, llm_cache_path=args.llm_cache_path,
+                 llm_cache_max_entries=args.llm_cache_max_entries,
+                 llm_cache_max_age_days=args.llm_cache_max_age_days, llm_client_config=llm_client_config,
+                 pack_token_budget=args.pack_token_budget if args.pack_llm else None,
+                 rule_relations=not args.no_rule_relations, checkpoint_fsync=args.checkpoint_fsync,
+                 delta=not args.full, limit=args.limit, sample=args.sample, sample_seed=args.sample_seed,
+                 staged=args.staged, stage_workers=args.stage_workers, stage_queue_size=args.stage_queue_size,
+                 metrics_port=args.metrics_port, metrics_json=args.metrics_json, metrics_host=args.metrics_host)
     end_time = time.time()
 
     elapsed = end_time - start_time